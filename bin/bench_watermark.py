@@ -0,0 +1,88 @@
+# ==================================================
+# bench_watermark.py - Compare single-process and segment-parallel watermarking
+# ==================================================
+#
+# Description:
+# Watermarks the same video once with the single-process path and once with
+# the segment-parallel path, then prints the wall-clock time of each run.
+# Outputs are written to a scratch directory and removed afterwards.
+#
+# --------------------------------------------------
+# USAGE:
+#   python bench_watermark.py <video_file_path> [workers]
+#
+# DEPENDENCIES:
+#   - teton_lib.py
+#   - add_watermark.py
+# ==================================================
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# === Path Setup ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(current_dir, "../lib")
+sys.path.append(lib_path)
+
+# === Imports ===
+from teton_lib import initialize_logging, load_app_config
+from add_watermark import add_watermark
+
+logger = initialize_logging()
+
+
+def run_once(params: dict, label: str) -> float:
+    """Runs one watermark pass and returns its wall-clock duration in seconds."""
+    start = time.perf_counter()
+    result = add_watermark(params)
+    elapsed = time.perf_counter() - start
+    if not result:
+        raise RuntimeError(f"{label} run failed")
+    logger.info(f"⏱ {label}: {elapsed:.2f}s -> {result['to_process']}")
+    return elapsed
+
+
+def main():
+    if len(sys.argv) < 2:
+        logger.error("Usage: python bench_watermark.py <video_file_path> [workers]")
+        sys.exit(1)
+
+    input_video_path = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    watermark_config = load_app_config().get("watermark_config", {})
+
+    scratch_dir = tempfile.mkdtemp(prefix="bench_watermark_")
+    try:
+        base_params = {
+            "input_video_path": input_video_path,
+            "username": "Benchmark",
+            "video_date": "20250101",
+            **watermark_config,
+        }
+
+        single_dir = os.path.join(scratch_dir, "single")
+        parallel_dir = os.path.join(scratch_dir, "parallel")
+        os.makedirs(single_dir)
+        os.makedirs(parallel_dir)
+
+        single = run_once(
+            {**base_params, "download_path": single_dir, "parallel": False}, "single-process"
+        )
+        parallel = run_once(
+            {**base_params, "download_path": parallel_dir, "parallel": True, "parallel_workers": workers},
+            f"parallel x{workers}",
+        )
+
+        print(f"engine:          {base_params.get('engine', 'moviepy')}")
+        print(f"single-process:  {single:.2f}s")
+        print(f"parallel x{workers}:".ljust(17) + f"{parallel:.2f}s")
+        print(f"speedup:         {single / parallel:.2f}x")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
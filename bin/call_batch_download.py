@@ -0,0 +1,221 @@
+# ==================================================
+# call_batch_download.py - Downloads a backlog of URLs concurrently
+# ==================================================
+#
+# Description:
+# Reads URLs from a file (or stdin) and runs each one through the same
+# download + metadata chain as call_download.py, on a thread pool.
+#
+# Concurrency is bounded twice: batch_download.workers caps the total number
+# of URLs in flight, and batch_download.per_host_limits caps how many of them
+# may hit one site at a time (e.g. facebook.com vs youtube.com). URLs wait in
+# one queue per host; the main thread hands a URL to the pool only when its
+# host has a free slot, taking hosts round-robin, so every worker is always
+# downloading and a long run of links to one site never parks the pool.
+#
+# Each worker thread keeps one YoutubeDL instance alive for all the URLs it
+# handles, so extractor setup, cookies and HTTP connections are reused.
+#
+# Share links are resolved up front on a bounded pool over one pooled HTTP
+# session; the results land in the persistent resolver cache that
+# call_download.process_url() reads, so each link is resolved once.
+#
+# --------------------------------------------------
+# USAGE:
+#   python call_batch_download.py <urls_file>
+#   cat urls.txt | python call_batch_download.py -
+#
+# Blank lines and lines starting with '#' are ignored; duplicates are dropped.
+#
+# DEPENDENCIES:
+#   - call_download.py
+#   - teton_lib.py
+#
+# TASK NAME:
+#   perform_download
+# ==================================================
+
+import os
+import sys
+import threading
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+# === Path Setup ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(current_dir, "../lib")
+sys.path.append(lib_path)
+sys.path.append(current_dir)
+
+# === Imports ===
+import teton_lib as tu
+from call_download import platform_config, prepare_download_path, process_url
+from url_resolver import resolve_share_urls
+
+# === Init Logging and Config ===
+logger = tu.initialize_logging()
+batch_config = tu.load_app_config().get("batch_download", {})
+
+# Hostnames that belong to the same site for per-host limiting.
+HOST_ALIASES = {
+    "youtu.be": "youtube.com",
+    "fb.watch": "facebook.com",
+}
+
+_thread_state = threading.local()
+_open_downloaders = []
+_open_downloaders_lock = threading.Lock()
+
+
+def host_key(url):
+    """Maps a URL to the site it is limited under (e.g. 'm.facebook.com' -> 'facebook.com')."""
+    host = (urlparse(url).hostname or "").lower()
+    host = HOST_ALIASES.get(host, host)
+    for site in batch_config.get("per_host_limits", {}):
+        if host == site or host.endswith("." + site):
+            return site
+    return host[4:] if host.startswith("www.") else host
+
+
+def read_urls(source):
+    """Reads URLs from a file path or '-' for stdin, skipping blanks, comments and duplicates."""
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        lines = [line.strip() for line in stream]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return list(OrderedDict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def drop_duplicate_videos(urls, resolved):
+    """Keeps the first of several links that resolve to the same URL."""
+    seen = set()
+    unique = []
+    for url in urls:
+        if resolved[url] not in seen:
+            seen.add(resolved[url])
+            unique.append(url)
+    return unique
+
+
+def queue_by_host(urls):
+    """Groups URLs into one queue per host, keeping each host's own order."""
+    queues = OrderedDict()
+    for url in urls:
+        queues.setdefault(host_key(url), deque()).append(url)
+    return queues
+
+
+def next_ready_url(queues, active, limits):
+    """
+    Pops the next URL whose host is below its limit, or None if none is.
+
+    The host it came from is moved to the back of the queue order so hosts
+    take turns.
+    """
+    for host in list(queues):
+        if active.get(host, 0) < limits[host]:
+            url = queues[host].popleft()
+            queues.move_to_end(host)
+            if not queues[host]:
+                del queues[host]
+            return url
+    return None
+
+
+def get_thread_downloader(download_path):
+    """Returns this worker thread's YoutubeDL, creating it on first use."""
+    ydl = getattr(_thread_state, "ydl", None)
+    if ydl is None:
+        cookie_path = tu.resolve_path(platform_config.get("cookie_path"))
+        ydl = tu.make_youtube_dl({"cookie_path": cookie_path, "download_path": download_path})
+        _thread_state.ydl = ydl
+        with _open_downloaders_lock:
+            _open_downloaders.append(ydl)
+    return ydl
+
+
+def download_one(url, download_path):
+    """Worker: downloads one URL with the thread's YoutubeDL (its host slot is already taken)."""
+    return process_url(url, download_path, get_thread_downloader(download_path))
+
+
+def run_batch(urls, download_path):
+    """Downloads every URL and returns the number of failures."""
+    workers = int(batch_config.get("workers") or 4)
+    default_limit = int(batch_config.get("default_host_limit") or 2)
+    per_host = batch_config.get("per_host_limits", {})
+
+    queues = queue_by_host(urls)
+    limits = {host: max(1, int(per_host.get(host, default_limit))) for host in queues}
+    workers = min(workers, len(urls))
+    logger.info(f"📥 Downloading {len(urls)} URLs with {workers} workers, per-host limits {limits}")
+
+    failures = 0
+    active = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queues or running:
+            # Fill free workers with URLs whose host has a free slot.
+            while len(running) < workers:
+                url = next_ready_url(queues, active, limits)
+                if url is None:
+                    break
+                host = host_key(url)
+                active[host] = active.get(host, 0) + 1
+                running[pool.submit(download_one, url, download_path)] = url
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = running.pop(future)
+                active[host_key(url)] -= 1
+                try:
+                    params = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Download crashed for {url}: {e}")
+                    logger.debug(traceback.format_exc())
+                    params = None
+
+                if params and params.get("original_filename"):
+                    print(params["original_filename"])
+                else:
+                    logger.error(f"Download failed for: {url}")
+                    failures += 1
+
+    for ydl in _open_downloaders:
+        ydl.close()
+
+    logger.info(f"🏁 Batch finished: {len(urls) - failures} ok, {failures} failed")
+    return failures
+
+
+def main():
+    if len(sys.argv) < 2:
+        logger.error("Usage: python call_batch_download.py <urls_file | ->")
+        sys.exit(1)
+
+    try:
+        urls = read_urls(sys.argv[1])
+        if not urls:
+            logger.error("No URLs to download.")
+            sys.exit(1)
+
+        download_path = prepare_download_path()
+        # Warm the resolver cache; process_url() then resolves each link without a request.
+        urls = drop_duplicate_videos(urls, resolve_share_urls(urls))
+        sys.exit(1 if run_batch(urls, download_path) else 0)
+
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"❌ Unhandled error in main(): {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
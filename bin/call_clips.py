@@ -1,16 +1,111 @@
 # ==================================================
 # Minimal Clip Extraction Utility (no captions, no transcription)
 # ==================================================
+#
+# USAGE:
+#   python call_clips.py <video_file_path> <clips_file> [--mode reencode|copy|smart|fanout]
+#                        [--workers N] [--max-encoders N]
+#
+# Clips are rendered longest-first on a process pool (app_config clips.workers,
+# default half the CPU count); clips.max_encoders caps concurrent encodes.
+#
+# With clips.incremental (default), output goes to clips_output/<video_name>/
+# with a clips_manifest.json of per-clip spec hashes: reruns render only new
+# or changed clips, reuse the rest and delete clips no longer in the YAML.
+# The manifest is saved as each clip finishes, so an interrupted run only
+# re-renders the clips it had not finished. Pass --full for a fresh timestamped directory and a complete render.
+# Entries of a multi-entry clip name are named <name>_<id> (their 'id' field,
+# else a hash of start/end/text), so editing one entry never renames another.
+#
+# If the source was downloaded partially (metadata 'partial_ranges'), clip
+# times in the YAML are source times and are mapped onto the partial file.
+#
+# Cut modes (default: app_config clips.cut_mode, else "reencode"):
+#   reencode - re-encode every clip with libx264/aac (frame-exact, slowest)
+#   copy     - stream-copy from the keyframe at/before each start (lossless, fastest,
+#              clips may start slightly early)
+#   smart    - frame-exact: stream-copy when both boundaries fall on keyframes,
+#              otherwise re-encode only the partial GOP at each edge (matching
+#              the source profile/level/pix_fmt) and stream-copy the middle;
+#              H.264/HEVC only, other codecs are fully re-encoded
+#   fanout   - frame-exact re-encode that decodes the source once in a single
+#              forward pass and feeds each frame to every clip covering it;
+#              best for overlapping/adjacent clips
+# ==================================================
 
 import os
 import sys
+import bisect
 import logging
 import json
 import datetime
+import hashlib
+import tempfile
+import time
+import multiprocessing
 import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from moviepy.editor import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
 from typing import Dict
 
+# === Path Setup ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(current_dir, "../lib")
+sys.path.append(lib_path)
+
+from media_lib import concat_segments, probe_duration, probe_video_stream, run_ffmpeg
+from keyframe_index import keyframe_at_or_before, keyframe_times
+from chunking import map_to_partial_time
+from tasks_lib import find_video_json
+
+CUT_MODES = ("reencode", "copy", "smart", "fanout")
+
+# A boundary closer than this to a keyframe counts as keyframe-aligned (seconds).
+KEYFRAME_TOLERANCE = 0.05
+
+# Encoder settings per cut mode; part of each clip's manifest hash.
+ENCODER_SETTINGS = {
+    "reencode": {"video_codec": "libx264", "audio_codec": "aac"},
+    "copy": {"video_codec": "copy", "audio_codec": "copy"},
+    "smart": {"video_codec": "copy+matched source-codec edges", "audio_codec": "aac"},
+    "fanout": {"video_codec": "libx264", "audio_codec": "aac"},
+}
+
+# Per-source manifest of rendered clips, kept in the clip output directory.
+MANIFEST_NAME = "clips_manifest.json"
+
+# Codecs whose smart-cut edges can be encoded to match the copied middle:
+# the encoder, ffprobe profile -> encoder profile, and the bitstream filter
+# that puts the copied GOPs' parameter sets (SPS/PPS/VPS) in-band. Parts are
+# joined as MPEG-TS so every part carries its own parameter sets. Other
+# codecs (VP8/VP9/AV1) fall back to re-encoding the whole clip.
+EDGE_ENCODERS = {
+    "h264": {
+        "encoder": "libx264",
+        "bsf": "h264_mp4toannexb",
+        "profiles": {
+            "Constrained Baseline": "baseline",
+            "Baseline": "baseline",
+            "Main": "main",
+            "High": "high",
+            "High 10": "high10",
+            "High 4:2:2": "high422",
+            "High 4:4:4 Predictive": "high444",
+        },
+    },
+    "hevc": {
+        "encoder": "libx265",
+        "bsf": "hevc_mp4toannexb",
+        "profiles": {"Main": "main", "Main 10": "main10", "Main Still Picture": "mainstillpicture"},
+    },
+}
+
+# Stream fields an encoded edge must share with the source to be joined by stream copy.
+EDGE_MATCH_FIELDS = ("codec_name", "profile", "level", "pix_fmt", "width", "height")
+
 
 def initialize_logging():
     log_dir = "./logs"
@@ -44,6 +139,43 @@ def load_clips_from_file(file_path: str) -> Dict:
         return yaml.safe_load(file) if file_path.endswith(('.yaml', '.yml')) else json.load(file)
 
 
+def load_partial_ranges(input_video: str) -> list:
+    """
+    Returns the 'partial_ranges' recorded for a partially downloaded video.
+
+    Looks in the metadata JSON written next to the video by the downloader,
+    then in ./metadata (by name, then through the metadata index for videos
+    that were moved or renamed). Returns an empty list for complete downloads.
+    """
+    json_name = os.path.splitext(os.path.basename(input_video))[0] + ".json"
+    for json_path in (os.path.splitext(input_video)[0] + ".json", os.path.join("metadata", json_name)):
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, "r") as f:
+                    return json.load(f).get("partial_ranges") or []
+            except (OSError, json.JSONDecodeError):
+                continue
+    _, data = find_video_json(input_video)
+    return (data or {}).get("partial_ranges") or []
+
+
+def map_clips_to_partial(clips: Dict, partial_ranges: list, logger) -> Dict:
+    """
+    Rewrites clip times from source time to partial-file time.
+
+    Clips outside every downloaded range are dropped with a warning.
+    """
+    mapped = {}
+    for clip_name, clip_list in clips.items():
+        for clip in clip_list:
+            interval = map_to_partial_time(clip["start"], clip["end"], partial_ranges)
+            if interval is None:
+                logger.warning(f"⚠️ Clip {clip_name} ({clip['start']}-{clip['end']} sec) was not downloaded, skipping")
+                continue
+            mapped.setdefault(clip_name, []).append({**clip, "start": interval[0], "end": interval[1]})
+    return mapped
+
+
 def create_output_directory(base_dir="clips"):
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     input_video_name = os.path.splitext(os.path.basename(sys.argv[1]))[0]
@@ -52,31 +184,510 @@ def create_output_directory(base_dir="clips"):
     return output_dir
 
 
-def process_clips_basic(clips: Dict, logger, input_video: str, output_dir: str):
+def cut_clip_copy(input_video: str, start: float, end: float, output_file: str, keyframes: list) -> float:
+    """
+    Stream-copies a clip starting at the keyframe at or before `start`.
+
+    Returns:
+        float: The actual start time of the clip in the source.
+    """
+    actual_start = keyframe_at_or_before(keyframes, start + KEYFRAME_TOLERANCE)
+    run_ffmpeg([
+        "-y",
+        "-ss", f"{actual_start:.6f}",
+        "-i", input_video,
+        "-t", f"{end - actual_start:.6f}",
+        "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        output_file,
+    ])
+    return actual_start
+
+
+def cut_clip_smart(input_video: str, start: float, end: float, output_file: str, keyframes: list, logger) -> str:
+    """
+    Cuts a frame-exact clip while re-encoding as little as possible.
+
+    If both boundaries are keyframe-aligned the whole clip is stream-copied.
+    Otherwise only [start, first keyframe) and [last keyframe, end) are
+    re-encoded with the source codec, profile, level, pixel format and colour
+    tags (edge_encoder_args); the GOPs in between are stream-copied with their
+    parameter sets made in-band, and all parts are concatenated as MPEG-TS,
+    with the audio for the clip range muxed in. If the source format cannot
+    be reproduced (codec other than H.264/HEVC, unknown profile) or an
+    encoded edge does not match it, the whole clip is re-encoded instead.
+
+    Returns:
+        str: How the clip was produced: "copy", "smart" or "reencode".
+    """
+    first = bisect.bisect_left(keyframes, start - KEYFRAME_TOLERANCE)
+    last = bisect.bisect_right(keyframes, end + KEYFRAME_TOLERANCE) - 1
+    head_key = keyframes[first] if first < len(keyframes) else None
+    tail_key = keyframes[last] if last >= 0 else None
+
+    start_aligned = head_key is not None and abs(head_key - start) <= KEYFRAME_TOLERANCE
+    end_aligned = tail_key is not None and abs(tail_key - end) <= KEYFRAME_TOLERANCE
+
+    if start_aligned and end_aligned:
+        run_ffmpeg([
+            "-y", "-ss", f"{start:.6f}", "-i", input_video, "-t", f"{end - start:.6f}",
+            "-c", "copy", "-avoid_negative_ts", "make_zero", output_file,
+        ])
+        return "copy"
+
+    source = probe_video_stream(input_video)
+    encoder_args = edge_encoder_args(source) if source else None
+    if encoder_args is None or head_key is None or tail_key is None or head_key >= tail_key:
+        logger.info("↪️ No whole GOP inside clip or source encoding cannot be matched; re-encoding")
+        reencode_clip(input_video, start, end, output_file)
+        return "reencode"
+
+    with tempfile.TemporaryDirectory(prefix="smartcut_", dir=os.path.dirname(output_file) or ".") as work_dir:
+        parts = []
+        if head_key - start > KEYFRAME_TOLERANCE:
+            parts.append(_encode_part(input_video, start, head_key, encoder_args, os.path.join(work_dir, "head.ts")))
+        middle_path = os.path.join(work_dir, "middle.ts")
+        run_ffmpeg([
+            "-y", "-ss", f"{head_key:.6f}", "-i", input_video, "-t", f"{tail_key - head_key:.6f}",
+            "-map", "0:v:0", "-c:v", "copy", "-bsf:v", EDGE_ENCODERS[source["codec_name"]]["bsf"],
+            "-an", "-avoid_negative_ts", "make_zero", "-f", "mpegts", middle_path,
+        ])
+        parts.append(middle_path)
+        if end - tail_key > KEYFRAME_TOLERANCE:
+            parts.append(_encode_part(input_video, tail_key, end, encoder_args, os.path.join(work_dir, "tail.ts")))
+
+        mismatched = [part for part in parts if part != middle_path and not _matches_source(part, source)]
+        if mismatched:
+            logger.info(f"↪️ Edge encode does not match the source stream ({source}); re-encoding")
+            reencode_clip(input_video, start, end, output_file)
+            return "reencode"
+
+        concat_segments(parts, output_file, audio_source=input_video, audio_range=(start, end))
+    return "smart"
+
+
+def edge_encoder_args(source: Dict) -> list:
+    """
+    Builds encoder arguments that reproduce the source video stream's format.
+
+    Profile, level, pixel format and colour tags are taken from the probed
+    source so the encoded edges decode with the same decoder configuration
+    as the stream-copied middle.
+
+    Returns:
+        list | None: ffmpeg output arguments, or None if the codec, profile,
+        level or pixel format cannot be matched.
+    """
+    spec = EDGE_ENCODERS.get(source.get("codec_name"))
+    profile = spec["profiles"].get(source.get("profile")) if spec else None
+    level = source.get("level")
+    if not profile or not source.get("pix_fmt") or not level or int(level) <= 0:
+        return None
+
+    level = int(level)
+    args = ["-c:v", spec["encoder"], "-profile:v", profile, "-pix_fmt", source["pix_fmt"]]
+    if source["codec_name"] == "h264":
+        # ffprobe reports H.264 level 4.1 as 41.
+        args += ["-level:v", f"{level // 10}.{level % 10}"]
+    else:
+        # ...and HEVC level 4.1 as 123 (level * 30).
+        args += ["-x265-params", f"level-idc={level / 30:.1f}"]
+
+    for flag, field in (("-color_range", "color_range"), ("-colorspace", "color_space"),
+                        ("-color_trc", "color_transfer"), ("-color_primaries", "color_primaries")):
+        if source.get(field):
+            args += [flag, source[field]]
+    return args
+
+
+def reencode_clip(input_video: str, start: float, end: float, output_file: str) -> None:
+    """Fully re-encodes one clip with libx264/aac."""
     video_clip = VideoFileClip(input_video)
-    os.makedirs(output_dir, exist_ok=True)
+    video_clip.subclip(start, end).write_videofile(output_file, codec="libx264", audio_codec="aac")
+    video_clip.close()
+
 
+def _encode_part(input_video: str, start: float, end: float, encoder_args: list, output_file: str) -> str:
+    """Re-encodes a video-only [start, end) part for a smart cut as MPEG-TS (in-band parameter sets)."""
+    run_ffmpeg([
+        "-y", "-ss", f"{start:.6f}", "-i", input_video, "-t", f"{end - start:.6f}",
+        "-map", "0:v:0", *encoder_args, "-an", "-f", "mpegts", output_file,
+    ])
+    return output_file
+
+
+def _matches_source(part: str, source: Dict) -> bool:
+    """Whether an encoded part has the source stream's codec, profile, level, pix_fmt and size."""
+    encoded = probe_video_stream(part) or {}
+    return all(str(encoded.get(field)) == str(source.get(field)) for field in EDGE_MATCH_FIELDS)
+
+
+def build_clip_jobs(clips: Dict, output_dir: str, duration: float = None) -> list:
+    """
+    Flattens the clips dict into render jobs, longest clip first.
+
+    A clip name with several entries gets a suffix per entry so that parallel
+    workers never write the same output file. The suffix identifies the entry,
+    not its position: the entry's explicit 'id' if it has one, otherwise a
+    short hash of its start, end and text. Inserting, removing or reordering
+    entries in the YAML therefore leaves the other clips' output names (and
+    their incremental-manifest entries) unchanged. With the source duration
+    given, clip ends are clamped to it and clips starting past the end of the
+    source are skipped.
+    """
+    jobs = []
     for clip_name, clip_list in clips.items():
+        seen = {}
         for clip in clip_list:
-            start, end = clip["start"], clip["end"]
-            output_file = os.path.join(output_dir, f"{clip_name}.mp4")
+            if clip.get("id") is not None:
+                name = f"{clip_name}_{clip['id']}"
+            elif len(clip_list) > 1:
+                entry_id = _clip_entry_id(clip)
+                seen[entry_id] = seen.get(entry_id, 0) + 1
+                # Identical entries: later copies get a counter after the hash.
+                name = f"{clip_name}_{entry_id}" + (f"_{seen[entry_id]}" if seen[entry_id] > 1 else "")
+            else:
+                name = clip_name
+            end = clip["end"]
+            if duration is not None:
+                if clip["start"] >= duration:
+                    logging.getLogger(__name__).warning(
+                        f"Skipping clip {name}: starts at {clip['start']}s, source is {duration:.2f}s long"
+                    )
+                    continue
+                end = min(end, duration)
+            jobs.append({
+                "name": name,
+                "start": clip["start"],
+                "end": end,
+                "text": clip.get("text", ""),
+                "output_file": os.path.join(output_dir, f"{name}.mp4"),
+            })
+    jobs.sort(key=lambda job: job["end"] - job["start"], reverse=True)
+    return jobs
+
+
+def _clip_entry_id(clip: Dict) -> str:
+    """Short, position-independent identity of a clip entry (its start, end and text)."""
+    spec = {"start": clip["start"], "end": clip["end"], "text": clip.get("text", "")}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+def render_clip_job(job: Dict, input_video: str, mode: str, keyframes: list) -> Dict:
+    """
+    Renders one clip job with the given cut mode.
+
+    Runs in the calling process or in a pool worker. Each worker keeps its own
+    VideoFileClip reader for the source, and the actual encode is gated by the
+    pool-wide encoder semaphore.
+
+    Returns:
+        dict: The job plus 'method' (how it was cut) and 'seconds' (wall time).
+    """
+    started = time.perf_counter()
+    start, end, output_file = job["start"], job["end"], job["output_file"]
+
+    with _encoder_slot():
+        if mode == "copy":
+            actual_start = cut_clip_copy(input_video, start, end, output_file, keyframes)
+            method = "copy" if actual_start == start else f"copy (start snapped to {actual_start:.3f}s)"
+        elif mode == "smart":
+            method = cut_clip_smart(input_video, start, end, output_file, keyframes, logging.getLogger(__name__))
+        else:
+            reader = _worker_state["readers"].get(input_video)
+            if reader is None:
+                reader = _worker_state["readers"][input_video] = VideoFileClip(input_video)
+            reader.subclip(start, end).write_videofile(
+                output_file, codec="libx264", audio_codec="aac", logger=None
+            )
+            method = "reencode"
 
-            logger.info(f"✂️ Processing Clip: {clip_name} ({start}-{end} sec)")
+    return {**job, "method": method, "seconds": time.perf_counter() - started}
 
-            clip_segment = video_clip.subclip(start, end)
-            clip_segment.write_videofile(output_file, codec="libx264", audio_codec="aac")
 
-            logger.info(f"✅ Saved: {output_file}")
+def render_clips_fanout(jobs: list, input_video: str, logger, on_result=None) -> list:
+    """
+    Renders all clips from a single forward decode of the source.
+
+    Clip intervals are sorted by start. The source is read frame by frame from
+    the first clip start to the last clip end; every frame is written to the
+    encoder of each clip whose interval covers it. Encoders are opened when a
+    clip starts and closed (and their audio muxed in) when it ends, so only one
+    decoded frame is held at a time and total decode work follows the length of
+    the covered source, not the sum of the clip lengths. Gaps between clips are
+    skipped by the reader's own seek. on_result, if given, is called with
+    each result as soon as its clip is finished.
+
+    Returns:
+        list: One result dict per clip, in completion order.
+    """
+    reader = FFMPEG_VideoReader(input_video)
+    fps = reader.fps
+    pending = sorted(
+        ({**job, "first": int(round(job["start"] * fps)), "stop": int(round(job["end"] * fps))} for job in jobs),
+        key=lambda job: job["first"],
+    )
+    pending.reverse()  # pop() from the end yields the earliest start
+    active = []
+    results = []
+    peak = 0
+
+    try:
+        index = pending[-1]["first"] if pending else 0
+        while pending or active:
+            if not active and pending[-1]["first"] > index:
+                index = pending[-1]["first"]
+
+            while pending and pending[-1]["first"] <= index:
+                job = pending.pop()
+                job["video_only"] = f"{job['output_file']}.video.mp4"
+                job["writer"] = FFMPEG_VideoWriter(job["video_only"], reader.size, fps, codec="libx264")
+                job["started"] = time.perf_counter()
+                active.append(job)
+                logger.info(f"✂️ Processing Clip: {job['name']} ({job['start']}-{job['end']} sec) [fanout]")
+            peak = max(peak, len(active))
+
+            frame = reader.get_frame(index / fps)
+            for job in active:
+                job["writer"].write_frame(frame)
+            index += 1
+
+            for job in [job for job in active if job["stop"] <= index]:
+                active.remove(job)
+                results.append(_finish_fanout_clip(job, input_video))
+                logger.info(f"✅ Saved: {job['output_file']} [fanout, {results[-1]['seconds']:.1f}s]")
+                if on_result:
+                    on_result(results[-1])
+    finally:
+        for job in active:
+            job["writer"].close()
+        reader.close()
+
+    logger.info(f"🧮 Fan-out peak: {peak} concurrent encoder(s)")
+    return results
+
+
+def _finish_fanout_clip(job: Dict, input_video: str) -> Dict:
+    """Closes a fan-out clip encoder and muxes in the source audio for its range."""
+    job["writer"].close()
+    concat_segments([job["video_only"]], job["output_file"], audio_source=input_video,
+                    audio_range=(job["start"], job["end"]))
+    os.remove(job["video_only"])
+    return {
+        "name": job["name"],
+        "start": job["start"],
+        "end": job["end"],
+        "output_file": job["output_file"],
+        "method": "fanout",
+        "seconds": time.perf_counter() - job["started"],
+    }
+
+
+def render_clip_jobs(jobs: list, logger, input_video: str, mode: str, workers: int = 1,
+                     max_encoders: int = None, on_result=None) -> list:
+    """
+    Renders the given jobs serially, on the process pool, or with the fan-out renderer.
+
+    on_result, if given, is called in this process with each result as soon
+    as its clip is saved (failed clips are skipped).
+    """
+    if not jobs:
+        return []
+
+    if mode == "fanout":
+        return render_clips_fanout(jobs, input_video, logger, on_result)
+
+    keyframes = keyframe_times(input_video) if mode != "reencode" else []
+    workers = max(1, min(int(workers or 1), len(jobs) or 1))
+    results = []
+
+    logger.info(f"🎬 Rendering {len(jobs)} clips [{mode}] with {workers} worker(s)")
+
+    if workers == 1:
+        for job in jobs:
+            logger.info(f"✂️ Processing Clip: {job['name']} ({job['start']}-{job['end']} sec)")
+            result = render_clip_job(job, input_video, mode, keyframes)
+            logger.info(f"✅ Saved: {result['output_file']} [{result['method']}, {result['seconds']:.1f}s]")
+            results.append(result)
+            if on_result:
+                on_result(result)
+        return results
+
+    semaphore = multiprocessing.BoundedSemaphore(int(max_encoders or workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_clip_worker, initargs=(semaphore,)) as pool:
+        futures = {
+            pool.submit(render_clip_job, job, input_video, mode, keyframes): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"❌ Clip {job['name']} ({job['start']}-{job['end']} sec) failed: {e}")
+                continue
+            logger.info(f"✅ Saved: {result['output_file']} [{result['method']}, {result['seconds']:.1f}s]")
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    return results
+
+
+def process_clips_basic(clips: Dict, logger, input_video: str, output_dir: str, mode: str = "reencode",
+                        workers: int = 1, max_encoders: int = None, incremental: bool = False) -> list:
+    os.makedirs(output_dir, exist_ok=True)
+
+    if mode not in CUT_MODES:
+        raise ValueError(f"Unknown cut mode '{mode}', expected one of {CUT_MODES}")
+
+    # Header-only, cached probe: the source is never decoded just for its length.
+    jobs = build_clip_jobs(clips, output_dir, probe_duration(input_video))
+    if not incremental:
+        return render_clip_jobs(jobs, logger, input_video, mode, workers, max_encoders)
+
+    # === Incremental: render only new or changed clips ===
+    manifest = load_clip_manifest(output_dir)
+    source = _source_identity(input_video)
+    entries = manifest.setdefault("clips", {})
+    to_render = []
+    for job in jobs:
+        job["hash"] = clip_spec_hash(job, mode, source)
+        entry = entries.get(job["name"])
+        if entry and entry.get("hash") == job["hash"] and os.path.exists(job["output_file"]):
+            logger.info(f"♻️ Unchanged, reusing: {job['output_file']}")
+        else:
+            to_render.append(job)
+
+    wanted = {job["name"] for job in jobs}
+    for name in [name for name in entries if name not in wanted]:
+        orphan = entries.pop(name).get("output_file")
+        if orphan and os.path.exists(orphan):
+            os.remove(orphan)
+            logger.info(f"🗑 Removed orphaned clip: {orphan}")
+
+    logger.info(f"🧾 {len(to_render)} of {len(jobs)} clips need rendering")
+    manifest["source"] = input_video
+    save_clip_manifest(output_dir, manifest)
+    hashes = {job["name"]: job["hash"] for job in to_render}
+
+    def record_clip(result):
+        # Saved per clip, so an interrupted run keeps every clip finished so far.
+        entries[result["name"]] = {
+            "hash": hashes[result["name"]],
+            "output_file": result["output_file"],
+            "start": result["start"],
+            "end": result["end"],
+            "method": result["method"],
+        }
+        save_clip_manifest(output_dir, manifest)
+
+    return render_clip_jobs(to_render, logger, input_video, mode, workers, max_encoders, on_result=record_clip)
+
+
+def clip_spec_hash(job: Dict, mode: str, source: Dict) -> str:
+    """
+    Hashes everything that determines a clip's output file.
+
+    Covers the clip's start, end and text, the cut mode with its encoder
+    settings, and the identity (path, size, mtime) of the source video.
+    """
+    spec = {
+        "start": job["start"],
+        "end": job["end"],
+        "text": job.get("text", ""),
+        "mode": mode,
+        "encoder": ENCODER_SETTINGS.get(mode, {}),
+        "source": source,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_clip_manifest(output_dir: str) -> Dict:
+    """Loads the clip manifest of an output directory (empty if there is none)."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {"clips": {}}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.getLogger(__name__).warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {"clips": {}}
+
+
+def save_clip_manifest(output_dir: str, manifest: Dict) -> None:
+    """Atomically writes the clip manifest of an output directory."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _source_identity(input_video: str) -> Dict:
+    """Identifies a source video by path, size and mtime."""
+    stat = os.stat(input_video)
+    return {"path": os.path.abspath(input_video), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# Per-process state for pool workers: source readers and the encoder semaphore.
+_worker_state = {"readers": {}, "semaphore": None}
+
+
+def _init_clip_worker(semaphore) -> None:
+    """Pool initializer: stores the shared encoder semaphore in the worker."""
+    _worker_state["semaphore"] = semaphore
+
+
+@contextmanager
+def _encoder_slot():
+    """Holds one slot of the global encoder limit while an encode runs."""
+    semaphore = _worker_state["semaphore"]
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+def load_clips_config() -> Dict:
+    """Reads the 'clips' section of app_config.json."""
+    config_path = os.path.join(current_dir, "../conf/app_config.json")
+    try:
+        with open(config_path, "r") as f:
+            return json.load(f).get("clips", {})
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def get_cli_option(name: str, default=None):
+    """Returns the value following --<name> on the command line, if any."""
+    flag = f"--{name}"
+    return sys.argv[sys.argv.index(flag) + 1] if flag in sys.argv else default
 
 
 # Optional: sample main()
 if __name__ == "__main__":
     input_video = sys.argv[1]
     clips_file = sys.argv[2]
+    clips_config = load_clips_config()
+    mode = get_cli_option("mode", clips_config.get("cut_mode", "reencode"))
+    workers = get_cli_option("workers", clips_config.get("workers") or max(1, (os.cpu_count() or 1) // 2))
+    max_encoders = get_cli_option("max-encoders", clips_config.get("max_encoders"))
+
+    incremental = clips_config.get("incremental", True) and "--full" not in sys.argv
 
     logger = initialize_logging()
     clips = load_clips_from_file(clips_file)
-    output_dir = create_output_directory("clips_output")
-
-    process_clips_basic(clips, logger, input_video, output_dir)
+    partial_ranges = load_partial_ranges(input_video)
+    if partial_ranges:
+        logger.info(f"🧩 Partial source with {len(partial_ranges)} ranges; mapping clip times")
+        clips = map_clips_to_partial(clips, partial_ranges, logger)
+    if incremental:
+        # Stable per-source directory so reruns can reuse unchanged clips.
+        output_dir = os.path.join("clips_output", os.path.splitext(os.path.basename(input_video))[0])
+    else:
+        output_dir = create_output_directory("clips_output")
 
+    process_clips_basic(clips, logger, input_video, output_dir, mode, int(workers), max_encoders, incremental)
@@ -8,11 +8,20 @@
 #
 # --------------------------------------------------
 # USAGE:
-#   python call_download.py <video_url>
+#   python call_download.py <video_url> [--ranges START-END,START-END,...]
+#
+#   --ranges downloads only those source time ranges (seconds) into one
+#   partial file and records them as 'partial_ranges' in the metadata.
+#
+#   With app_config pipeline.enabled and apply_watermark pending, progressive
+#   single-file formats are watermarked while they download and the
+#   apply_watermark task is recorded as done.
 #
 # DEPENDENCIES:
 #   - teton_utils.py
 #   - task_lib.py
+#   - keyframe_index.py
+#   - download_pipeline.py
 #
 # TASK NAME:
 #   perform_download
@@ -31,10 +40,22 @@ sys.path.append(lib_path)
 
 # === Imports ===
 import teton_lib as tu
+from keyframe_index import build_keyframe_index
+from metadata_cache import cache_key_for_url, configure_metadata_cache, get_cached_metadata, record_alias, store_metadata
+from metadata_index import configure_metadata_index
+from task_store import configure_task_store
+from task_events import configure_task_events
+from url_resolver import configure_url_resolver
+from download_pipeline import download_and_watermark, is_pipelinable
+from path_alloc import release_output_path
 from tasks_lib import (
     copy_metadata_to_backup,
     extend_metadata_with_task_output,
     add_default_tasks_to_metadata,
+    find_url_json,
+    load_default_tasks,
+    update_task_output_path,
+    select_download_format,
 )
 
 # === Task Identifier ===
@@ -44,91 +65,271 @@ task = "perform_download"
 logger = tu.initialize_logging()
 platform_config = tu.load_config()
 app_config = {"default_tasks": platform_config.get("default_tasks", {})}
+settings = tu.load_app_config()
+download_config = settings.get("video_download", {})
+pipeline_config = settings.get("pipeline", {})
+configure_metadata_cache(**settings.get("metadata_cache", {}))
+configure_url_resolver(**settings.get("url_resolver", {}))
+configure_metadata_index(**settings.get("metadata_index", {}))
+configure_task_store(**settings.get("task_store", {}))
+configure_task_events(**settings.get("task_events", {}))
 logger.info("🔴 Starting task: perform_download")
 
 
-def main():
+def prepare_download_path() -> str:
+    """
+    Returns today's download directory on the target USB drive, creating it if needed.
+
+    Raises:
+        RuntimeError: If the drive is not mounted or the directory is not writable.
+    """
+    target_usb = platform_config["target_usb"]
+    download_date = datetime.now().strftime("%Y-%m-%d")
+    download_path = os.path.join(target_usb, download_date)
+
+    if not os.path.exists(target_usb):
+        raise RuntimeError(f"USB drive {target_usb} is not mounted.")
+
+    if not os.path.exists(download_path):
+        logger.warning(f"Creating download path: {download_path}")
+        try:
+            os.makedirs(download_path, exist_ok=True)
+        except PermissionError:
+            raise RuntimeError(f"Permission denied: {download_path}")
+
+    elif not os.access(download_path, os.W_OK):
+        raise RuntimeError(f"No write permission to: {download_path}")
+
+    logger.info(f"✅ Download directory ready: {download_path}")
+    return download_path
+
+
+def should_pipeline(task_states: dict, info: dict) -> bool:
+    """
+    Whether to watermark while downloading.
+
+    Requires pipeline.enabled, a pending apply_watermark task, and a
+    progressive single-file format (see download_pipeline.is_pipelinable).
+    """
+    if not pipeline_config.get("enabled") or task_states.get("apply_watermark") is not True:
+        return False
+    if not is_pipelinable(info):
+        logger.info("Pipeline skipped: format is not a single progressive file.")
+        return False
+    return True
+
+
+def pending_task_states(url: str) -> dict:
+    """
+    Returns the task flags that decide which format to download.
+
+    A rerun uses the flags already stored in the video's metadata; a new URL
+    uses conf/default_tasks.json.
+    """
+    _, existing = find_url_json(url)
+    if existing and existing.get("default_tasks"):
+        return existing["default_tasks"]
     try:
-        # === Verify Download Path ===
-        target_usb = platform_config["target_usb"]
-        download_date = datetime.now().strftime("%Y-%m-%d")
-        download_path = os.path.join(target_usb, download_date)
+        return load_default_tasks()
+    except FileNotFoundError as e:
+        logger.warning(f"⚠️ {e}; using the configured download format.")
+        return {}
 
-        if not os.path.exists(target_usb):
-            logger.error(f"USB drive {target_usb} is not mounted.")
-            sys.exit(1)
 
-        if not os.path.exists(download_path):
-            logger.warning(f"Creating download path: {download_path}")
-            try:
-                os.makedirs(download_path, exist_ok=True)
-            except PermissionError:
-                logger.error(f"Permission denied: {download_path}")
-                sys.exit(1)
+def cached_download_metadata(url: str, download_format: str, task_states: dict) -> dict:
+    """
+    Returns cached metadata that can stand in for a live extraction, or None.
 
-        elif not os.access(download_path, os.W_OK):
-            logger.error(f"No write permission to: {download_path}")
-            sys.exit(1)
+    The entry must be fresh (an expired one only keeps its stale_fields, and
+    the format-dependent ones then have to be extracted again) and must have
+    been extracted for the same download format. The pipelined download reads
+    the media URL from the info dict, so it always extracts live.
+    """
+    if pipeline_config.get("enabled") and task_states.get("apply_watermark") is True:
+        return None
+    cached = get_cached_metadata(url)
+    if not cached or cached.get("download_format") != download_format:
+        return None
+    logger.info("📇 Using cached metadata; skipping the separate extraction.")
+    return cached
 
-        logger.info(f"✅ Download directory ready: {download_path}")
 
-        # === Validate Input URL ===
-        if len(sys.argv) < 2:
-            logger.error("Missing required argument: <video_url>")
-            sys.exit(1)
+def parse_ranges(value: str) -> list:
+    """Parses '--ranges 10-70,300.5-360' into [(10.0, 70.0), (300.5, 360.0)]."""
+    ranges = []
+    for item in value.split(","):
+        start, _, end = item.partition("-")
+        ranges.append((float(start), float(end)))
+    return sorted(ranges)
 
-        
-        url = sys.argv[1].strip()
-        url = fb.resolve_fb_share_url(url)
 
-        cookie_path = fb.resolve_path(platform_config.get("cookie_path"))
+def process_url(url: str, download_path: str, ydl=None, ranges: list = None) -> dict:
+    """
+    Downloads one URL and records it through the metadata chain.
 
-        params = {
-            "download_path": download_path,
-            "cookie_path": platform_config.get("cookie_path"),
-            "url": url,
-            "task": task,
-        }
+    Picks the download format from the pending tasks, takes the metadata from
+    the cache or a single live extraction, then runs the download, the
+    keyframe index build and
+    store_params_as_json / copy_metadata_to_backup /
+    extend_metadata_with_task_output.
 
-        if "facebook.com" in url:
-            logger.info("➡️ Facebook video detected.")
-            if not os.path.exists(params["cookie_path"]):
-                logger.error(f"Missing cookie file: {params['cookie_path']}")
-                sys.exit(1)
+    Args:
+        url (str): The video URL.
+        download_path (str): Directory the video is written to.
+        ydl (yt_dlp.YoutubeDL): Optional long-lived instance from tu.make_youtube_dl().
+        ranges (list): Optional (start, end) source ranges; only these are
+            downloaded and recorded as 'partial_ranges' in the metadata.
 
-        # === Pre-Download Prep ===
-        metadata = tu.mask_metadata(params)
+    Returns:
+        dict: The final params (with 'original_filename'), or None if nothing was downloaded.
+    """
+    requested_url = url.strip()
+    url = tu.resolve_fb_share_url(requested_url)
+
+    cookie_path = tu.resolve_path(platform_config.get("cookie_path"))
+
+    params = {
+        "download_path": download_path,
+        "cookie_path": cookie_path,
+        "url": url,
+        "task": task,
+    }
+
+    if "facebook.com" in url:
+        logger.info("➡️ Facebook video detected.")
+        if not params["cookie_path"] or not os.path.exists(params["cookie_path"]):
+            logger.error(f"Missing cookie file: {params['cookie_path']}")
+            return None
+
+    # === Task-aware format selection ===
+    # Must happen before extraction so the reported ext/size match the download.
+    task_states = pending_task_states(url)
+    params.update(select_download_format(task_states, download_config))
+    params["video_download"] = {
+        "format": params["download_format"],
+        "noplaylist": download_config.get("noplaylist", True),
+    }
+
+    # === Pre-Download Prep ===
+    # The metadata comes from the cache when it holds a fresh entry for this
+    # format; the download then extracts the URL itself. Otherwise one live
+    # yt-dlp extraction feeds both the metadata and the download. The info
+    # dict stays out of params so it is never written to the JSON.
+    info = None
+    metadata = cached_download_metadata(url, params["download_format"], task_states)
+    if metadata:
+        # video_key lets find_url_json() match this file from any URL of the video.
+        params["video_key"] = cache_key_for_url(url)
+        record_alias(requested_url, params["video_key"])
         params.update(metadata)
+    else:
+        info = tu.extract_video_info(params, ydl)
+        if not info:
+            logger.error(f"Could not extract video info for URL: {url}")
+            return None
 
-        filename_info = tu.create_original_filename(params)
-        params.update(filename_info)
+        metadata = tu.mask_metadata(params, info)
+        # The cached ext/codec fields are only valid for the format they were extracted for.
+        metadata["download_format"] = params["download_format"]
+        params.update(metadata)
+        params["video_key"] = store_metadata(url, info, metadata, aliases=[requested_url])
 
-        # === Perform Download ===
-        result = tu.download_video(params)
-        if not result:
-            logger.warning(f"No video downloaded for URL: {url}")
-            return
+    filename_info = tu.create_original_filename(params)
+    params.update(filename_info)
 
-        params.update(result)
+    # === Perform Download ===
+    watermark_result = None
+    if ranges:
+        result = tu.download_video_ranges(params, ranges, info)
+    elif should_pipeline(task_states, info):
+        result = download_and_watermark(
+            info,
+            params["original_filename"],
+            {
+                **settings.get("watermark_config", {}),
+                "username": params.get("uploader") or "UnknownUploader",
+                "video_date": params.get("video_date") or datetime.now().strftime("%Y-%m-%d"),
+                "download_path": download_path,
+            },
+            chunk_size=int(pipeline_config.get("chunk_size") or 1048576),
+        )
+        if result:
+            watermark_result = result.pop("watermark")
+        else:
+            logger.warning("⚠️ Pipelined download failed; retrying with yt-dlp.")
+            result = tu.download_video(params, info, ydl)
+    else:
+        result = tu.download_video(params, info, ydl)
+    if not result:
+        logger.warning(f"No video downloaded for URL: {url}")
+        # Free the name create_original_filename() reserved.
+        release_output_path(params["original_filename"])
+        return None
 
-        json_result = tu.store_params_as_json(params)
-        params.update(json_result)
+    params.update(result)
 
-        logger.info(f"✅ Download complete: {params.get('original_filename')}")
-        print(params.get("original_filename"))
+    # === Build keyframe index sidecar for later seeks ===
+    try:
+        build_keyframe_index(params["original_filename"])
+    except Exception as e:
+        logger.warning(f"⚠️ Could not build keyframe index: {e}")
 
-        # === Post-Download Metadata Update ===
-        config_json = params.get("config_json")
-        if config_json:
-            add_default_tasks_to_metadata(config_json)
-            backup_result = copy_metadata_to_backup(params)
-            params["full_metadata_json"] = backup_result.get("full_metadata_json")
-            params["perform_download_output_path"] = params.get("original_filename")
-            params["app_config"] = app_config
-            extend_metadata_with_task_output(params)
-            logger.info("📦 Task metadata updated.")
-            print(params.get("original_filename"))
+    json_result = tu.store_params_as_json(params)
+    params.update(json_result)
+
+    logger.info(f"✅ Download complete: {params.get('original_filename')}")
+
+    # === Post-Download Metadata Update ===
+    config_json = params.get("config_json")
+    if config_json:
+        add_default_tasks_to_metadata(config_json)
+        backup_result = copy_metadata_to_backup(params)
+        params["full_metadata_json"] = backup_result.get("full_metadata_json")
+        params["perform_download_output_path"] = params.get("original_filename")
+        params["app_config"] = app_config
+        extend_metadata_with_task_output(params)
+        logger.info("📦 Task metadata updated.")
+
+        if watermark_result and params["full_metadata_json"]:
+            from add_watermark import update_task_output_path as record_watermark_details
+
+            # default_tasks (and the task store / event log) mark the task done,
+            # so dispatch does not run apply_watermark again.
+            update_task_output_path(params["full_metadata_json"], "apply_watermark", watermark_result["to_process"])
+            details = {key: value for key, value in watermark_result.items() if key != "to_process"}
+            record_watermark_details(params["full_metadata_json"], "apply_watermark",
+                                     watermark_result["to_process"], details)
+            logger.info(f"🖼 Watermark recorded: {watermark_result['to_process']}")
+
+    return params
+
+
+def main():
+    try:
+        # === Verify Download Path ===
+        try:
+            download_path = prepare_download_path()
+        except RuntimeError as e:
+            logger.error(str(e))
+            sys.exit(1)
 
+        # === Validate Input URL ===
+        if len(sys.argv) < 2:
+            logger.error("Missing required argument: <video_url>")
+            sys.exit(1)
+
+        ranges = None
+        if "--ranges" in sys.argv:
+            ranges = parse_ranges(sys.argv[sys.argv.index("--ranges") + 1])
+            logger.info(f"✂️ Partial download of {len(ranges)} ranges requested")
+
+        params = process_url(sys.argv[1], download_path, ranges=ranges)
+        if not params:
+            return
+
+        print(params.get("original_filename"))
+        if params.get("config_json"):
+            print(params.get("original_filename"))
 
     except Exception as e:
         logger.error(f"❌ Unhandled error in main(): {e}")
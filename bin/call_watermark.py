@@ -6,13 +6,20 @@
 # Applies a watermark to a downloaded video using metadata and app config,
 # then updates the metadata JSON with output info.
 #
+# In batch mode, every video found in the given directories/files is
+# watermarked on a bounded process pool. Static overlays (uploader, date,
+# clock glyphs) are rendered once up front and shared through the label
+# cache, and each video's metadata is updated as soon as it finishes.
+#
 # --------------------------------------------------
 # USAGE:
 #   python call_watermark.py <video_file_path>
+#   python call_watermark.py --batch <dir_or_video> [<dir_or_video> ...] [--workers N]
 #
 # DEPENDENCIES:
 #   - teton_utils.py
 #   - watermark.py
+#   - text_render.py
 #
 # TASK NAME:
 #   apply_watermark
@@ -22,6 +29,7 @@ import os
 import sys
 import json
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 # === Path Setup ===
@@ -30,13 +38,19 @@ lib_path = os.path.join(current_dir, "../lib")
 sys.path.append(lib_path)
 
 # === Imports ===
-from teton_lib import initialize_logging
-from watermark_utils import (
-    load_app_config,
+from teton_lib import initialize_logging, load_app_config
+from media_lib import configure_probe_cache
+from text_render import configure_label_cache, render_label
+from add_watermark import (
     add_watermark,
     add_default_tasks_to_metadata,
-    update_task_output_path,
+    get_timestamp_glyphs,
+    update_task_output_path as record_watermark_details,
 )
+from metadata_index import configure_metadata_index
+from task_store import configure_task_store
+from task_events import configure_task_events
+from tasks_lib import update_task_output_path
 
 # === Task Identifier ===
 task = "apply_watermark"
@@ -45,10 +59,170 @@ task = "apply_watermark"
 logger = initialize_logging()
 app_config = load_app_config()
 watermark_config = app_config.get("watermark_config", {})
+configure_label_cache(**app_config.get("text_render", {}))
+configure_probe_cache(**app_config.get("probe", {}))
+configure_metadata_index(**app_config.get("metadata_index", {}))
+configure_task_store(**app_config.get("task_store", {}))
+configure_task_events(**app_config.get("task_events", {}))
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".mov")
+
+
+def metadata_path_for(input_video_path):
+    """Returns the metadata JSON path that belongs to a video file."""
+    return os.path.join(
+        "metadata",
+        os.path.splitext(os.path.basename(input_video_path))[0] + ".json"
+    )
+
+
+def build_watermark_params(input_video_path, json_path):
+    """Builds the add_watermark() parameters from the video's metadata JSON."""
+    with open(json_path, "r") as file:
+        data = json.load(file)
+
+    logger.info(f"Loaded metadata from: {json_path}")
+    username = data.get("uploader", "UnknownUploader")
+    video_date = data.get("video_date", datetime.now().strftime("%Y-%m-%d"))
+
+    return {
+        "input_video_path": input_video_path,
+        "download_path": os.path.dirname(input_video_path),
+        "username": username,
+        "video_date": video_date,
+        **watermark_config,
+    }
+
+
+def record_watermark_result(json_path, result):
+    """Records the watermark output as the task's state and its audio decision in the metadata JSON."""
+    output_path = result["to_process"]
+    audio_details = {
+        key: result[key]
+        for key in ("audio_mode", "audio_codec", "source_audio_codec")
+        if key in result
+    }
+    logger.info(f"🔊 Audio: {audio_details}")
+
+    add_default_tasks_to_metadata(json_path)
+    # The task state goes through tasks_lib (JSON, task store or event log);
+    # the audio details are kept in the 'tasks' section.
+    update_task_output_path(json_path, task, output_path)
+    update_result = record_watermark_details(json_path, task, output_path, audio_details)
+    logger.debug(f"Metadata updated: {update_result}")
+
+
+def collect_batch_inputs(paths):
+    """Expands directories into the videos they contain, skipping earlier outputs."""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full_path = os.path.join(path, name)
+                if (
+                    name.lower().endswith(VIDEO_EXTENSIONS)
+                    and "_watermarked" not in name
+                    and os.path.isfile(full_path)
+                ):
+                    videos.append(full_path)
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            logger.warning(f"⚠️ Skipping missing input: {path}")
+    return videos
+
+
+def prewarm_static_overlays(jobs):
+    """
+    Renders the labels shared between jobs once, before the pool starts.
+
+    Workers inherit the in-memory cache where the platform forks and read the
+    on-disk label cache otherwise, so each distinct uploader/date label and the
+    clock glyphs are drawn only once per batch.
+    """
+    if watermark_config.get("engine", "moviepy") == "ffmpeg":
+        return
+
+    font = watermark_config["font"]
+    font_size = watermark_config["font_size"]
+    shadow = watermark_config.get("shadow")
+    labels = set()
+    for params in jobs.values():
+        labels.add((params["username"], watermark_config["username_color"]))
+        labels.add((params["video_date"], watermark_config["date_color"]))
+
+    for text, color in labels:
+        render_label(text, font, font_size, color, shadow)
+    get_timestamp_glyphs(font, font_size, watermark_config["timestamp_color"])
+    logger.info(f"🎨 Pre-rendered {len(labels)} static labels and clock glyphs")
+
+
+def run_batch(paths, workers=None):
+    """Watermarks many videos on a bounded process pool."""
+    jobs = {}
+    for input_video_path in collect_batch_inputs(paths):
+        json_path = metadata_path_for(input_video_path)
+        if not os.path.isfile(json_path):
+            logger.error(f"Metadata file not found, skipping: {json_path}")
+            continue
+        params = build_watermark_params(input_video_path, json_path)
+        # One encoder per worker; segment-parallel mode would oversubscribe the pool.
+        params["parallel"] = False
+        jobs[json_path] = params
+
+    if not jobs:
+        logger.error("No videos to watermark.")
+        return 1
+
+    workers = int(
+        workers
+        or watermark_config.get("batch_workers")
+        or max(1, (os.cpu_count() or 1) // 2)
+    )
+    workers = min(workers, len(jobs))
+    logger.info(f"🖼 Watermarking {len(jobs)} videos with {workers} workers")
+
+    prewarm_static_overlays(jobs)
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(add_watermark, params): json_path for json_path, params in jobs.items()}
+        for future in as_completed(futures):
+            json_path = futures[future]
+            input_video_path = jobs[json_path]["input_video_path"]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"❌ Worker crashed on {input_video_path}: {e}")
+                result = None
+
+            if result and "to_process" in result:
+                logger.info(f"✅ Watermarked video created: {result['to_process']}")
+                print(result["to_process"])
+                record_watermark_result(json_path, result)
+            else:
+                logger.error(f"Watermarking failed for: {input_video_path}")
+                failures += 1
+
+    logger.info(f"🏁 Batch finished: {len(jobs) - failures} ok, {failures} failed")
+    return 1 if failures else 0
 
 
 def main():
     try:
+        # === Batch mode ===
+        if "--batch" in sys.argv:
+            args = [arg for arg in sys.argv[1:] if arg != "--batch"]
+            workers = None
+            if "--workers" in args:
+                index = args.index("--workers")
+                workers = int(args[index + 1])
+                del args[index:index + 2]
+            if not args:
+                logger.error("Usage: python call_watermark.py --batch <dir_or_video> [...] [--workers N]")
+                sys.exit(1)
+            sys.exit(run_batch(args, workers))
+
         # === Validate input argument ===
         if len(sys.argv) < 2:
             logger.error("Usage: python call_watermark.py <video_file_path>")
@@ -62,30 +236,14 @@ def main():
         logger.info(f"🖼 Processing video file: {input_video_path}")
 
         # === Derive Metadata Path ===
-        json_path = os.path.join(
-            "metadata",
-            os.path.basename(input_video_path).replace(".mp4", ".json")
-        )
+        json_path = metadata_path_for(input_video_path)
 
         if not os.path.isfile(json_path):
             logger.error(f"Metadata file not found: {json_path}")
             sys.exit(1)
 
-        with open(json_path, "r") as file:
-            data = json.load(file)
-
-        logger.info(f"Loaded metadata from: {json_path}")
-        username = data.get("uploader", "UnknownUploader")
-        video_date = data.get("video_date", datetime.now().strftime("%Y-%m-%d"))
-
         # === Prepare Parameters ===
-        params = {
-            "input_video_path": input_video_path,
-            "download_path": os.path.dirname(input_video_path),
-            "username": username,
-            "video_date": video_date,
-            **watermark_config,
-        }
+        params = build_watermark_params(input_video_path, json_path)
 
         # === Perform Watermarking ===
         logger.info("Starting watermarking process...")
@@ -96,9 +254,7 @@ def main():
             logger.info(f"✅ Watermarked video created: {output_path}")
             print(output_path)
 
-            add_default_tasks_to_metadata(json_path)
-            update_result = update_task_output_path(json_path, task, output_path)
-            logger.debug(f"Metadata updated: {update_result}")
+            record_watermark_result(json_path, result)
         else:
             logger.error("Watermarking failed or returned no output.")
             sys.exit(1)
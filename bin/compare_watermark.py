@@ -0,0 +1,138 @@
+# ==================================================
+# compare_watermark.py - Frame-grab diff of the moviepy and ffmpeg watermark engines
+# ==================================================
+#
+# Description:
+# Watermarks the same video with the moviepy engine (the reference) and the
+# ffmpeg drawtext engine, grabs frames from both outputs at the same times and
+# prints how far they differ: the mean absolute pixel difference and the share
+# of pixels that differ by more than a small tolerance (encoder noise).
+#
+# With --calibrate the ffmpeg engine is re-run for a range of
+# drawtext_font_scale values and the scale with the smallest difference is
+# printed; put it into watermark_config in conf/app_config.json.
+#
+# The exit code is 1 when the best difference is above --max-diff, so the
+# script can gate a CI job.
+#
+# --------------------------------------------------
+# USAGE:
+#   python compare_watermark.py <video_file_path> [--times 0.5,2,5] [--calibrate] [--max-diff 2.0]
+#
+# DEPENDENCIES:
+#   - teton_lib.py
+#   - add_watermark.py
+#   - media_lib.py
+#   - numpy, Pillow
+# ==================================================
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+# === Path Setup ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(current_dir, "../lib")
+sys.path.append(lib_path)
+
+# === Imports ===
+from teton_lib import initialize_logging, load_app_config
+from add_watermark import add_watermark
+from media_lib import probe_duration, run_ffmpeg
+
+logger = initialize_logging()
+
+# Per-channel difference below which a pixel counts as encoder noise.
+PIXEL_TOLERANCE = 24
+CALIBRATION_SCALES = [0.80, 0.85, 0.90, 0.95, 1.00, 1.05, 1.10, 1.15, 1.20]
+
+
+def grab_frames(video_path: str, times: list, out_dir: str) -> list:
+    """Extracts one RGB frame per time (seconds) and returns them as arrays."""
+    os.makedirs(out_dir, exist_ok=True)
+    frames = []
+    for i, t in enumerate(times):
+        frame_path = os.path.join(out_dir, f"frame_{i:03}.png")
+        run_ffmpeg(["-y", "-ss", f"{t:.3f}", "-i", video_path, "-frames:v", "1", frame_path])
+        with Image.open(frame_path) as image:
+            frames.append(np.asarray(image.convert("RGB"), dtype=np.int16))
+    return frames
+
+
+def diff_frames(reference: list, candidate: list) -> dict:
+    """Mean absolute difference and share of differing pixels over all frame pairs."""
+    mean_diffs, changed = [], []
+    for ref, cand in zip(reference, candidate):
+        if ref.shape != cand.shape:
+            raise ValueError(f"Frame sizes differ: {ref.shape} vs {cand.shape}")
+        delta = np.abs(ref - cand)
+        mean_diffs.append(float(delta.mean()))
+        changed.append(float((delta.max(axis=2) > PIXEL_TOLERANCE).mean()))
+    return {"mean_abs_diff": float(np.mean(mean_diffs)), "changed_pixels": float(np.mean(changed))}
+
+
+def watermark_with(params: dict, engine: str, out_dir: str, extra: dict = None) -> str:
+    """Runs one engine into out_dir and returns the watermarked video path."""
+    os.makedirs(out_dir, exist_ok=True)
+    result = add_watermark({**params, **(extra or {}), "engine": engine,
+                            "parallel": False, "download_path": out_dir})
+    if not result:
+        raise RuntimeError(f"{engine} engine failed")
+    return result["to_process"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the moviepy and ffmpeg watermark engines frame by frame.")
+    parser.add_argument("video", help="Input video file")
+    parser.add_argument("--times", help="Comma-separated frame times in seconds (default: 5 evenly spaced)")
+    parser.add_argument("--calibrate", action="store_true", help="Search drawtext_font_scale for the smallest difference")
+    parser.add_argument("--max-diff", type=float, default=2.0, help="Mean absolute difference that fails the check")
+    args = parser.parse_args()
+
+    if args.times:
+        times = [float(t) for t in args.times.split(",")]
+    else:
+        duration = probe_duration(args.video)
+        times = [duration * (i + 1) / 6 for i in range(5)]
+
+    params = {
+        "input_video_path": args.video,
+        "username": "Comparison",
+        "video_date": "20250101",
+        **load_app_config().get("watermark_config", {}),
+    }
+
+    scratch_dir = tempfile.mkdtemp(prefix="compare_watermark_")
+    try:
+        reference_path = watermark_with(params, "moviepy", os.path.join(scratch_dir, "moviepy"))
+        reference = grab_frames(reference_path, times, os.path.join(scratch_dir, "frames_moviepy"))
+
+        scales = CALIBRATION_SCALES if args.calibrate else [float(params.get("drawtext_font_scale", 1.0))]
+        results = []
+        for scale in scales:
+            out_dir = os.path.join(scratch_dir, f"ffmpeg_{scale:.2f}")
+            candidate_path = watermark_with(params, "ffmpeg", out_dir, {"drawtext_font_scale": scale})
+            candidate = grab_frames(candidate_path, times, os.path.join(out_dir, "frames"))
+            score = diff_frames(reference, candidate)
+            results.append((scale, score))
+            print(f"scale {scale:.2f}: mean abs diff {score['mean_abs_diff']:.3f}, "
+                  f"changed pixels {score['changed_pixels']:.2%}")
+
+        best_scale, best = min(results, key=lambda item: item[1]["mean_abs_diff"])
+        if args.calibrate:
+            print(f"best drawtext_font_scale: {best_scale:.2f}")
+
+        if best["mean_abs_diff"] > args.max_diff:
+            logger.error(f"❌ Engines differ by {best['mean_abs_diff']:.3f} (> {args.max_diff})")
+            sys.exit(1)
+        logger.info(f"✅ Engines match within {args.max_diff} (mean abs diff {best['mean_abs_diff']:.3f})")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
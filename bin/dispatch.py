@@ -4,10 +4,10 @@ import json
 import logging
 import traceback
 import subprocess
+import time
 from datetime import datetime
 import math
 import yaml
-from moviepy.editor import VideoFileClip
 
 # Add lib path to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,7 +16,27 @@ sys.path.append(lib_path)
 
 # Import utilities
 from teton_lib import initialize_logging, load_config, load_app_config
-from tasks_lib import find_url_json
+from tasks_lib import find_url_json, load_default_tasks
+from keyframe_index import keyframe_times
+from media_lib import configure_probe_cache, probe_media
+from metadata_cache import configure_metadata_cache, get_cached_metadata
+from metadata_index import configure_metadata_index
+from task_store import configure_task_store
+from task_events import (
+    configure_task_events,
+    materialize_task_states,
+    record_task_completed,
+    record_task_failed,
+    record_task_started,
+    use_task_events,
+)
+from chunking import (
+    boundaries_to_chunks,
+    clip_download_ranges,
+    fixed_chunk_boundaries,
+    scene_chunk_boundaries,
+    silence_chunk_boundaries,
+)
 # Map tasks to their respective scripts
 TASK_DISPATCH = {
     "perform_download": "bin/call_download.py",
@@ -27,35 +47,97 @@ TASK_DISPATCH = {
     "post_process": "bin/call_screenshots.py"
 }
 
-def find_clips_file(to_process_path, clip_file_path, logger):
+def find_clips_file(to_process_path, clip_file_path, logger, clips_config=None, metadata=None):
     """
     Use the specified clip_file_path:
     - If it exists, return it.
-    - If not, generate default 1-minute segments at that path.
+    - If not, generate default chunks at that path using the configured
+      clips.chunk_strategy ("fixed", "scene" or "silence"). The video's
+      metadata, when given, supplies the duration without probing the file.
     """
     if os.path.exists(clip_file_path):
         logger.info(f"✅ Using existing clips file: {clip_file_path}")
         return clip_file_path
 
+    clips_config = clips_config or {}
+    strategy = clips_config.get("chunk_strategy", "fixed")
+    chunk_duration = clips_config.get("chunk_duration", 60)
+
     logger.warning(f"⚠️ Clips file not found: {clip_file_path}")
-    logger.info(f"🛠 Generating default 1-minute chunks to: {clip_file_path}")
-    generate_default_clips_yaml(to_process_path, clip_file_path)
+    logger.info(f"🛠 Generating default {chunk_duration}s chunks ({strategy}) to: {clip_file_path}")
+    generate_default_clips_yaml(
+        to_process_path,
+        clip_file_path,
+        chunk_duration=chunk_duration,
+        strategy=strategy,
+        tolerance=clips_config.get("chunk_tolerance", 10),
+        scene_threshold=clips_config.get("scene_threshold", 0.3),
+        silence_threshold_db=clips_config.get("silence_threshold_db", -40),
+        min_silence=clips_config.get("min_silence", 0.3),
+        metadata=metadata,
+    )
     return clip_file_path
 
 
-def generate_default_clips_yaml(video_path, output_yaml_path, chunk_duration=60):
+def generate_default_clips_yaml(video_path, output_yaml_path, chunk_duration=60, snap_to_keyframes=True,
+                                strategy="fixed", tolerance=10, scene_threshold=0.3,
+                                silence_threshold_db=-40, min_silence=0.3, metadata=None):
     """
-    Creates a default clips YAML file that divides the video into fixed-length chunks.
+    Creates a default clips YAML file that divides the video into chunks.
+
+    strategy "fixed" splits every chunk_duration seconds; "scene" moves each
+    boundary to the nearest scene change within +/- tolerance seconds;
+    "silence" moves it into the nearest gap of at least min_silence seconds
+    quieter than silence_threshold_db, so cuts do not fall mid-sentence. With
+    snap_to_keyframes, boundaries are then moved to a nearby keyframe from the
+    video's keyframe index, so chunks can be stream-copied.
+
+    The duration comes from the shared probe cache (pre-filled from metadata
+    when given), so the video is never opened for decoding here. Containers
+    whose header has no duration (N/A) fall back to the last keyframe time of
+    the keyframe index.
     """
-    video = VideoFileClip(video_path)
-    total_duration = math.floor(video.duration)
-    chunks = []
+    duration = probe_media(video_path, metadata)["duration"]
+
+    keyframes = None
+    if snap_to_keyframes or duration is None:
+        try:
+            keyframes = keyframe_times(video_path)
+        except Exception as e:
+            logging.warning(f"Keyframe index unavailable, boundaries will not be keyframe-aligned: {e}")
+
+    if duration is None:
+        if not keyframes:
+            raise ValueError(f"Cannot chunk {video_path}: no duration in the header and no keyframe index")
+        duration = keyframes[-1]
+        logging.warning(f"⚠️ No container duration for {video_path}; using the last keyframe ({duration:.1f}s)")
+    total_duration = math.floor(duration)
+    if not snap_to_keyframes:
+        keyframes = None
+
+    boundaries = None
+    if strategy == "scene":
+        try:
+            boundaries = scene_chunk_boundaries(
+                video_path, total_duration, chunk_duration, tolerance, keyframes, threshold=scene_threshold
+            )
+        except Exception as e:
+            logging.warning(f"Scene analysis failed, falling back to fixed chunks: {e}")
+    elif strategy == "silence":
+        try:
+            boundaries = silence_chunk_boundaries(
+                video_path, total_duration, chunk_duration, tolerance, keyframes,
+                threshold_db=silence_threshold_db, min_silence=min_silence
+            )
+        except Exception as e:
+            logging.warning(f"Silence analysis failed, falling back to fixed chunks: {e}")
+    elif strategy != "fixed":
+        logging.warning(f"Unknown chunk strategy '{strategy}', using fixed chunks.")
 
-    for i in range(0, total_duration, chunk_duration):
-        end = min(i + chunk_duration, total_duration)
-        chunks.append({"start": i, "end": end})
+    if boundaries is None:
+        boundaries = fixed_chunk_boundaries(total_duration, chunk_duration, keyframes)
 
-    default_clips = {"auto_chunks": chunks}
+    default_clips = {"auto_chunks": boundaries_to_chunks(boundaries)}
 
     with open(output_yaml_path, "w") as f:
         yaml.dump(default_clips, f)
@@ -89,8 +171,16 @@ def add_clip_data_to_metadata(metadata_path, clips_file_path):
         logging.error(f"Failed to update metadata: {e}")
         return False
 
-def execute_tasks(task_config, url, to_process, dry_run=False, clips_file=None):
-    """Run appropriate script for each task based on its config."""
+def execute_tasks(task_config, url, to_process, dry_run=False, clips_file=None, metadata_path=None):
+    """
+    Run appropriate script for each task based on its config.
+
+    With the task event log enabled and a metadata_path, every run is logged
+    as started, then completed or failed with its duration. Scripts that
+    report an output path record it themselves; for the others the completed
+    event carries the file the task ran on, so the task no longer replays as
+    pending and is not run again.
+    """
     for task, status in task_config.items():
         script = TASK_DISPATCH.get(task)
 
@@ -109,6 +199,18 @@ def execute_tasks(task_config, url, to_process, dry_run=False, clips_file=None):
             logging.info(f"🚀 Running task: {task} -> {script}")
             if dry_run:
                 logging.info(f"[Dry Run] Would run: python {script} {' '.join(args)}")
+            elif metadata_path and use_task_events():
+                started_at = record_task_started(metadata_path, task)
+                returncode = subprocess.run(["python", script] + args).returncode
+                duration = time.time() - started_at
+                if returncode == 0:
+                    # Only a completed event with an output path changes the state.
+                    reported = materialize_task_states(metadata_path).get(task)
+                    output_path = None if isinstance(reported, str) else (to_process or url)
+                    record_task_completed(metadata_path, task, output_path=output_path, duration=duration)
+                else:
+                    record_task_failed(metadata_path, task, f"exit code {returncode}", duration=duration)
+                    logging.error(f"❌ Task {task} failed with exit code {returncode} after {duration:.1f}s")
             else:
                 subprocess.run(["python", script] + args)
         elif isinstance(status, str):
@@ -116,10 +218,53 @@ def execute_tasks(task_config, url, to_process, dry_run=False, clips_file=None):
         else:
             logging.info(f"⏭️  Skipping task: {task}")
 
-def run_my_existing_downloader(url, logger):
+def plan_partial_download(clips_config, logger):
+    """
+    Returns the source ranges to download when only clips are wanted.
+
+    Partial downloads are used when clips.partial_download is on, the clips
+    file already exists, and make_clips is the only pending task that reads
+    the media (other tasks need the whole file). Ranges are the clip
+    intervals widened by clips.partial_padding seconds and merged when closer
+    than clips.partial_merge_gap seconds.
+    """
+    if not clips_config.get("partial_download"):
+        return None
+
+    clip_file_path = clips_config.get("default_path")
+    if not clip_file_path or not os.path.exists(clip_file_path):
+        logger.info("Partial download skipped: no clips file to read ranges from.")
+        return None
+
+    pending = {
+        task for task, state in load_default_tasks().items()
+        if state is True and task != "perform_download"
+    }
+    if pending != {"make_clips"}:
+        logger.info(f"Partial download skipped: other tasks need the full file ({sorted(pending - {'make_clips'})}).")
+        return None
+
+    with open(clip_file_path, "r") as f:
+        clips = yaml.safe_load(f) or {}
+    ranges = clip_download_ranges(
+        clips,
+        padding=clips_config.get("partial_padding", 5),
+        merge_gap=clips_config.get("partial_merge_gap", 30),
+    )
+    logger.info(f"✂️ Planning partial download: {len(ranges)} ranges, {sum(end - start for start, end in ranges):.0f}s")
+    return ranges or None
+
+
+def format_ranges(ranges):
+    """Formats ranges for call_download.py --ranges."""
+    return ",".join(f"{start}-{end}" for start, end in ranges)
+
+
+def run_my_existing_downloader(url, logger, ranges=None):
     logger.info(f"📥 Initiating download for: {url}")
+    args = [url] + (["--ranges", format_ranges(ranges)] if ranges else [])
     result = subprocess.run(
-        ["python", "bin/call_download.py", url],
+        ["python", "bin/call_download.py"] + args,
         capture_output=True,
         text=True
     )
@@ -142,6 +287,11 @@ def main():
         # Load logger and app config early
         logger = initialize_logging()
         app_config = load_app_config()
+        configure_probe_cache(**app_config.get("probe", {}))
+        configure_metadata_cache(**app_config.get("metadata_cache", {}))
+        configure_metadata_index(**app_config.get("metadata_index", {}))
+        configure_task_store(**app_config.get("task_store", {}))
+        configure_task_events(**app_config.get("task_events", {}))
 
         config = load_config()
         logger.info("🔁 Task Router Started")
@@ -153,9 +303,24 @@ def main():
             if found_data else None
         )
 
+        ranges = None
+        if not found_file or not perform_download_done:
+            ranges = plan_partial_download(app_config.get("clips", {}), logger)
+
+        if (not found_file or not perform_download_done) and dry_run:
+            # Dry runs stay offline: report what is cached and what would run.
+            cached = get_cached_metadata(url)
+            if cached:
+                print(json.dumps(cached, indent=2))
+            else:
+                logger.info("📇 No cached metadata for this URL.")
+            extra = f" --ranges {format_ranges(ranges)}" if ranges else ""
+            logger.info(f"[Dry Run] Would run: python bin/call_download.py {url}{extra}")
+            return
+
         if not found_file or not perform_download_done:
             logger.info("📥 No completed download or metadata found — running downloader...")
-            run_my_existing_downloader(url, logger)
+            run_my_existing_downloader(url, logger, ranges)
             found_file, found_data = find_url_json(url, metadata_dir="./metadata")
             perform_download_done = (
                 found_data.get("default_tasks", {}).get("perform_download")
@@ -190,14 +355,14 @@ def main():
             logger.error("❌ No clips file path configured in app_config['clips']['default_path'].")
             return
 
-        clips_file = find_clips_file(to_process, clip_file_path, logger)
+        clips_file = find_clips_file(to_process, clip_file_path, logger, app_config.get("clips", {}), found_data)
 
         metadata_path = found_data.get("metadata_path") or found_file
         if metadata_path:
             add_clip_data_to_metadata(metadata_path, clips_file)
 
         logger.info(f"🛠 Tasks to evaluate: {list(default_tasks.keys())}")
-        execute_tasks(default_tasks, url, to_process, dry_run, clips_file)
+        execute_tasks(default_tasks, url, to_process, dry_run, clips_file, metadata_path)
 
     except Exception as e:
         logging.error(f"Unexpected error in main(): {e}")
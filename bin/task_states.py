@@ -0,0 +1,63 @@
+# ==================================================
+# task_states.py - Query and export the SQLite task store
+# ==================================================
+#
+# Description:
+# Command-line access to the task_store backend (app_config "task_store":
+# {"backend": "sqlite"}):
+#
+#   find    prints the metadata JSON of every video whose task is in the
+#           given status, oldest update first (an index lookup, no metadata
+#           file is opened)
+#   export  writes the stored states of every video back into its metadata
+#           JSON, e.g. after running with export_json off
+#
+# --------------------------------------------------
+# USAGE:
+#   python task_states.py find <task> <pending|disabled|done>
+#   python task_states.py export
+#
+# DEPENDENCIES:
+#   - teton_lib.py
+#   - task_store.py
+# ==================================================
+
+import os
+import sys
+import argparse
+
+# === Path Setup ===
+current_dir = os.path.dirname(os.path.abspath(__file__))
+lib_path = os.path.join(current_dir, "../lib")
+sys.path.append(lib_path)
+
+# === Imports ===
+from teton_lib import initialize_logging, load_app_config
+from task_store import configure_task_store, export_all_task_states, find_tasks, use_task_store
+
+logger = initialize_logging()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and export the SQLite task store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    find_parser = commands.add_parser("find", help="List videos whose task is in a status")
+    find_parser.add_argument("task", help="Task name, e.g. make_clips")
+    find_parser.add_argument("status", choices=["pending", "disabled", "done"])
+    commands.add_parser("export", help="Write stored states back into every metadata JSON")
+    args = parser.parse_args()
+
+    configure_task_store(**load_app_config().get("task_store", {}))
+    if not use_task_store():
+        logger.error("❌ task_store.backend is not \"sqlite\"; task states live in the metadata files.")
+        sys.exit(1)
+
+    if args.command == "find":
+        for json_path in find_tasks(args.task, args.status):
+            print(json_path)
+    else:
+        export_all_task_states()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,44 @@
 # - add_watermark(params: dict) -> dict
 #     Adds a watermark to a video using ffmpeg or a similar backend.
 #
+# - add_watermark_ffmpeg(params: dict) -> dict
+#     Adds the watermark with a single native ffmpeg drawtext filter graph.
+#
+# - add_watermark_parallel(params: dict) -> dict
+#     Watermarks keyframe-aligned segments in a process pool and joins them losslessly.
+#
+# - build_drawtext_filter(params: dict, label_dir: str, offset: float = 0) -> str
+#     Translates watermark_config into an ffmpeg drawtext filter chain.
+#
+# - compose_watermark(video, params: dict, offset: float = 0) -> CompositeVideoClip
+#     Layers the username, date and running-clock overlays on top of a video clip.
+#
+# - drawtext_font_size(params: dict) -> int
+#     Returns the drawtext fontsize that matches the moviepy engine's label size.
+#
+# - format_timestamp(seconds: int, hour_digits: int = 2) -> str
+#     Formats a number of seconds as a zero-padded HH:MM:SS clock string.
+#
+# - get_timestamp_glyphs(font: str, font_size: int, color: str) -> dict
+#     Returns the cached, pre-rendered digit/colon glyphs used by the timestamp overlay.
+#
 # - load_app_config() -> dict
 #     Loads the application-level configuration from app_config.json.
 #
-# - update_task_output_path(json_path: str, task: str, output_path: str) -> dict
-#     Updates the metadata JSON file with the output path for a specific task.
+# - make_label_clip(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> ImageClip
+#     Builds a static text clip from a Pillow-rendered, cached label bitmap.
+#
+# - make_timestamp_clip(duration: float, params: dict, offset: float = 0) -> VideoClip
+#     Builds a single time-driven running-clock layer from the glyph cache.
+#
+# - plan_segments(keyframes: list, duration: float, count: int) -> list
+#     Splits a video into keyframe-aligned time ranges for parallel encoding.
+#
+# - select_audio_codec(input_video_path: str, ext: str, source_codec: str = None) -> dict
+#     Decides whether the source audio can be stream-copied into the output container.
+#
+# - update_task_output_path(json_path: str, task: str, output_path: str, details: dict = None) -> dict
+#     Updates the metadata JSON file with the output path (and details) for a specific task.
 #
 # --------------------------------------------------
 # INSTRUCTIONS FOR ADDING A NEW FUNCTION:
@@ -31,14 +64,48 @@
 import os
 import json
 import logging
+import tempfile
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from moviepy.video.io.VideoFileClip import VideoFileClip
-from moviepy.video.VideoClip import TextClip
+from moviepy.video.VideoClip import ImageClip, VideoClip
 from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+from media_lib import (
+    concat_segments,
+    mux_audio,
+    probe_audio_codec,
+    probe_duration,
+    run_ffmpeg,
+)
+from keyframe_index import keyframe_times
+from metadata_index import record_metadata_file
+from task_store import update_metadata_file
+from text_render import LABEL_PADDING, load_font, render_label, resolve_font_path
 
 
 logger = logging.getLogger(__name__)
 
+# Characters needed to draw any HH:MM:SS clock value.
+TIMESTAMP_GLYPHS = "0123456789:"
+
+# (font, font_size, color) -> {char: (rgb, alpha)}; a handful of entries at most.
+_glyph_cache = {}
+
+# Audio codecs each output container can carry as-is; None means "anything".
+AUDIO_COPY_COMPATIBLE = {
+    ".mp4": {"aac", "mp3", "alac", "ac3", "eac3", "flac"},
+    ".mov": {"aac", "mp3", "alac", "ac3", "pcm_s16le"},
+    ".webm": {"opus", "vorbis"},
+    ".ogv": {"vorbis", "opus", "flac"},
+    ".mkv": None,
+}
+
+# moviepy position keywords -> drawtext x/y of the label box (w/h: video, {size}:
+# width/height of the label bitmap the moviepy engine would place there).
+DRAWTEXT_X = {"left": "0", "center": "(w-{size})/2", "right": "w-{size}"}
+DRAWTEXT_Y = {"top": "0", "center": "(h-{size})/2", "bottom": "h-{size}"}
+
 def add_default_tasks_to_metadata(json_path: str) -> None:
     """
     Ensures the metadata JSON includes a default 'tasks' structure.
@@ -49,17 +116,7 @@ def add_default_tasks_to_metadata(json_path: str) -> None:
     if not os.path.exists(json_path):
         raise FileNotFoundError(f"Metadata file not found: {json_path}")
 
-    with open(json_path, "r") as f:
-        data = json.load(f)
-
-    if "tasks" not in data:
-        data["tasks"] = {}
-
-    with open(json_path, "w") as f:
-        json.dump(data, f, indent=4)
-
-
-
+    update_metadata_file(json_path, lambda data: data.setdefault("tasks", {}))
 
 
 def add_watermark(params):
@@ -80,10 +137,17 @@ def add_watermark(params):
             - username_position (tuple): Position for username watermark.
             - date_position (tuple): Position for date watermark.
             - timestamp_position (tuple): Position for timestamp watermark.
+            - timestamp_mode (str, optional): "glyph" (default) draws the clock from
+              one time-driven layer; "per_second" uses one label clip per second.
+            - engine (str, optional): "moviepy" (default) or "ffmpeg".
+            - drawtext_font_scale (float, optional): ffmpeg engine font size correction,
+              see drawtext_font_size().
+            - parallel (bool, optional): Encode keyframe-aligned segments in a process pool.
+            - parallel_workers (int, optional): Pool size; defaults to the CPU count.
 
     Returns:
-        dict: A dictionary with the path to the watermarked video under 'to_process',
-              or None if an error occurs.
+        dict: A dictionary with the path to the watermarked video under 'to_process'
+              and the audio decision from select_audio_codec(), or None if an error occurs.
     """
     logger.debug("Received parameters for watermarking.")
     for key, value in params.items():
@@ -93,39 +157,17 @@ def add_watermark(params):
     if not input_video_path:
         raise ValueError("Missing required parameter: 'input_video_path'")
 
+    if params.get("parallel"):
+        return add_watermark_parallel(params)
+
+    if params.get("engine", "moviepy") == "ffmpeg":
+        return add_watermark_ffmpeg(params)
+
     try:
         logger.info(f"Processing video: {input_video_path}")
-        video = VideoFileClip(input_video_path)
-
-        # Create watermark text clips
-        username_clip = TextClip(
-            params["username"],
-            fontsize=params["font_size"],
-            color=params["username_color"],
-            font=params["font"],
-        ).set_position(params["username_position"]).set_duration(video.duration)
-
-        date_clip = TextClip(
-            params["video_date"],
-            fontsize=params["font_size"],
-            color=params["date_color"],
-            font=params["font"],
-        ).set_position(params["date_position"]).set_duration(video.duration)
-
-        # Generate timestamp clips
-        timestamp_clips = []
-        for t in range(int(video.duration)):
-            timestamp = f"{t // 3600:02}:{(t % 3600) // 60:02}:{t % 60:02}"
-            timestamp_clip = TextClip(
-                timestamp,
-                fontsize=params["font_size"],
-                color=params["timestamp_color"],
-                font=params["font"],
-            ).set_position(params["timestamp_position"]).set_start(t).set_duration(1)
-            timestamp_clips.append(timestamp_clip)
+        video = VideoFileClip(input_video_path, audio=False)
 
-        final = CompositeVideoClip([video, username_clip, date_clip] + timestamp_clips)
-        final = final.set_audio(video.audio)
+        final = compose_watermark(video, params)
 
         # Save the watermarked video
         filename, ext = os.path.splitext(os.path.basename(input_video_path))
@@ -133,19 +175,321 @@ def add_watermark(params):
             params["download_path"], f"{filename}_watermarked{ext}"
         )
         codecs = get_codecs_by_extension(ext)
+        audio = select_audio_codec(input_video_path, ext)
         logger.info(f"Exporting watermarked video to: {watermarked_video_path}")
-        final.write_videofile(
-            watermarked_video_path, codec=codecs["video_codec"], audio_codec=codecs["audio_codec"]
-        )
+
+        # moviepy always re-encodes audio, so encode video only and mux the
+        # source audio back in with ffmpeg according to the audio decision.
+        with tempfile.TemporaryDirectory(prefix="watermark_", dir=params["download_path"]) as work_dir:
+            video_only_path = os.path.join(work_dir, f"video_only{ext}")
+            final.write_videofile(video_only_path, codec=codecs["video_codec"], audio=False)
+            mux_audio(video_only_path, input_video_path, watermarked_video_path, audio["audio_codec"])
+        video.close()
 
         logger.info(f"Watermarked video saved to: {watermarked_video_path}")
-        return {"to_process": watermarked_video_path}
+        return {"to_process": watermarked_video_path, **audio}
 
     except Exception as e:
         logger.error(f"Error in add_watermark: {e}")
         logger.debug(traceback.format_exc())
         return None
 
+def add_watermark_parallel(params):
+    """
+    Watermarks a video by encoding keyframe-aligned segments in a process pool.
+
+    The input is split at keyframes into one time range per worker. Each range is
+    watermarked (video only) by the configured engine with its clock offset by the
+    range start, so the timestamp keeps counting from the true start time. The
+    segments are then joined without re-encoding and the source audio is muxed in.
+
+    When the container reports no duration, the last keyframe time bounds the
+    split; without keyframes either, the single-process path is used.
+
+    Args:
+        params (dict): Same parameters as add_watermark(), plus optional
+            'parallel_workers' (int) to size the pool.
+
+    Returns:
+        dict: A dictionary with the path to the watermarked video under 'to_process',
+              or None if an error occurs.
+    """
+    input_video_path = params["input_video_path"]
+
+    try:
+        workers = int(params.get("parallel_workers") or os.cpu_count() or 1)
+        keyframes = keyframe_times(input_video_path)
+        duration = probed = probe_duration(input_video_path)
+        if duration is None:
+            # The container reports N/A; the last keyframe is the best bound we have.
+            if not keyframes:
+                logger.warning(f"⚠️ Duration of {input_video_path} is unknown; watermarking in a single process")
+                return add_watermark({**params, "parallel": False})
+            duration = keyframes[-1]
+            logger.warning(f"⚠️ No container duration for {input_video_path}; using the last keyframe ({duration:.1f}s)")
+        segments = plan_segments(keyframes, duration, workers)
+        if probed is None:
+            # Let the last segment run to the end of the stream instead of the last keyframe.
+            segments[-1] = (segments[-1][0], None)
+        logger.info(f"Watermarking {input_video_path} in {len(segments)} parallel segments")
+
+        filename, ext = os.path.splitext(os.path.basename(input_video_path))
+        watermarked_video_path = os.path.join(
+            params["download_path"], f"{filename}_watermarked{ext}"
+        )
+        audio = select_audio_codec(input_video_path, ext)
+        threads = max(1, (os.cpu_count() or 1) // len(segments))
+
+        with tempfile.TemporaryDirectory(prefix="watermark_", dir=params["download_path"]) as segment_dir:
+            jobs = []
+            for index, (start, end) in enumerate(segments):
+                segment_path = os.path.join(segment_dir, f"segment_{index:04}{ext}")
+                jobs.append((params, start, end, segment_path, threads))
+
+            with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+                segment_paths = list(pool.map(_watermark_segment, jobs))
+
+            logger.info(f"Concatenating {len(segment_paths)} segments into: {watermarked_video_path}")
+            concat_segments(
+                segment_paths,
+                watermarked_video_path,
+                audio_source=input_video_path,
+                audio_codec=audio["audio_codec"],
+            )
+
+        logger.info(f"Watermarked video saved to: {watermarked_video_path}")
+        return {"to_process": watermarked_video_path, **audio}
+
+    except Exception as e:
+        logger.error(f"Error in add_watermark_parallel: {e}")
+        logger.debug(traceback.format_exc())
+        return None
+
+
+def add_watermark_ffmpeg(params):
+    """
+    Adds the watermark text overlays using ffmpeg's drawtext filter.
+
+    Decoding, overlay and encoding all happen inside one ffmpeg process; no frames
+    pass through Python. The running clock is produced by drawtext's own pts
+    expansion.
+
+    Args:
+        params (dict): Same parameters as add_watermark(). An optional 'fontfile'
+            entry overrides the font file the Pillow renderer resolves for 'font',
+            so both engines draw with the same face.
+
+    Returns:
+        dict: A dictionary with the path to the watermarked video under 'to_process',
+              or None if an error occurs.
+    """
+    input_video_path = params["input_video_path"]
+
+    try:
+        logger.info(f"Processing video with ffmpeg engine: {input_video_path}")
+        filename, ext = os.path.splitext(os.path.basename(input_video_path))
+        watermarked_video_path = os.path.join(
+            params["download_path"], f"{filename}_watermarked{ext}"
+        )
+        codecs = get_codecs_by_extension(ext)
+        audio = select_audio_codec(input_video_path, ext)
+
+        with tempfile.TemporaryDirectory(prefix="watermark_") as label_dir:
+            filter_graph = build_drawtext_filter(params, label_dir)
+            logger.debug(f"drawtext filter graph: {filter_graph}")
+            logger.info(f"Exporting watermarked video to: {watermarked_video_path}")
+            run_ffmpeg([
+                "-y",
+                "-i", input_video_path,
+                "-vf", filter_graph,
+                "-c:v", codecs["video_codec"],
+                "-c:a", audio["audio_codec"],
+                watermarked_video_path,
+            ])
+
+        logger.info(f"Watermarked video saved to: {watermarked_video_path}")
+        return {"to_process": watermarked_video_path, **audio}
+
+    except Exception as e:
+        logger.error(f"Error in add_watermark_ffmpeg: {e}")
+        logger.debug(traceback.format_exc())
+        return None
+
+
+def build_drawtext_filter(params: dict, label_dir: str, offset: float = 0) -> str:
+    """
+    Translates the watermark configuration into an ffmpeg drawtext filter chain.
+
+    Label text is written to files in label_dir and referenced with 'textfile', so
+    uploader names never need filter-graph escaping. The clock is built from
+    %{eif:...} expressions on the frame time (see _drawtext_clock()), which
+    drawtext expands for every frame; unlike a gmtime clock its hours keep
+    counting past 24, as format_timestamp() does for the moviepy engine.
+
+    Each label is positioned where the moviepy engine puts the ink of its Pillow
+    bitmap: the position keyword places a box of the bitmap's size (padding and
+    shadow included), and the text is drawn inside it at the bitmap's padding
+    minus the glyph bearings. The shadow option maps to drawtext's shadowx/y.
+
+    Args:
+        params (dict): Watermark parameters (username, video_date, font or fontfile,
+            font_size, the three colors and the three positions; optional shadow
+            and drawtext_font_scale, see drawtext_font_size()).
+        label_dir (str): Existing directory for the generated text files.
+        offset (float): Clock value, in seconds, shown on the first frame.
+
+    Returns:
+        str: The comma-separated drawtext filter chain.
+    """
+    shadow = params.get("shadow")
+    clock_text = format_timestamp(offset)
+    labels = [
+        ("username", params["username"], params["username"], "none", params["username_color"],
+         params["username_position"], shadow),
+        ("date", params["video_date"], params["video_date"], "none", params["date_color"],
+         params["date_position"], shadow),
+        ("timestamp", _drawtext_clock(offset), clock_text, "normal",
+         params["timestamp_color"], params["timestamp_position"], None),
+    ]
+
+    fontfile = params.get("fontfile") or resolve_font_path(params["font"])
+    if fontfile:
+        font_option = f"fontfile={_escape_filter_value(fontfile)}"
+    else:
+        font_option = f"font={_escape_filter_value(params['font'])}"
+    pil_font = load_font(fontfile or params["font"], params["font_size"])
+    font_size = drawtext_font_size(params)
+
+    filters = []
+    for name, text, sample, expansion, color, position, label_shadow in labels:
+        text_path = os.path.join(label_dir, f"{name}.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(str(text))
+
+        # Same box arithmetic as text_render's label bitmaps.
+        left, top, right, bottom = pil_font.getbbox(str(sample) or " ")
+        shadow_offset = int(label_shadow.get("offset", 0)) if label_shadow else 0
+        box_width = right - left + 2 * LABEL_PADDING + shadow_offset
+        box_height = bottom - top + 2 * LABEL_PADDING + shadow_offset
+        if name == "timestamp" and params.get("timestamp_mode", "glyph") != "per_second":
+            # The glyph clock is a row of individually padded glyph bitmaps.
+            glyphs = get_timestamp_glyphs(params["font"], params["font_size"], color)
+            box_width = sum(glyphs[char][0].shape[1] for char in sample)
+            box_height = glyphs["0"][0].shape[0]
+
+        x_pos, y_pos = position
+        x_expr = DRAWTEXT_X.get(x_pos, str(x_pos)).format(size=box_width)
+        y_expr = DRAWTEXT_Y.get(y_pos, str(y_pos)).format(size=box_height)
+        options = [
+            font_option,
+            f"fontsize={font_size}",
+            f"fontcolor={_escape_filter_value(color)}",
+            f"textfile={_escape_filter_value(text_path)}",
+            f"expansion={expansion}",
+            f"x={x_expr}+{LABEL_PADDING - left}",
+            f"y={y_expr}+{LABEL_PADDING - top}",
+        ]
+        if label_shadow:
+            opacity = float(label_shadow.get("opacity", 1.0))
+            options += [
+                f"shadowcolor={_escape_filter_value(label_shadow.get('color', 'black'))}@{opacity:g}",
+                f"shadowx={shadow_offset}",
+                f"shadowy={shadow_offset}",
+            ]
+        filters.append("drawtext=" + ":".join(options))
+
+    return ",".join(filters)
+
+
+def _drawtext_clock(offset: float) -> str:
+    """drawtext text for an HH:MM:SS clock starting at offset seconds, with hours that never wrap."""
+    seconds = f"trunc(t+{offset:g})"
+    return (f"%{{eif:trunc(({seconds})/3600):d:2}}:"
+            f"%{{eif:mod(trunc(({seconds})/60),60):d:2}}:"
+            f"%{{eif:mod({seconds},60):d:2}}")
+
+
+def _escape_filter_value(value) -> str:
+    """Escapes an option value for both the drawtext option and filter-graph levels."""
+    value = str(value)
+    for char in ("\\", ":", "'"):
+        value = value.replace(char, "\\" + char)
+    for char in ("\\", "'", ",", ";", "[", "]"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def compose_watermark(video, params: dict, offset: float = 0) -> CompositeVideoClip:
+    """
+    Layers the username, date and running-clock overlays on top of a video clip.
+
+    Args:
+        video (VideoClip): The clip to watermark.
+        params (dict): Watermark parameters, as described in add_watermark().
+        offset (float): Clock value, in seconds, shown at the start of the clip.
+
+    Returns:
+        CompositeVideoClip: The watermarked clip (audio is not attached).
+    """
+    # Create watermark text clips
+    username_clip = make_label_clip(
+        params["username"], params["font"], params["font_size"], params["username_color"], params.get("shadow")
+    ).set_position(params["username_position"]).set_duration(video.duration)
+
+    date_clip = make_label_clip(
+        params["video_date"], params["font"], params["font_size"], params["date_color"], params.get("shadow")
+    ).set_position(params["date_position"]).set_duration(video.duration)
+
+    # Generate timestamp overlay
+    timestamp_mode = params.get("timestamp_mode", "glyph")
+    if timestamp_mode == "per_second":
+        # Legacy path: one label clip per second of video
+        timestamp_clips = []
+        for t in range(int(video.duration)):
+            timestamp = format_timestamp(offset + t)
+            timestamp_clip = make_label_clip(
+                timestamp, params["font"], params["font_size"], params["timestamp_color"]
+            ).set_position(params["timestamp_position"]).set_start(t).set_duration(1)
+            timestamp_clips.append(timestamp_clip)
+    else:
+        timestamp_clips = [make_timestamp_clip(video.duration, params, offset)]
+
+    return CompositeVideoClip([video, username_clip, date_clip] + timestamp_clips)
+
+
+def drawtext_font_size(params: dict) -> int:
+    """
+    Returns the drawtext fontsize that draws text as large as the moviepy engine.
+
+    Both engines size fonts in pixels through FreeType, so with the same font file
+    the scale is 1. When drawtext has to fall back to a fontconfig match (no file
+    for 'font' was found) the faces differ; 'drawtext_font_scale' corrects for
+    that and is measured with bin/compare_watermark.py --calibrate.
+
+    Args:
+        params (dict): Watermark parameters (font_size, optional drawtext_font_scale).
+
+    Returns:
+        int: The fontsize passed to drawtext.
+    """
+    return max(1, round(params["font_size"] * float(params.get("drawtext_font_scale", 1.0))))
+
+
+def format_timestamp(seconds: int, hour_digits: int = 2) -> str:
+    """
+    Formats a number of seconds as a zero-padded clock string.
+
+    Args:
+        seconds (int): Whole seconds since the start of the video.
+        hour_digits (int): Minimum number of digits used for the hour field.
+
+    Returns:
+        str: The clock string, e.g. "01:02:03".
+    """
+    seconds = int(seconds)
+    return f"{seconds // 3600:0{hour_digits}}:{(seconds % 3600) // 60:02}:{seconds % 60:02}"
+
+
 def get_codecs_by_extension(extension):
     """Determine codecs based on file extension."""
     codecs = {
@@ -157,6 +501,50 @@ def get_codecs_by_extension(extension):
     return codecs.get(extension, {"video_codec": "libx264", "audio_codec": "aac"})
 
 
+def get_timestamp_glyphs(font: str, font_size: int, color: str) -> dict:
+    """
+    Returns pre-rendered glyphs for every character a clock string can contain.
+
+    Glyphs are rendered once per (font, font_size, color) and kept in a module-level
+    cache. All glyphs are padded to a common height, and digits to a common width,
+    so the clock never changes size or jitters while it runs.
+
+    Args:
+        font (str): Font name for the timestamp text.
+        font_size (int): Font size for the timestamp text.
+        color (str): Color of the timestamp text.
+
+    Returns:
+        dict: Mapping of character -> (rgb array HxWx3, alpha array HxW).
+    """
+    key = (font, font_size, color)
+    if key in _glyph_cache:
+        return _glyph_cache[key]
+
+    logger.debug(f"Rendering timestamp glyphs for {key}")
+    rendered = {}
+    for char in TIMESTAMP_GLYPHS:
+        rgba = np.asarray(render_label(char, font, font_size, color))
+        rendered[char] = (rgba[:, :, :3], rgba[:, :, 3] / 255.0)
+
+    height = max(rgb.shape[0] for rgb, _ in rendered.values())
+    digit_width = max(rendered[d][0].shape[1] for d in "0123456789")
+
+    glyphs = {}
+    for char, (rgb, alpha) in rendered.items():
+        width = digit_width if char.isdigit() else rgb.shape[1]
+        padded_rgb = np.zeros((height, width, 3), dtype=rgb.dtype)
+        padded_alpha = np.zeros((height, width), dtype=alpha.dtype)
+        top = (height - rgb.shape[0]) // 2
+        left = (width - rgb.shape[1]) // 2
+        padded_rgb[top:top + rgb.shape[0], left:left + rgb.shape[1]] = rgb
+        padded_alpha[top:top + alpha.shape[0], left:left + alpha.shape[1]] = alpha
+        glyphs[char] = (padded_rgb, padded_alpha)
+
+    _glyph_cache[key] = glyphs
+    return glyphs
+
+
 def load_app_config() -> dict:
     """
     Load the application configuration from a JSON file.
@@ -165,7 +553,7 @@ def load_app_config() -> dict:
         dict: Parsed configuration dictionary.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, "../../conf/app_config.json")
+    config_path = os.path.join(script_dir, "../conf/app_config.json")
 
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Configuration file not found: {config_path}")
@@ -174,14 +562,143 @@ def load_app_config() -> dict:
         return json.load(f)
 
 
-def update_task_output_path(json_path: str, task: str, output_path: str) -> dict:
+def make_label_clip(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> ImageClip:
+    """
+    Builds a static text clip from a Pillow-rendered, cached label bitmap.
+
+    Args:
+        text (str): Label text.
+        font (str): Font name or font file path.
+        font_size (int): Font size in pixels.
+        color (str): Text color.
+        shadow (dict): Optional drop shadow ('color', 'offset', 'opacity').
+
+    Returns:
+        ImageClip: The label with its alpha channel attached as a mask.
+    """
+    return ImageClip(np.asarray(render_label(text, font, font_size, color, shadow)))
+
+
+def make_timestamp_clip(duration: float, params: dict, offset: float = 0) -> VideoClip:
+    """
+    Builds the running-clock overlay as a single time-driven clip.
+
+    Each frame is assembled from the glyph cache, and the assembled bitmap is reused
+    until the displayed second changes, so setup and per-frame compositing cost do
+    not depend on the length of the video.
+
+    Args:
+        duration (float): Duration of the overlay in seconds.
+        params (dict): Watermark parameters (font, font_size, timestamp_color,
+            timestamp_position).
+        offset (float): Clock value, in seconds, shown at t=0.
+
+    Returns:
+        VideoClip: The positioned timestamp clip with its alpha mask attached.
+    """
+    glyphs = get_timestamp_glyphs(params["font"], params["font_size"], params["timestamp_color"])
+    hour_digits = max(2, len(str(int(offset + duration) // 3600)))
+    state = {"second": None, "rgb": None, "alpha": None}
+
+    def render(t):
+        second = int(offset + t)
+        if state["second"] != second:
+            text = format_timestamp(second, hour_digits)
+            state["rgb"] = np.hstack([glyphs[char][0] for char in text])
+            state["alpha"] = np.hstack([glyphs[char][1] for char in text])
+            state["second"] = second
+        return state
+
+    clip = VideoClip(lambda t: render(t)["rgb"], duration=duration)
+    mask = VideoClip(lambda t: render(t)["alpha"], ismask=True, duration=duration)
+    return clip.set_mask(mask).set_position(params["timestamp_position"])
+
+
+def plan_segments(keyframes: list, duration: float, count: int) -> list:
+    """
+    Splits a video into up to `count` time ranges whose boundaries are keyframes.
+
+    Each boundary is the keyframe closest to an even split of the duration.
+    Boundaries that collapse onto the same keyframe are merged, so short or
+    sparsely keyed videos simply get fewer segments.
+
+    Args:
+        keyframes (list): Sorted keyframe times in seconds.
+        duration (float): Total duration in seconds.
+        count (int): Desired number of segments.
+
+    Returns:
+        list: (start, end) tuples covering [0, duration].
+    """
+    boundaries = [0.0]
+    for i in range(1, max(1, count)):
+        target = duration * i / count
+        candidates = [k for k in keyframes if boundaries[-1] < k < duration]
+        if not candidates:
+            break
+        nearest = min(candidates, key=lambda k: abs(k - target))
+        if nearest > boundaries[-1]:
+            boundaries.append(nearest)
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def select_audio_codec(input_video_path: str, ext: str, source_codec: str = None) -> dict:
+    """
+    Decides whether the source audio can be stream-copied into the output container.
+
+    The watermark only touches video, so the audio bitstream is copied unchanged
+    whenever the output container accepts its codec. Otherwise it is transcoded
+    with the container's default audio codec from get_codecs_by_extension().
+
+    Args:
+        input_video_path (str): Source video.
+        ext (str): Output container extension, e.g. ".mp4".
+        source_codec (str): ffmpeg name of the source audio codec when it is
+            already known (e.g. from download metadata); the file is then not probed.
+
+    Returns:
+        dict: 'audio_mode' ("copy", "transcode" or "none"), 'audio_codec' (the
+              ffmpeg -c:a value) and 'source_audio_codec'.
+    """
+    if source_codec is None:
+        try:
+            source_codec = probe_audio_codec(input_video_path)
+        except Exception as e:
+            logger.warning(f"Could not probe audio codec, will transcode: {e}")
+            source_codec = "unknown"
+
+    if source_codec is None:
+        decision = {"audio_mode": "none", "audio_codec": "copy"}
+    else:
+        allowed = AUDIO_COPY_COMPATIBLE.get(ext.lower(), set())
+        if allowed is None or source_codec in allowed:
+            decision = {"audio_mode": "copy", "audio_codec": "copy"}
+        else:
+            decision = {
+                "audio_mode": "transcode",
+                "audio_codec": get_codecs_by_extension(ext)["audio_codec"],
+            }
+
+    decision["source_audio_codec"] = source_codec
+    logger.info(f"Audio decision for {ext}: {decision}")
+    return decision
+
+
+def update_task_output_path(json_path: str, task: str, output_path: str, details: dict = None) -> dict:
     """
     Updates the metadata JSON with an output path for a given task.
 
+    The 'tasks' section is written under the task store's export lock with an
+    atomic replace, so it cannot race a task-state export of the same file.
+    The task's state in 'default_tasks' is tasks_lib.update_task_output_path()'s job.
+
     Args:
         json_path (str): Path to the JSON metadata file.
         task (str): Name of the task performed (e.g., 'apply_watermark').
         output_path (str): File path of the output generated by the task.
+        details (dict): Optional extra fields stored alongside the output path
+            (e.g. the audio copy/transcode decision).
 
     Returns:
         dict: Updated task dictionary for the given task.
@@ -189,13 +706,40 @@ def update_task_output_path(json_path: str, task: str, output_path: str) -> dict
     if not os.path.exists(json_path):
         raise FileNotFoundError(f"Metadata file not found: {json_path}")
 
-    with open(json_path, "r") as f:
-        data = json.load(f)
+    def set_task_entry(data):
+        data.setdefault("tasks", {})[task] = {"output_path": output_path, **(details or {})}
 
-    data.setdefault("tasks", {})
-    data["tasks"][task] = {"output_path": output_path}
+    data = update_metadata_file(json_path, set_task_entry)
+    record_metadata_file(json_path, data)
+    return data["tasks"][task]
 
-    with open(json_path, "w") as f:
-        json.dump(data, f, indent=4)
 
-    return data["tasks"][task]
+def _watermark_segment(job) -> str:
+    """Process-pool worker: watermarks one [start, end) range (end None: to the end) without audio."""
+    params, start, end, segment_path, threads = job
+    input_video_path = params["input_video_path"]
+    _, ext = os.path.splitext(input_video_path)
+    codecs = get_codecs_by_extension(ext)
+
+    if params.get("engine", "moviepy") == "ffmpeg":
+        length = ["-t", f"{end - start:.6f}"] if end is not None else []
+        with tempfile.TemporaryDirectory(prefix="watermark_") as label_dir:
+            run_ffmpeg([
+                "-y",
+                "-ss", f"{start:.6f}",
+                "-i", input_video_path,
+                *length,
+                "-an",
+                "-vf", build_drawtext_filter(params, label_dir, offset=start),
+                "-c:v", codecs["video_codec"],
+                "-threads", str(threads),
+                segment_path,
+            ])
+    else:
+        video = VideoFileClip(input_video_path, audio=False).subclip(start, end)
+        compose_watermark(video, params, offset=start).write_videofile(
+            segment_path, codec=codecs["video_codec"], audio=False, threads=threads, logger=None
+        )
+        video.close()
+
+    return segment_path
@@ -0,0 +1,464 @@
+# ==================================================
+# chunking.py - Automatic chunk boundaries for default clips
+# ==================================================
+#
+# Description:
+# Computes the boundaries used by dispatch.generate_default_clips_yaml to cut a
+# video into roughly chunk_duration-long 'auto_chunks'. Boundaries can be plain
+# fixed splits, or snapped to the nearest scene change or silence gap within a
+# tolerance window; they are then snapped to a nearby keyframe so the chunks
+# can be stream-copied.
+#
+# Scene changes are scored from downscaled grayscale frames sampled by ffmpeg
+# at a low rate, with vectorized NumPy frame-difference and histogram-distance
+# measures computed block by block.
+#
+# Silence gaps come from windowed RMS energy of the audio track, decoded alone
+# at a low sample rate and processed in fixed-size blocks so memory stays flat
+# on multi-hour files.
+#
+# Function List:
+#
+# - boundaries_to_chunks(boundaries: list) -> list
+#     Turns a sorted boundary list into [{'start': ..., 'end': ...}] chunk entries.
+#
+# - choose_boundaries(duration: float, chunk_duration: float, candidates: list, tolerance: float, keyframes: list = None) -> list
+#     Picks one boundary per chunk, preferring the candidate nearest each target.
+#
+# - clip_download_ranges(clips: dict, padding: float = 5, merge_gap: float = 30) -> list
+#     Padded, merged (start, end) source ranges that cover every clip, for partial downloads.
+#
+# - fixed_chunk_boundaries(duration: float, chunk_duration: float, keyframes: list = None) -> list
+#     Evenly spaced boundaries, optionally snapped to the nearest keyframes.
+#
+# - map_to_partial_time(start: float, end: float, partial_ranges: list) -> tuple
+#     Maps a source time interval onto a partial download made of concatenated ranges.
+#
+# - scene_change_times(video_path: str, sample_fps: float = 4, threshold: float = 0.3) -> list
+#     Detects scene changes from sampled, downscaled frames.
+#
+# - scene_chunk_boundaries(video_path: str, duration: float, chunk_duration: float, tolerance: float, keyframes: list = None, sample_fps: float = 4, threshold: float = 0.3) -> list
+#     Chunk boundaries snapped to the nearest scene change within the tolerance window.
+#
+# - silence_chunk_boundaries(video_path: str, duration: float, chunk_duration: float, tolerance: float, keyframes: list = None, threshold_db: float = -40, min_silence: float = 0.3) -> list
+#     Chunk boundaries placed in the silence gap nearest each target length.
+#
+# - silence_gaps(video_path: str, threshold_db: float = -40, min_silence: float = 0.3) -> list
+#     Finds (start, end) silence gaps from a streaming RMS energy pass over the audio.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import time
+import logging
+import tempfile
+import subprocess
+import numpy as np
+
+from media_lib import get_ffmpeg_binary
+from keyframe_index import nearest_keyframe
+
+
+logger = logging.getLogger(__name__)
+
+# Downscaled analysis frame size and the number of frames scored per block.
+SCENE_FRAME_WIDTH = 64
+SCENE_FRAME_HEIGHT = 36
+SCENE_BLOCK_FRAMES = 1024
+SCENE_HISTOGRAM_BINS = 16
+
+# Audio analysis: sample rate, RMS window length (s) and samples read per block.
+SILENCE_SAMPLE_RATE = 8000
+SILENCE_WINDOW = 0.05
+SILENCE_BLOCK_SAMPLES = SILENCE_SAMPLE_RATE * 30
+
+# Keyframes farther than this from a chosen boundary are not snapped to (seconds).
+KEYFRAME_SNAP_WINDOW = 2.0
+
+
+def boundaries_to_chunks(boundaries: list) -> list:
+    """
+    Turns a sorted boundary list into chunk entries.
+
+    Args:
+        boundaries (list): Boundary times, including 0 and the total duration.
+
+    Returns:
+        list: [{'start': float, 'end': float}, ...] in the auto_chunks YAML format.
+    """
+    return [{"start": start, "end": end} for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+
+def choose_boundaries(duration: float, chunk_duration: float, candidates: list, tolerance: float, keyframes: list = None) -> list:
+    """
+    Picks one boundary per chunk, preferring candidate cut points.
+
+    Walking forward from 0, the next target is the previous boundary plus
+    chunk_duration. The candidate nearest that target within +/- tolerance is
+    used; if there is none, the target itself is used. The result is then
+    snapped to a keyframe within KEYFRAME_SNAP_WINDOW when keyframes are given.
+
+    Args:
+        duration (float): Total duration in seconds.
+        chunk_duration (float): Desired chunk length in seconds.
+        candidates (list): Sorted candidate cut times (scene changes, silences...).
+        tolerance (float): Maximum distance from the target, in seconds.
+        keyframes (list): Optional sorted keyframe times.
+
+    Returns:
+        list: Sorted boundaries, starting at 0 and ending at duration.
+    """
+    candidates = np.asarray(sorted(candidates), dtype=float)
+    boundaries = [0]
+    target = chunk_duration
+
+    while target < duration - min(tolerance, chunk_duration / 2):
+        boundary = target
+        if candidates.size:
+            window = candidates[(candidates >= target - tolerance) & (candidates <= target + tolerance)]
+            window = window[window > boundaries[-1]]
+            if window.size:
+                boundary = float(window[np.argmin(np.abs(window - target))])
+
+        if keyframes:
+            keyframe = nearest_keyframe(keyframes, boundary)
+            if abs(keyframe - boundary) <= KEYFRAME_SNAP_WINDOW:
+                boundary = keyframe
+
+        boundary = round(boundary, 3)
+        if boundaries[-1] < boundary < duration:
+            boundaries.append(boundary)
+            target = boundary + chunk_duration
+        else:
+            target += chunk_duration
+
+    boundaries.append(duration)
+    return boundaries
+
+
+def clip_download_ranges(clips: dict, padding: float = 5, merge_gap: float = 30) -> list:
+    """
+    Source time ranges that cover every clip, for partial downloads.
+
+    Each clip interval is widened by padding seconds on both sides so the
+    downloaded range reaches a keyframe before the clip start and the tail
+    frames after its end. Ranges that overlap or lie less than merge_gap
+    seconds apart are merged, since a separate range costs its own request
+    and seek.
+
+    Args:
+        clips (dict): Clips YAML content ({name: [{'start': ..., 'end': ...}, ...]}).
+        padding (float): Seconds added before and after each clip.
+        merge_gap (float): Ranges closer than this are merged.
+
+    Returns:
+        list: Sorted, non-overlapping (start, end) tuples in source seconds.
+    """
+    intervals = sorted(
+        (max(0.0, float(clip["start"]) - padding), float(clip["end"]) + padding)
+        for clip_list in clips.values()
+        for clip in clip_list
+    )
+
+    ranges = []
+    for start, end in intervals:
+        if ranges and start - ranges[-1][1] < merge_gap:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return [(round(start, 3), round(end, 3)) for start, end in ranges]
+
+
+def fixed_chunk_boundaries(duration: float, chunk_duration: float, keyframes: list = None) -> list:
+    """
+    Evenly spaced chunk boundaries.
+
+    Args:
+        duration (float): Total duration in seconds.
+        chunk_duration (float): Chunk length in seconds.
+        keyframes (list): Optional sorted keyframe times; interior boundaries are
+            moved to the nearest one.
+
+    Returns:
+        list: Sorted boundaries, starting at 0 and ending at duration.
+    """
+    boundaries = list(range(0, int(duration), int(chunk_duration))) + [duration]
+    if not keyframes:
+        return boundaries
+
+    snapped = [0]
+    for boundary in boundaries[1:-1]:
+        keyframe = round(nearest_keyframe(keyframes, boundary), 3)
+        if snapped[-1] < keyframe < duration:
+            snapped.append(keyframe)
+    return snapped + [duration]
+
+
+def map_to_partial_time(start: float, end: float, partial_ranges: list) -> tuple:
+    """
+    Maps a source time interval onto a partial download.
+
+    A partial download is the concatenation of downloaded source ranges; each
+    entry of partial_ranges records a range's source 'start'/'end' and the
+    'offset' at which it begins in the partial file.
+
+    Args:
+        start (float): Interval start in source seconds.
+        end (float): Interval end in source seconds.
+        partial_ranges (list): [{'start': ..., 'end': ..., 'offset': ...}, ...] from the metadata.
+
+    Returns:
+        tuple: (start, end) in partial-file seconds, or None if no single range covers the interval.
+    """
+    for part in partial_ranges:
+        if part["start"] <= start and end <= part["end"]:
+            shift = part["offset"] - part["start"]
+            return round(start + shift, 3), round(end + shift, 3)
+    return None
+
+
+def scene_change_times(video_path: str, sample_fps: float = 4, threshold: float = 0.3) -> list:
+    """
+    Detects scene changes in a video.
+
+    ffmpeg decodes the video and emits grayscale frames at sample_fps, scaled to
+    SCENE_FRAME_WIDTH x SCENE_FRAME_HEIGHT. Frames are scored in blocks: each
+    transition gets the mean of the normalized absolute pixel difference and the
+    histogram distance (half the L1 distance of SCENE_HISTOGRAM_BINS-bin
+    histograms). Transitions that score at least `threshold` and are local
+    maxima count as scene changes. Memory use is bounded by the block size.
+
+    Args:
+        video_path (str): The video to analyse.
+        sample_fps (float): Frames sampled per second of video.
+        threshold (float): Minimum score (0-1) of a scene change.
+
+    Returns:
+        list: Sorted times, in seconds, of detected scene changes.
+
+    Raises:
+        RuntimeError: If ffmpeg exits with a non-zero status (its error output is included).
+    """
+    width, height = SCENE_FRAME_WIDTH, SCENE_FRAME_HEIGHT
+    frame_size = width * height
+    cmd = [
+        get_ffmpeg_binary(), "-v", "error", "-threads", "0",
+        # Analysis frames are tiny, so skip the deblocking work in the decoder.
+        "-skip_loop_filter", "all",
+        "-i", video_path, "-an", "-sn",
+        "-vf", f"fps={sample_fps},scale={width}:{height},format=gray",
+        "-f", "rawvideo", "-",
+    ]
+
+    started = time.perf_counter()
+    scores = []
+    previous = None
+    # stderr goes to a file: a pipe nobody reads could fill up and stall ffmpeg.
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                buffer = process.stdout.read(frame_size * SCENE_BLOCK_FRAMES)
+                count = len(buffer) // frame_size
+                if count == 0:
+                    break
+
+                frames = np.frombuffer(buffer[:count * frame_size], dtype=np.uint8).reshape(count, frame_size)
+                if previous is not None:
+                    frames = np.vstack([previous, frames])
+                previous = frames[-1:]
+                if len(frames) < 2:
+                    continue
+
+                pixel_diff = np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=1) / 255.0
+
+                bins = (frames >> (8 - int(np.log2(SCENE_HISTOGRAM_BINS)))).astype(np.int64)
+                bins += SCENE_HISTOGRAM_BINS * np.arange(len(frames))[:, None]
+                histograms = np.bincount(bins.ravel(), minlength=SCENE_HISTOGRAM_BINS * len(frames))
+                histograms = histograms.reshape(len(frames), SCENE_HISTOGRAM_BINS) / frame_size
+                hist_diff = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+
+                scores.append(0.5 * pixel_diff + 0.5 * hist_diff)
+        finally:
+            process.stdout.close()
+            process.wait()
+        _check_ffmpeg_exit(process, stderr_file, video_path)
+
+    if not scores:
+        return []
+
+    scores = np.concatenate(scores)
+    padded = np.concatenate([[0.0], scores, [0.0]])
+    is_peak = (scores >= threshold) & (scores >= padded[:-2]) & (scores > padded[2:])
+    # Transition i leads into sample i + 1.
+    times = (np.nonzero(is_peak)[0] + 1) / float(sample_fps)
+
+    elapsed = time.perf_counter() - started
+    analysed = (len(scores) + 1) / float(sample_fps)
+    logger.info(
+        f"Scene analysis: {len(times)} changes in {analysed:.0f}s of video "
+        f"({elapsed:.1f}s, {analysed / max(elapsed, 1e-6):.1f}x real-time)"
+    )
+    return times.tolist()
+
+
+def scene_chunk_boundaries(video_path: str, duration: float, chunk_duration: float, tolerance: float, keyframes: list = None,
+                           sample_fps: float = 4, threshold: float = 0.3) -> list:
+    """
+    Chunk boundaries snapped to the nearest scene change within the tolerance window.
+
+    Args:
+        video_path (str): The video to analyse.
+        duration (float): Total duration in seconds.
+        chunk_duration (float): Desired chunk length in seconds.
+        tolerance (float): How far, in seconds, a boundary may move toward a scene change.
+        keyframes (list): Optional sorted keyframe times to snap the result to.
+        sample_fps (float): Frames sampled per second for scene analysis.
+        threshold (float): Minimum scene-change score (0-1).
+
+    Returns:
+        list: Sorted boundaries, starting at 0 and ending at duration.
+    """
+    changes = scene_change_times(video_path, sample_fps=sample_fps, threshold=threshold)
+    return choose_boundaries(duration, chunk_duration, changes, tolerance, keyframes)
+
+
+def silence_chunk_boundaries(video_path: str, duration: float, chunk_duration: float, tolerance: float, keyframes: list = None,
+                             threshold_db: float = -40, min_silence: float = 0.3) -> list:
+    """
+    Chunk boundaries placed in the silence gap nearest each target length.
+
+    Each boundary is the centre of the silence gap nearest its target within
+    +/- tolerance seconds. It is moved to a keyframe only when one lies inside
+    the same gap, so a cut never lands in speech just to hit a keyframe.
+
+    Args:
+        video_path (str): The video to analyse.
+        duration (float): Total duration in seconds.
+        chunk_duration (float): Desired chunk length in seconds.
+        tolerance (float): How far, in seconds, a boundary may move toward a silence gap.
+        keyframes (list): Optional sorted keyframe times.
+        threshold_db (float): RMS level, in dBFS, below which audio counts as silent.
+        min_silence (float): Minimum gap length in seconds.
+
+    Returns:
+        list: Sorted boundaries, starting at 0 and ending at duration.
+    """
+    gaps = silence_gaps(video_path, threshold_db=threshold_db, min_silence=min_silence)
+    centres = [(start + end) / 2 for start, end in gaps]
+    boundaries = choose_boundaries(duration, chunk_duration, centres, tolerance)
+
+    if keyframes and gaps:
+        starts = np.asarray([start for start, _ in gaps])
+        for i in range(1, len(boundaries) - 1):
+            gap_index = int(np.searchsorted(starts, boundaries[i], side="right")) - 1
+            if gap_index < 0:
+                continue
+            gap_start, gap_end = gaps[gap_index]
+            keyframe = nearest_keyframe(keyframes, boundaries[i])
+            if gap_start <= keyframe <= gap_end and boundaries[i - 1] < keyframe < boundaries[i + 1]:
+                boundaries[i] = round(keyframe, 3)
+
+    return boundaries
+
+
+def silence_gaps(video_path: str, threshold_db: float = -40, min_silence: float = 0.3) -> list:
+    """
+    Finds silence gaps in the audio track.
+
+    ffmpeg decodes only the audio, downmixed to mono 16-bit PCM at
+    SILENCE_SAMPLE_RATE. Samples are read in fixed-size blocks; each block's RMS
+    energy is computed per SILENCE_WINDOW with NumPy and thresholded, and runs of
+    silent windows are tracked across block edges. Only the gaps themselves are
+    kept, so memory does not grow with the length of the file.
+
+    Args:
+        video_path (str): The media file to analyse.
+        threshold_db (float): RMS level, in dBFS, below which a window is silent.
+        min_silence (float): Minimum gap length in seconds.
+
+    Returns:
+        list: (start, end) tuples, in seconds, of silence gaps.
+
+    Raises:
+        RuntimeError: If ffmpeg exits with a non-zero status (its error output is included).
+    """
+    window = int(SILENCE_SAMPLE_RATE * SILENCE_WINDOW)
+    block_bytes = (SILENCE_BLOCK_SAMPLES // window) * window * 2
+    threshold = 32768.0 * 10 ** (threshold_db / 20.0)
+    cmd = [
+        get_ffmpeg_binary(), "-v", "error",
+        "-i", video_path, "-vn", "-sn",
+        "-ac", "1", "-ar", str(SILENCE_SAMPLE_RATE),
+        "-f", "s16le", "-",
+    ]
+
+    started = time.perf_counter()
+    gaps = []
+    run_start = None  # window index where the current silent run began
+    offset = 0        # window index of the current block's first window
+
+    def close_run(start, end):
+        if (end - start) * SILENCE_WINDOW >= min_silence:
+            gaps.append((start * SILENCE_WINDOW, end * SILENCE_WINDOW))
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                buffer = process.stdout.read(block_bytes)
+                count = len(buffer) // (window * 2)
+                if count == 0:
+                    break
+
+                samples = np.frombuffer(buffer[:count * window * 2], dtype="<i2").reshape(count, window)
+                samples = samples.astype(np.float32)
+                rms = np.sqrt(np.mean(samples * samples, axis=1))
+                silent = (rms < threshold).astype(np.int8)
+
+                edges = np.diff(np.concatenate([[1 if run_start is not None else 0], silent]))
+                starts = np.nonzero(edges == 1)[0]
+                ends = np.nonzero(edges == -1)[0]
+
+                if run_start is not None and ends.size:
+                    close_run(run_start, offset + ends[0])
+                    run_start = None
+                    ends = ends[1:]
+                for start, end in zip(starts, ends):
+                    close_run(offset + start, offset + end)
+                if starts.size > ends.size:
+                    run_start = offset + starts[-1]
+
+                offset += count
+        finally:
+            process.stdout.close()
+            process.wait()
+        _check_ffmpeg_exit(process, stderr_file, video_path)
+
+    if run_start is not None:
+        close_run(run_start, offset)
+
+    elapsed = time.perf_counter() - started
+    analysed = offset * SILENCE_WINDOW
+    logger.info(
+        f"Silence analysis: {len(gaps)} gaps in {analysed:.0f}s of audio "
+        f"({elapsed:.1f}s, {analysed / max(elapsed, 1e-6):.1f}x real-time)"
+    )
+    return [(float(start), float(end)) for start, end in gaps]
+
+
+def _check_ffmpeg_exit(process: subprocess.Popen, stderr_file, video_path: str) -> None:
+    """Raises with ffmpeg's error output if an analysis pass did not finish cleanly."""
+    if process.returncode != 0:
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffmpeg failed on {video_path} ({process.returncode}): {stderr}")
@@ -0,0 +1,254 @@
+# ==================================================
+# download_pipeline.py - Watermark a video while it is still downloading
+# ==================================================
+#
+# Description:
+# For progressive single-file formats (one HTTP(S) URL carrying both audio and
+# video), the download and the ffmpeg watermark encode run at the same time:
+#
+#   network --> <original>.part on disk --> (tail reader) --> ffmpeg stdin
+#
+# The downloader writes to disk at network speed and never waits for the
+# encoder; a reader thread follows the growing file and feeds ffmpeg, waiting
+# whenever it catches up with the download. The encoder therefore starts with
+# the first bytes, memory stays flat however far apart the two run, and the
+# pair finishes in about max(download, encode) instead of their sum.
+#
+# ffmpeg can only decode from a pipe when the container is streamable (e.g.
+# WebM, or MP4 with the moov atom up front). If the encode fails, the download
+# still completes and the caller falls back to the regular watermark task; if
+# the HTTP download fails (expired URL, 403, ...), the caller downloads with
+# yt-dlp instead.
+#
+# Function List:
+#
+# - download_and_watermark(info: dict, output_path: str, watermark_params: dict, chunk_size: int = 1048576) -> dict
+#     Downloads a progressive format to output_path while watermarking it from the same bytes.
+#
+# - is_pipelinable(info: dict) -> bool
+#     Whether a yt-dlp info dict describes a single progressive HTTP(S) download.
+#
+# - yt_dlp_audio_codec(acodec: str) -> str
+#     Maps a yt-dlp acodec string ("mp4a.40.2", "opus") to the ffmpeg codec name.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+import traceback
+
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_PROTOCOLS = ("http", "https")
+PIPELINE_EXTENSIONS = ("mp4", "webm", "mkv", "mov")
+
+# yt-dlp acodec prefixes -> ffmpeg codec names.
+ACODEC_NAMES = {
+    "mp4a": "aac",
+    "aac": "aac",
+    "opus": "opus",
+    "vorbis": "vorbis",
+    "mp3": "mp3",
+    "ac-3": "ac3",
+    "ec-3": "eac3",
+    "flac": "flac",
+}
+
+# How long the tail reader sleeps when it has caught up with the download (seconds).
+TAIL_POLL_INTERVAL = 0.05
+
+
+def download_and_watermark(info: dict, output_path: str, watermark_params: dict, chunk_size: int = 1048576) -> dict:
+    """
+    Downloads a progressive format while watermarking it from the same bytes.
+
+    The original is written to output_path (via a .part file renamed on
+    success); the watermarked copy goes to
+    <download_path>/<name>_watermarked<ext> using the ffmpeg drawtext engine.
+
+    Args:
+        info (dict): yt-dlp info dict for which is_pipelinable() is True.
+        output_path (str): Where the original video is saved.
+        watermark_params (dict): add_watermark() parameters (watermark_config
+            plus username, video_date and download_path).
+        chunk_size (int): Bytes per network read and per write to ffmpeg.
+
+    Returns:
+        dict: 'to_process' (the original) and 'watermark' (the add_watermark()
+        style result dict, or None if the encode failed), or None if the
+        download itself failed (the caller should retry with yt-dlp).
+    """
+    from add_watermark import build_drawtext_filter, get_codecs_by_extension, select_audio_codec
+    from media_lib import get_ffmpeg_binary
+    from url_resolver import get_http_session
+
+    filename, ext = os.path.splitext(os.path.basename(output_path))
+    watermarked_path = os.path.join(watermark_params["download_path"], f"{filename}_watermarked{ext}")
+    part_path = f"{output_path}.part"
+
+    acodec = info.get("acodec")
+    if acodec == "none":
+        audio = {"audio_mode": "none", "audio_codec": "copy", "source_audio_codec": None}
+    else:
+        audio = select_audio_codec(output_path, ext, source_codec=yt_dlp_audio_codec(acodec))
+
+    started = time.perf_counter()
+    download_done = threading.Event()
+    feed_state = {"bytes": 0, "error": None}
+
+    with tempfile.TemporaryDirectory(prefix="watermark_") as label_dir, \
+            tempfile.TemporaryFile() as ffmpeg_log:
+        cmd = [
+            get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+            "-i", "pipe:0",
+            "-vf", build_drawtext_filter({**watermark_params, "input_video_path": output_path}, label_dir),
+            "-c:v", get_codecs_by_extension(ext)["video_codec"],
+            "-c:a", audio["audio_codec"],
+            watermarked_path,
+        ]
+        encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=ffmpeg_log)
+
+        # Create the file before the reader opens it.
+        with open(part_path, "wb"):
+            pass
+        feeder = threading.Thread(
+            target=_feed_encoder, args=(part_path, encoder, download_done, chunk_size, feed_state), daemon=True
+        )
+        feeder.start()
+
+        downloaded = 0
+        try:
+            headers = dict(info.get("http_headers") or {})
+            if info.get("cookies"):
+                headers.setdefault("Cookie", info["cookies"])
+            response = get_http_session().get(info["url"], headers=headers, stream=True, timeout=30)
+            response.raise_for_status()
+            with open(part_path, "ab") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        f.flush()
+                        downloaded += len(chunk)
+            response.close()
+        except Exception as e:
+            logger.error(f"Pipelined download failed: {e}")
+            logger.debug(traceback.format_exc())
+            download_done.set()
+            encoder.kill()
+            encoder.wait()
+            feeder.join()
+            for path in (part_path, watermarked_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return None
+
+        download_done.set()
+        download_seconds = time.perf_counter() - started
+        os.replace(part_path, output_path)
+        logger.info(f"📥 Downloaded {downloaded / 1e6:.1f} MB in {download_seconds:.1f}s; waiting for encoder")
+
+        feeder.join()
+        returncode = encoder.wait()
+        ffmpeg_log.seek(0)
+        stderr = ffmpeg_log.read().decode("utf-8", errors="replace").strip()
+
+    total_seconds = time.perf_counter() - started
+    if returncode != 0 or feed_state["error"]:
+        logger.warning(
+            f"⚠️ Pipelined watermark failed ({feed_state['error'] or stderr or returncode}); "
+            f"the download is complete and can be watermarked normally."
+        )
+        if os.path.exists(watermarked_path):
+            os.remove(watermarked_path)
+        return {"to_process": output_path, "watermark": None}
+
+    logger.info(
+        f"🖼 Pipelined download + watermark finished in {total_seconds:.1f}s "
+        f"(download alone {download_seconds:.1f}s)"
+    )
+    return {"to_process": output_path, "watermark": {"to_process": watermarked_path, **audio}}
+
+
+def is_pipelinable(info: dict) -> bool:
+    """
+    Whether a yt-dlp info dict describes a single progressive HTTP(S) download.
+
+    Merged formats (separate video and audio downloads), fragmented/HLS/DASH
+    protocols and containers ffmpeg cannot encode to in-place are excluded.
+
+    Args:
+        info (dict): The yt-dlp info dict after format selection.
+
+    Returns:
+        bool: True if the bytes can be streamed straight into the encoder.
+    """
+    return (
+        bool(info)
+        and not info.get("requested_formats")
+        and info.get("protocol") in PIPELINE_PROTOCOLS
+        and info.get("ext") in PIPELINE_EXTENSIONS
+        and bool(info.get("url"))
+        and info.get("vcodec") != "none"
+    )
+
+
+def yt_dlp_audio_codec(acodec: str) -> str:
+    """
+    Maps a yt-dlp acodec string to the ffmpeg codec name.
+
+    Args:
+        acodec (str): yt-dlp's codec string, e.g. "mp4a.40.2" or "opus".
+
+    Returns:
+        str: The ffmpeg codec name, or "unknown" (which forces a transcode) if
+        the codec is missing or not recognised.
+    """
+    if not acodec:
+        return "unknown"
+    prefix = acodec.split(".")[0].lower()
+    return ACODEC_NAMES.get(prefix, "unknown")
+
+
+def _feed_encoder(part_path: str, encoder: subprocess.Popen, download_done: threading.Event,
+                  chunk_size: int, feed_state: dict) -> None:
+    """Follows the growing download file and writes its bytes to ffmpeg's stdin."""
+    try:
+        with open(part_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    encoder.stdin.write(chunk)
+                    feed_state["bytes"] += len(chunk)
+                elif download_done.is_set():
+                    # One last read: the download may have finished after the empty read.
+                    chunk = f.read()
+                    if chunk:
+                        encoder.stdin.write(chunk)
+                        feed_state["bytes"] += len(chunk)
+                    break
+                else:
+                    time.sleep(TAIL_POLL_INTERVAL)
+    except BrokenPipeError:
+        feed_state["error"] = "encoder closed its input early"
+    except Exception as e:
+        feed_state["error"] = str(e)
+    finally:
+        try:
+            encoder.stdin.close()
+        except OSError:
+            pass
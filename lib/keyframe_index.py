@@ -0,0 +1,245 @@
+# ==================================================
+# keyframe_index.py - Persistent per-video keyframe/packet index
+# ==================================================
+#
+# Description:
+# Builds a compact binary sidecar (<video>.kfi, next to the video and its
+# metadata JSON) holding the timestamp, byte offset and keyframe flag of every
+# video packet. The sidecar records the video's size and mtime and is rebuilt
+# automatically when the file changes, so clip cutting, chunk generation and
+# parallel encoding can look up seek points without probing the file again.
+#
+# File layout (little-endian):
+#   header  : magic "TKFI", version (u16), packet count (u32),
+#             video size (i64), video mtime_ns (i64)
+#   pts     : count x f64   presentation time in seconds
+#   pos     : count x i64   byte offset in the file (-1 if unknown)
+#   flags   : count x u8    bit 0 set for keyframes
+#
+# Function List:
+#
+# - build_keyframe_index(video_path: str) -> dict
+#     Probes every video packet once and writes the binary sidecar.
+#
+# - index_path_for(video_path: str) -> str
+#     Returns the sidecar path that belongs to a video file.
+#
+# - keyframe_at_or_before(keyframes: list, t: float) -> float
+#     Returns the latest keyframe time that is not after t.
+#
+# - keyframe_times(video_path: str) -> list
+#     Returns sorted keyframe times, building or refreshing the index if needed.
+#
+# - load_keyframe_index(video_path: str, rebuild: bool = True) -> dict
+#     Loads the sidecar if it still matches the video, rebuilding it otherwise.
+#
+# - nearest_keyframe(keyframes: list, t: float) -> float
+#     Returns the keyframe time closest to t.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import sys
+import bisect
+import struct
+import logging
+from array import array
+from typing import Optional
+
+from media_lib import run_ffprobe
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"TKFI"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHIqq")
+FLAG_KEYFRAME = 0x01
+
+
+def build_keyframe_index(video_path: str) -> dict:
+    """
+    Probes every video packet of a file once and writes the binary sidecar.
+
+    Only packet headers are read (no decoding).
+
+    Args:
+        video_path (str): The video to index.
+
+    Returns:
+        dict: The index with 'pts', 'pos', 'flags' arrays and sorted 'keyframes'.
+    """
+    stat = os.stat(video_path)
+    output = run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,pos,flags",
+        "-of", "compact=p=0",
+        video_path,
+    ])
+
+    pts, pos, flags = array("d"), array("q"), array("B")
+    for line in output.splitlines():
+        fields = dict(item.split("=", 1) for item in line.split("|") if "=" in item)
+        pts_time = fields.get("pts_time", "N/A")
+        if pts_time == "N/A":
+            continue
+        pts.append(float(pts_time))
+        offset = fields.get("pos", "N/A")
+        pos.append(int(offset) if offset not in ("", "N/A") else -1)
+        flags.append(FLAG_KEYFRAME if "K" in fields.get("flags", "") else 0)
+
+    index = _make_index(pts, pos, flags, stat.st_size, stat.st_mtime_ns)
+    _write_index(index_path_for(video_path), index)
+    logger.info(f"Indexed {len(pts)} packets ({len(index['keyframes'])} keyframes) for {video_path}")
+    return index
+
+
+def index_path_for(video_path: str) -> str:
+    """
+    Returns the sidecar path that belongs to a video file.
+
+    Args:
+        video_path (str): The indexed video.
+
+    Returns:
+        str: The video path with its extension replaced by ".kfi".
+    """
+    return os.path.splitext(video_path)[0] + ".kfi"
+
+
+def keyframe_at_or_before(keyframes: list, t: float) -> float:
+    """
+    Returns the latest keyframe time that is not after t.
+
+    Args:
+        keyframes (list): Sorted keyframe times.
+        t (float): Time in seconds.
+
+    Returns:
+        float: The keyframe time, or 0.0 if t precedes every keyframe.
+    """
+    index = bisect.bisect_right(keyframes, t) - 1
+    return keyframes[index] if index >= 0 else 0.0
+
+
+def keyframe_times(video_path: str) -> list:
+    """
+    Returns the sorted keyframe times of a video.
+
+    Args:
+        video_path (str): The video to look up.
+
+    Returns:
+        list: Keyframe times in seconds.
+    """
+    return load_keyframe_index(video_path)["keyframes"]
+
+
+def load_keyframe_index(video_path: str, rebuild: bool = True) -> Optional[dict]:
+    """
+    Loads the keyframe index of a video.
+
+    The sidecar is used only if its recorded size and mtime match the video;
+    a missing, stale or unreadable sidecar is rebuilt (unless rebuild is False).
+
+    Args:
+        video_path (str): The indexed video.
+        rebuild (bool): Rebuild the sidecar when it cannot be used.
+
+    Returns:
+        dict | None: The index, or None if it is unusable and rebuild is False.
+    """
+    index_path = index_path_for(video_path)
+    stat = os.stat(video_path)
+
+    if os.path.exists(index_path):
+        try:
+            index = _read_index(index_path)
+            if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+                return index
+            logger.info(f"Keyframe index is stale for {video_path}")
+        except (OSError, ValueError, EOFError, struct.error) as e:
+            # EOFError: array.fromfile() on a sidecar truncated at an item boundary.
+            logger.warning(f"Ignoring unreadable keyframe index {index_path}: {e}")
+
+    return build_keyframe_index(video_path) if rebuild else None
+
+
+def nearest_keyframe(keyframes: list, t: float) -> float:
+    """
+    Returns the keyframe time closest to t.
+
+    Args:
+        keyframes (list): Sorted keyframe times.
+        t (float): Time in seconds.
+
+    Returns:
+        float: The closest keyframe time, or t itself if there are no keyframes.
+    """
+    if not keyframes:
+        return t
+    index = bisect.bisect_left(keyframes, t)
+    candidates = keyframes[max(0, index - 1):index + 1]
+    return min(candidates, key=lambda k: abs(k - t))
+
+
+def _make_index(pts: array, pos: array, flags: array, size: int, mtime_ns: int) -> dict:
+    """Assembles the in-memory index structure."""
+    keyframes = sorted(t for t, flag in zip(pts, flags) if flag & FLAG_KEYFRAME)
+    return {
+        "pts": pts,
+        "pos": pos,
+        "flags": flags,
+        "keyframes": keyframes,
+        "size": size,
+        "mtime_ns": mtime_ns,
+    }
+
+
+def _read_index(index_path: str) -> dict:
+    """Parses a sidecar file."""
+    with open(index_path, "rb") as f:
+        header = f.read(INDEX_HEADER.size)
+        magic, version, count, size, mtime_ns = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"unsupported keyframe index format {magic!r} v{version}")
+        expected = INDEX_HEADER.size + count * (8 + 8 + 1)
+        actual = os.fstat(f.fileno()).st_size
+        if actual != expected:
+            raise ValueError(f"keyframe index is {actual} bytes, expected {expected}")
+
+        pts, pos, flags = array("d"), array("q"), array("B")
+        pts.fromfile(f, count)
+        pos.fromfile(f, count)
+        flags.fromfile(f, count)
+
+    if sys.byteorder == "big":
+        pts.byteswap()
+        pos.byteswap()
+    return _make_index(pts, pos, flags, size, mtime_ns)
+
+
+def _write_index(index_path: str, index: dict) -> None:
+    """Writes a sidecar file atomically."""
+    pts, pos = array("d", index["pts"]), array("q", index["pos"])
+    if sys.byteorder == "big":
+        pts.byteswap()
+        pos.byteswap()
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(pts), index["size"], index["mtime_ns"]))
+        pts.tofile(f)
+        pos.tofile(f)
+        index["flags"].tofile(f)
+    os.replace(tmp_path, index_path)
@@ -0,0 +1,515 @@
+# ==================================================
+# media_lib.py - Thin helpers around the ffmpeg command line tools
+# ==================================================
+#
+# Description:
+# Besides running ffmpeg/ffprobe, this module is the shared media-probe service:
+# probe_media() reads duration, streams, codecs, fps and resolution from the
+# container header only and caches the result in memory and on disk, keyed by
+# path + size + mtime. An entry can be pre-filled from the yt-dlp fields stored
+# in the metadata JSON, so callers that only need approximate facts (chunk
+# planning) never touch the file. The probe_* helpers read through the cache.
+#
+# The disk cache holds at most max_entries entries and drops entries not used
+# for max_age_seconds; replaced or deleted media leave entries nobody reads
+# again, and those age out. The cache is trimmed when a process first writes
+# to it and whenever its in-memory count passes max_entries by
+# PROBE_EVICTION_SLACK, never on every write.
+#
+# Function List:
+#
+# - concat_segments(segment_paths: list, output_path: str, audio_source: str = None, audio_codec: str = "aac", audio_range: tuple = None) -> str
+#     Losslessly joins video segments and optionally muxes in the audio of a source file.
+#
+# - configure_probe_cache(cache_dir: str = None, max_entries: int = None, max_age_seconds: int = None) -> dict
+#     Overrides the on-disk probe cache location, size limit and maximum age.
+#
+# - get_ffmpeg_binary() -> str
+#     Returns the ffmpeg executable moviepy is configured to use.
+#
+# - get_ffprobe_binary() -> str
+#     Returns the ffprobe executable that sits next to the ffmpeg binary.
+#
+# - mux_audio(video_path: str, audio_source: str, output_path: str, audio_codec: str = "copy") -> str
+#     Combines the video stream of one file with the audio stream of another.
+#
+# - probe_audio_codec(path: str) -> str
+#     Returns the codec name of the first audio stream, or None if there is none.
+#
+# - probe_duration(path: str) -> float
+#     Reads the container duration from the file header with ffprobe.
+#
+# - probe_media(path: str, metadata: dict = None, streams: bool = False) -> dict
+#     Returns cached header facts (duration, codecs, fps, resolution, streams) for a media file.
+#
+# - probe_video_codec(path: str) -> str
+#     Returns the codec name of the first video stream, or None if there is none.
+#
+# - probe_video_stream(path: str) -> dict
+#     Returns the encoder-relevant parameters (profile, level, pix_fmt, colour, time base) of the first video stream.
+#
+# - run_ffmpeg(args: list) -> subprocess.CompletedProcess
+#     Runs ffmpeg with the given arguments and raises on a non-zero exit status.
+#
+# - run_ffprobe(args: list) -> str
+#     Runs ffprobe with the given arguments and returns its standard output.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import subprocess
+import tempfile
+import time
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Share of max_entries the disk cache may grow past before it is trimmed.
+PROBE_EVICTION_SLACK = 0.1
+
+_probe_settings = {
+    "cache_dir": "./cache/probe",
+    "max_entries": 5000,
+    "max_age_seconds": 30 * 24 * 3600,
+}
+_probe_memory = {}
+
+# Entries in the disk cache per cache directory, as counted by this process
+# (None until the first trim).
+_probe_counts = {}
+
+
+def concat_segments(segment_paths: list, output_path: str, audio_source: str = None, audio_codec: str = "aac", audio_range: tuple = None) -> str:
+    """
+    Joins segments that share codec parameters without re-encoding them.
+
+    Args:
+        segment_paths (list): Segment files, in playback order.
+        output_path (str): Path of the joined file.
+        audio_source (str): Optional file whose audio track is muxed into the output.
+        audio_codec (str): Codec for the muxed audio track ("copy" to keep the bitstream).
+        audio_range (tuple): Optional (start, end) seconds of audio_source to use.
+
+    Returns:
+        str: The output path.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for segment in segment_paths:
+            escaped = os.path.abspath(segment).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+        list_path = list_file.name
+
+    try:
+        args = ["-y", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_source:
+            if audio_range:
+                args += ["-ss", f"{audio_range[0]:.6f}", "-t", f"{audio_range[1] - audio_range[0]:.6f}"]
+            args += ["-i", audio_source, "-map", "0:v", "-map", "1:a?", "-c:v", "copy", "-c:a", audio_codec]
+        else:
+            args += ["-c", "copy"]
+        run_ffmpeg(args + [output_path])
+    finally:
+        os.remove(list_path)
+
+    return output_path
+
+
+def configure_probe_cache(cache_dir: str = None, max_entries: int = None, max_age_seconds: int = None) -> dict:
+    """
+    Overrides the on-disk probe cache location, size limit and maximum age.
+
+    Args:
+        cache_dir (str): Directory holding one JSON file per probed media file.
+        max_entries (int): Maximum number of entries kept on disk.
+        max_age_seconds (int): Entries not read or written for this long are removed.
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    if cache_dir is not None:
+        _probe_settings["cache_dir"] = cache_dir
+    if max_entries is not None:
+        _probe_settings["max_entries"] = int(max_entries)
+    if max_age_seconds is not None:
+        _probe_settings["max_age_seconds"] = int(max_age_seconds)
+    return dict(_probe_settings)
+
+
+def get_ffmpeg_binary() -> str:
+    """
+    Returns the ffmpeg executable to use.
+
+    Honours the same setting moviepy uses (FFMPEG_BINARY / imageio-ffmpeg) so both
+    engines run the same build, and falls back to "ffmpeg" on the PATH.
+
+    Returns:
+        str: Path or name of the ffmpeg executable.
+    """
+    try:
+        from moviepy.config import get_setting
+
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        return os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+
+def get_ffprobe_binary() -> str:
+    """
+    Returns the ffprobe executable to use.
+
+    Looks next to the configured ffmpeg binary first, then on the PATH.
+
+    Returns:
+        str: Path or name of the ffprobe executable.
+    """
+    ffmpeg = get_ffmpeg_binary()
+    sibling = os.path.join(os.path.dirname(ffmpeg), "ffprobe")
+    if os.path.dirname(ffmpeg) and os.path.exists(sibling):
+        return sibling
+    return os.environ.get("FFPROBE_BINARY") or shutil.which("ffprobe") or "ffprobe"
+
+
+def mux_audio(video_path: str, audio_source: str, output_path: str, audio_codec: str = "copy") -> str:
+    """
+    Combines the video stream of one file with the audio stream of another.
+
+    The video stream is always copied; a missing audio stream is tolerated.
+
+    Args:
+        video_path (str): File providing the video stream.
+        audio_source (str): File providing the audio stream.
+        output_path (str): Path of the combined file.
+        audio_codec (str): Codec for the audio track ("copy" to keep the bitstream).
+
+    Returns:
+        str: The output path.
+    """
+    run_ffmpeg([
+        "-y",
+        "-i", video_path,
+        "-i", audio_source,
+        "-map", "0:v", "-map", "1:a?",
+        "-c:v", "copy", "-c:a", audio_codec,
+        output_path,
+    ])
+    return output_path
+
+
+def probe_audio_codec(path: str):
+    """
+    Returns the codec of the first audio stream.
+
+    Args:
+        path (str): Media file to probe.
+
+    Returns:
+        str | None: Codec name as reported by ffprobe (e.g. "aac", "opus"), or None
+        if the file has no audio stream.
+    """
+    return probe_media(path, streams=True)["audio_codec"]
+
+
+def probe_duration(path: str) -> float:
+    """
+    Reads the container duration from the file header.
+
+    Args:
+        path (str): Media file to probe.
+
+    Returns:
+        float: Duration in seconds.
+    """
+    return probe_media(path)["duration"]
+
+
+def probe_media(path: str, metadata: dict = None, streams: bool = False) -> dict:
+    """
+    Returns header facts about a media file without decoding it.
+
+    Results are looked up in memory, then in the on-disk cache, and only probed
+    with ffprobe (-show_format -show_streams, header only) on a miss. Entries are
+    keyed by absolute path, size and mtime, so a replaced file is probed again.
+
+    When metadata (the video's metadata JSON, with the yt-dlp fields stored by
+    mask_metadata) is given and carries a duration, a missing entry is filled
+    from it instead of probing. Such entries are marked source="metadata" and
+    are only returned to callers that pass metadata themselves; yt-dlp codec
+    names differ from ffprobe's, so they hold no codec or stream details and
+    streams=True always forces a real probe.
+
+    Args:
+        path (str): Media file to probe.
+        metadata (dict): Optional stored metadata to pre-fill the entry from.
+        streams (bool): Require per-stream details and codec names.
+
+    Returns:
+        dict: 'duration', 'format_name', 'video_codec', 'audio_codec', 'width',
+        'height', 'fps', 'streams' (list or None) and 'source'.
+    """
+    stat = os.stat(path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8")
+    ).hexdigest()
+    cache_path = os.path.join(_probe_settings["cache_dir"], f"{key}.json")
+
+    entry = _probe_memory.get(key) or _read_probe_cache(cache_path)
+    if entry and _probe_entry_usable(entry, metadata, streams):
+        _probe_memory[key] = entry
+        return entry
+
+    if metadata and metadata.get("duration") and not streams:
+        entry = _probe_from_metadata(metadata)
+    else:
+        entry = _probe_with_ffprobe(path)
+
+    _probe_memory[key] = entry
+    _write_probe_cache(cache_path, entry)
+    return entry
+
+
+def probe_video_codec(path: str):
+    """
+    Returns the codec of the first video stream.
+
+    Args:
+        path (str): Media file to probe.
+
+    Returns:
+        str | None: Codec name as reported by ffprobe (e.g. "h264", "vp9"), or None
+        if the file has no video stream.
+    """
+    return probe_media(path, streams=True)["video_codec"]
+
+
+def probe_video_stream(path: str) -> Optional[dict]:
+    """
+    Returns the encoder-relevant parameters of the first video stream.
+
+    Used where newly encoded video must be joined to stream-copied video from
+    the same source, so the encode can be made bitstream-compatible. Not
+    cached: it is only needed for the few files being smart-cut.
+
+    Args:
+        path (str): Media file to probe.
+
+    Returns:
+        dict | None: 'codec_name', 'profile', 'level', 'pix_fmt', 'width',
+        'height', 'time_base', 'color_range', 'color_space', 'color_transfer'
+        and 'color_primaries' (values as ffprobe reports them, or None), or
+        None if the file has no video stream.
+    """
+    fields = ("codec_name", "profile", "level", "pix_fmt", "width", "height", "time_base",
+              "color_range", "color_space", "color_transfer", "color_primaries")
+    data = json.loads(run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "stream=" + ",".join(fields),
+        "-of", "json",
+        path,
+    ]) or "{}")
+    streams = data.get("streams") or []
+    if not streams:
+        return None
+    stream = streams[0]
+    return {field: stream.get(field) if stream.get(field) not in ("unknown", "N/A") else None for field in fields}
+
+
+def run_ffmpeg(args: list) -> subprocess.CompletedProcess:
+    """
+    Runs ffmpeg with the given arguments.
+
+    Args:
+        args (list): Arguments passed after the ffmpeg executable.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process.
+
+    Raises:
+        RuntimeError: If ffmpeg exits with a non-zero status.
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error"] + list(args)
+    logger.debug(f"Running: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.strip()}")
+    return result
+
+
+def run_ffprobe(args: list) -> str:
+    """
+    Runs ffprobe with the given arguments.
+
+    Args:
+        args (list): Arguments passed after the ffprobe executable.
+
+    Returns:
+        str: Standard output of ffprobe.
+
+    Raises:
+        RuntimeError: If ffprobe exits with a non-zero status.
+    """
+    cmd = [get_ffprobe_binary(), "-v", "error"] + list(args)
+    logger.debug(f"Running: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed ({result.returncode}): {result.stderr.strip()}")
+    return result.stdout
+
+
+def _parse_rate(rate: str) -> Optional[float]:
+    """Turns an ffprobe frame rate such as "30000/1001" into a float."""
+    try:
+        numerator, _, denominator = str(rate).partition("/")
+        value = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(value, 3) if value > 0 else None
+
+
+def _probe_entry_usable(entry: dict, metadata: Optional[dict], streams: bool) -> bool:
+    """Whether a cached entry answers a request with these requirements."""
+    if entry.get("source") == "ffprobe":
+        return True
+    return metadata is not None and not streams
+
+
+def _probe_from_metadata(metadata: dict) -> dict:
+    """Builds a probe entry from the yt-dlp fields of a metadata JSON."""
+    fps = metadata.get("fps")
+    return {
+        "duration": float(metadata["duration"]),
+        "format_name": metadata.get("ext"),
+        "video_codec": None,
+        "audio_codec": None,
+        "width": metadata.get("width"),
+        "height": metadata.get("height"),
+        "fps": float(fps) if fps else None,
+        "streams": None,
+        "source": "metadata",
+    }
+
+
+def _probe_with_ffprobe(path: str) -> dict:
+    """Reads format and stream headers with a single ffprobe call."""
+    data = json.loads(run_ffprobe([
+        "-show_format", "-show_streams",
+        "-of", "json",
+        path,
+    ]) or "{}")
+    fmt = data.get("format", {})
+
+    stream_list = []
+    for stream in data.get("streams", []):
+        item = {
+            "index": stream.get("index"),
+            "codec_type": stream.get("codec_type"),
+            "codec_name": stream.get("codec_name"),
+        }
+        if stream.get("codec_type") == "video":
+            item["width"] = stream.get("width")
+            item["height"] = stream.get("height")
+            item["fps"] = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+        elif stream.get("codec_type") == "audio":
+            item["channels"] = stream.get("channels")
+            item["sample_rate"] = int(stream["sample_rate"]) if stream.get("sample_rate") else None
+        stream_list.append(item)
+
+    video = next((item for item in stream_list if item["codec_type"] == "video"), {})
+    audio = next((item for item in stream_list if item["codec_type"] == "audio"), {})
+    duration = fmt.get("duration")
+    return {
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "format_name": fmt.get("format_name"),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": video.get("fps"),
+        "streams": stream_list,
+        "source": "ffprobe",
+    }
+
+
+def _read_probe_cache(cache_path: str) -> Optional[dict]:
+    """Loads a probe entry from the disk cache and marks it as recently used."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r") as f:
+            entry = json.load(f)
+        os.utime(cache_path)
+        return entry
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable probe cache {cache_path}: {e}")
+        return None
+
+
+def _write_probe_cache(cache_path: str, entry: dict) -> None:
+    """Stores a probe entry in the disk cache; concurrent writers are safe via rename."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        is_new = not os.path.exists(cache_path)
+        os.replace(tmp_path, cache_path)
+        if is_new:
+            _count_probe_entry(os.path.dirname(cache_path))
+    except OSError as e:
+        logger.warning(f"Could not write probe cache {cache_path}: {e}")
+
+
+def _count_probe_entry(cache_dir: str) -> None:
+    """Counts one new disk cache entry and trims the cache on the first write or once it is too large."""
+    count = _probe_counts.get(cache_dir)
+    max_entries = _probe_settings["max_entries"]
+    if count is None or count + 1 > max_entries + int(max_entries * PROBE_EVICTION_SLACK):
+        _probe_counts[cache_dir] = _evict_probe_cache(cache_dir)
+    else:
+        _probe_counts[cache_dir] = count + 1
+
+
+def _evict_probe_cache(cache_dir: str) -> int:
+    """Removes expired entries, then the least recently used ones down to max_entries; returns how many remain."""
+    cutoff = time.time() - _probe_settings["max_age_seconds"]
+    entries = []
+    removed = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+            if mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+            else:
+                entries.append((mtime, entry.path))
+        except OSError:
+            pass
+
+    excess = len(entries) - _probe_settings["max_entries"]
+    if excess > 0:
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        removed += excess
+    if removed:
+        logger.debug(f"Evicted {removed} probe cache entries from {cache_dir}")
+    return len(entries) - max(excess, 0)
@@ -0,0 +1,327 @@
+# ==================================================
+# metadata_cache.py - Persistent TTL cache for extracted video metadata
+# ==================================================
+#
+# Description:
+# Keeps the normalized metadata produced by teton_lib.mask_metadata() on disk,
+# keyed by "<extractor>:<video id>" (e.g. "Youtube:dQw4w9WgXcQ"), so reruns,
+# dry runs and status queries can answer without contacting the site.
+#
+# A URL alias table maps every URL seen for a video (share links, mobile and
+# canonical URLs, the URL yt-dlp reports) to its key. URLs never seen before
+# are matched offline against yt-dlp's extractor patterns, which yields the
+# same key for most sites without a network call.
+#
+# Entries expire after ttl_seconds. An expired entry is still served for the
+# fields listed in stale_fields (title, uploader, duration, ...), while
+# volatile fields (filesize, bitrates, protocol) are dropped. The cache holds
+# at most max_entries entries and evicts the least recently used ones.
+#
+# Layout:
+#   <cache_dir>/entries/<key hash>.json   one entry per video
+#   <cache_dir>/aliases.json              {url: key}
+#
+# Function List:
+#
+# - cache_key_for_url(url: str) -> str
+#     Returns the cache key for a URL from the alias table or yt-dlp's URL patterns, without network access.
+#
+# - configure_metadata_cache(cache_dir: str = None, ttl_seconds: int = None, max_entries: int = None, stale_fields: list = None) -> dict
+#     Overrides the cache location, TTL, size limit and stale-field policy.
+#
+# - get_cached_metadata(url: str, fields: list = None) -> dict
+#     Returns cached metadata for a URL, honouring the TTL and stale-field policy.
+#
+# - record_alias(url: str, key: str) -> None
+#     Maps another URL to an existing cache key.
+#
+# - store_metadata(url: str, info: dict, metadata: dict, aliases: list = None) -> str
+#     Stores normalized metadata under the info dict's extractor + id and records URL aliases.
+#
+# - url_aliases(url: str) -> list
+#     Returns every known URL of the same video, including url itself.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+_cache_settings = {
+    "cache_dir": "./cache/metadata",
+    "ttl_seconds": 7 * 24 * 3600,
+    "max_entries": 5000,
+    "stale_fields": [
+        "video_title", "video_date", "uploader", "duration", "width", "height",
+        "ext", "resolution", "fps", "channels", "vcodec", "acodec", "asr",
+    ],
+}
+
+# Serializes alias-table updates between threads of one process.
+_alias_lock = threading.Lock()
+
+
+def cache_key_for_url(url: str) -> Optional[str]:
+    """
+    Returns the cache key for a URL without network access.
+
+    The alias table is consulted first. Otherwise the URL is matched against
+    yt-dlp's extractor URL patterns (the generic extractor excluded), whose
+    embedded video id gives the same key an extraction would.
+
+    Args:
+        url (str): Any URL of the video.
+
+    Returns:
+        str | None: "<extractor>:<id>", or None if the URL cannot be keyed offline.
+    """
+    key = _load_aliases().get(url)
+    if key:
+        return key
+
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+
+        for extractor in gen_extractor_classes():
+            if extractor.ie_key() == "Generic" or not extractor.suitable(url):
+                continue
+            video_id = extractor.get_temp_id(url)
+            return f"{extractor.ie_key()}:{video_id}" if video_id else None
+    except Exception as e:
+        logger.debug(f"Offline URL matching failed for {url}: {e}")
+    return None
+
+
+def configure_metadata_cache(cache_dir: str = None, ttl_seconds: int = None, max_entries: int = None,
+                             stale_fields: list = None) -> dict:
+    """
+    Overrides the cache location, TTL, size limit and stale-field policy.
+
+    Args:
+        cache_dir (str): Directory holding entries and the alias table.
+        ttl_seconds (int): Age after which an entry only serves stale_fields.
+        max_entries (int): Maximum number of entries kept on disk.
+        stale_fields (list): Metadata fields that may be served from an expired entry.
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    if cache_dir is not None:
+        _cache_settings["cache_dir"] = cache_dir
+    if ttl_seconds is not None:
+        _cache_settings["ttl_seconds"] = int(ttl_seconds)
+    if max_entries is not None:
+        _cache_settings["max_entries"] = int(max_entries)
+    if stale_fields is not None:
+        _cache_settings["stale_fields"] = list(stale_fields)
+    return dict(_cache_settings)
+
+
+def get_cached_metadata(url: str, fields: list = None) -> Optional[dict]:
+    """
+    Returns cached metadata for a URL.
+
+    A fresh entry is returned whole. An expired entry is reduced to the
+    configured stale_fields; if the caller asks for fields outside that set,
+    it is treated as a miss so the caller goes back to the network.
+
+    Args:
+        url (str): Any URL of the video.
+        fields (list): Fields the caller needs (default: any).
+
+    Returns:
+        dict | None: The metadata, or None on a miss.
+    """
+    key = cache_key_for_url(url)
+    if not key:
+        return None
+
+    entry = _read_entry(key)
+    if not entry:
+        return None
+
+    metadata = entry["metadata"]
+    age = time.time() - entry.get("fetched_at", 0)
+    if age > _cache_settings["ttl_seconds"]:
+        stale_fields = set(_cache_settings["stale_fields"])
+        if fields and not set(fields) <= stale_fields:
+            logger.info(f"Metadata cache entry for {key} is expired ({age / 3600:.1f}h)")
+            return None
+        metadata = {field: value for field, value in metadata.items() if field in stale_fields}
+
+    wanted = fields or metadata.keys()
+    if any(field not in metadata for field in wanted):
+        return None
+
+    logger.info(f"📇 Metadata cache hit for {url} ({key})")
+    return dict(metadata)
+
+
+def record_alias(url: str, key: str) -> None:
+    """
+    Maps another URL to an existing cache key.
+
+    Args:
+        url (str): The URL to add.
+        key (str): The key it belongs to.
+    """
+    _update_aliases({url: key})
+
+
+def store_metadata(url: str, info: dict, metadata: dict, aliases: list = None) -> Optional[str]:
+    """
+    Stores normalized metadata under the info dict's extractor and video id.
+
+    Only the normalized metadata is kept, not the full info dict with its
+    expiring media URLs. The requested URL, the given aliases and the URLs
+    yt-dlp reports (webpage_url, original_url) are all mapped to the key.
+
+    Args:
+        url (str): The URL that was extracted.
+        info (dict): The yt-dlp info dict (for extractor_key, id and reported URLs).
+        metadata (dict): The normalized metadata from mask_metadata().
+        aliases (list): Other URLs of the same video (e.g. the unresolved share link).
+
+    Returns:
+        str | None: The cache key, or None if the info dict has no extractor/id.
+    """
+    extractor = info.get("extractor_key") or info.get("extractor")
+    video_id = info.get("id")
+    if not extractor or video_id is None:
+        return None
+    key = f"{extractor}:{video_id}"
+
+    entry = {
+        "key": key,
+        "fetched_at": time.time(),
+        "webpage_url": info.get("webpage_url"),
+        "metadata": metadata,
+    }
+    entry_path = _entry_path(key)
+    try:
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        _write_json(entry_path, entry)
+        _evict_entries()
+    except OSError as e:
+        logger.warning(f"Could not write metadata cache entry {entry_path}: {e}")
+        return None
+
+    urls = [url, info.get("webpage_url"), info.get("original_url")] + list(aliases or [])
+    _update_aliases({alias: key for alias in urls if alias})
+    return key
+
+
+def url_aliases(url: str) -> list:
+    """
+    Returns every known URL of the same video.
+
+    Args:
+        url (str): Any URL of the video.
+
+    Returns:
+        list: url itself followed by the other URLs mapped to the same key.
+    """
+    aliases = _load_aliases()
+    key = aliases.get(url)
+    if not key:
+        return [url]
+    return [url] + [alias for alias, alias_key in aliases.items() if alias_key == key and alias != url]
+
+
+def _aliases_path() -> str:
+    """Path of the alias table."""
+    return os.path.join(_cache_settings["cache_dir"], "aliases.json")
+
+
+def _entry_path(key: str) -> str:
+    """Path of the entry file for a key (hashed, since ids may contain any character)."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(_cache_settings["cache_dir"], "entries", f"{digest}.json")
+
+
+def _evict_entries() -> None:
+    """Removes the least recently used entries once the cache exceeds max_entries."""
+    entries_dir = os.path.join(_cache_settings["cache_dir"], "entries")
+    entries = [entry for entry in os.scandir(entries_dir) if entry.name.endswith(".json")]
+    excess = len(entries) - _cache_settings["max_entries"]
+    if excess <= 0:
+        return
+
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:excess]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    logger.debug(f"Evicted {excess} metadata cache entries")
+
+
+def _load_aliases() -> dict:
+    """Reads the alias table (empty if missing or unreadable)."""
+    path = _aliases_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable alias table {path}: {e}")
+        return {}
+
+
+def _read_entry(key: str) -> Optional[dict]:
+    """Loads an entry and marks it as recently used."""
+    path = _entry_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)
+        return entry
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable metadata cache entry {path}: {e}")
+        return None
+
+
+def _update_aliases(new_aliases: dict) -> None:
+    """Merges URL -> key mappings into the alias table."""
+    with _alias_lock:
+        aliases = _load_aliases()
+        if all(aliases.get(url) == key for url, key in new_aliases.items()):
+            return
+        aliases.update(new_aliases)
+
+        # Drop aliases whose entry has been evicted.
+        live = {key for key in set(aliases.values()) if os.path.exists(_entry_path(key))}
+        aliases = {url: key for url, key in aliases.items() if key in live}
+        try:
+            os.makedirs(_cache_settings["cache_dir"], exist_ok=True)
+            _write_json(_aliases_path(), aliases)
+        except OSError as e:
+            logger.warning(f"Could not write alias table: {e}")
+
+
+def _write_json(path: str, data: dict) -> None:
+    """Writes a JSON file atomically."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
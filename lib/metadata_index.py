@@ -0,0 +1,433 @@
+# ==================================================
+# metadata_index.py - Persistent lookup index over a metadata directory
+# ==================================================
+#
+# Description:
+# Maps lookup keys to the metadata JSON file that holds them, so finding the
+# metadata for a URL no longer means parsing every file in ./metadata:
+#
+#   url:<url>            the 'url', 'webpage_url', 'original_url' and
+#                        'requested_url' fields
+#   id:<extractor:id>    the 'video_key' field (the metadata cache key)
+#   path:<abs path>      the 'original_filename' and 'to_process' fields
+#
+# The index is kept outside the metadata directory (writing it there would
+# change the directory mtime it relies on), one file per directory:
+#
+#   <cache_dir>/<sha1 of directory>.json
+#     {"version", "dir_mtime_ns",
+#      "files": {name: {"mtime_ns", "size", "keys"}},
+#      "keys":  {key: name}}
+#
+# A lookup is a dict access. When the directory mtime differs from the one
+# recorded (files were added, removed or renamed), the index is refreshed
+# incrementally: every file is stat()ed but only new or changed files are
+# parsed. The tasks_lib writers call record_metadata_file() after each write
+# so their updates are indexed without a rescan.
+#
+# Those updates are appended to a journal next to the index file instead of
+# rewriting it:
+#
+#   <cache_dir>/<sha1 of directory>.journal.jsonl
+#     {"name", "mtime_ns", "size", "keys", "dir_mtime_ns"}   one line per write
+#
+# Readers apply the journal on top of the index file and remember how far
+# they have read, so a lookup only parses lines added since the last one.
+# After JOURNAL_COMPACT_ENTRIES lines (or on any refresh) the journal is
+# folded into the index file and truncated. Updates are made under an fcntl
+# lock so concurrent workers do not drop each other's entries.
+#
+# A lookup that misses does not rescan on its own: new files written through
+# tasks_lib are already journaled. Files changed in place by other tools are
+# picked up once the last full scan is older than rescan_interval seconds
+# (see index_is_stale()) or when the caller forces a refresh.
+#
+# Function List:
+#
+# - configure_metadata_index(cache_dir: str = None, rescan_interval: float = None) -> dict
+#     Overrides where index files are stored and how old a scan may get before a miss rescans.
+#
+# - index_is_stale(metadata_dir: str) -> bool
+#     Whether a miss should trigger a forced rescan (no index, or last full scan older than rescan_interval).
+#
+# - index_keys(data: dict) -> list
+#     Returns the lookup keys a metadata dict is indexed under.
+#
+# - lookup_metadata_file(metadata_dir: str, keys: list) -> str
+#     Returns the metadata file for the first key that is indexed.
+#
+# - record_metadata_file(json_path: str, data: dict) -> None
+#     Journals the index entry of a metadata file that was just written.
+#
+# - refresh_metadata_index(metadata_dir: str, force: bool = False) -> dict
+#     Brings the index up to date with the directory, parsing only new or changed files.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are serialized per process only.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+URL_FIELDS = ("url", "webpage_url", "original_url", "requested_url")
+PATH_FIELDS = ("original_filename", "to_process")
+
+# Journal lines after which record_metadata_file() folds the journal into the index.
+JOURNAL_COMPACT_ENTRIES = 500
+
+_index_settings = {
+    "cache_dir": "./cache/metadata_index",
+    "rescan_interval": 3600,
+}
+
+# Parsed indexes by index path:
+# {"version": (index file mtime_ns, size), "offset": journal bytes applied,
+#  "entries": journal lines applied, "index": index}.
+_loaded = {}
+_thread_lock = threading.Lock()
+
+
+def configure_metadata_index(cache_dir: str = None, rescan_interval: float = None) -> dict:
+    """
+    Overrides where index files are stored and when a miss rescans.
+
+    Args:
+        cache_dir (str): Directory holding one index file per metadata directory.
+        rescan_interval (float): Seconds after a full scan during which a miss
+            is trusted without rescanning (see index_is_stale()).
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    if cache_dir is not None and cache_dir != _index_settings["cache_dir"]:
+        _index_settings["cache_dir"] = cache_dir
+        _loaded.clear()
+    if rescan_interval is not None:
+        _index_settings["rescan_interval"] = float(rescan_interval)
+    return dict(_index_settings)
+
+
+def index_is_stale(metadata_dir: str) -> bool:
+    """
+    Whether a lookup miss should force a rescan of the directory.
+
+    Files written through tasks_lib are journaled as they are written, so a
+    miss is normally final. Only files edited in place by other tools can be
+    missing from an index whose directory mtime still matches; those are
+    picked up once the last full scan is older than rescan_interval.
+
+    Args:
+        metadata_dir (str): The metadata directory.
+
+    Returns:
+        bool: True if there is no index yet or its last full scan is too old.
+    """
+    index = _load_index(_index_path(os.path.abspath(metadata_dir)))
+    if index is None:
+        return True
+    return time.time() - index.get("scanned_at", 0) > _index_settings["rescan_interval"]
+
+
+def index_keys(data: dict) -> list:
+    """
+    Returns the lookup keys a metadata dict is indexed under.
+
+    Args:
+        data (dict): Parsed metadata JSON.
+
+    Returns:
+        list: "url:...", "id:..." and "path:..." keys, without duplicates.
+    """
+    if not isinstance(data, dict):
+        return []
+
+    keys = [f"url:{data[field]}" for field in URL_FIELDS if data.get(field)]
+    if data.get("video_key"):
+        keys.append(f"id:{data['video_key']}")
+    keys += [f"path:{os.path.abspath(data[field])}" for field in PATH_FIELDS
+             if isinstance(data.get(field), str) and data.get(field)]
+    return list(dict.fromkeys(keys))
+
+
+def lookup_metadata_file(metadata_dir: str, keys: list) -> Optional[str]:
+    """
+    Returns the metadata file for the first key that is indexed.
+
+    The index is refreshed first if the directory changed since it was last
+    scanned; otherwise no file in the directory is touched.
+
+    Args:
+        metadata_dir (str): The metadata directory.
+        keys (list): Keys to try in order (see index_keys()).
+
+    Returns:
+        str | None: Path of the metadata JSON, or None if no key is indexed.
+    """
+    if not os.path.isdir(metadata_dir):
+        return None
+
+    index = refresh_metadata_index(metadata_dir)
+    for key in keys:
+        name = index["keys"].get(key)
+        if name:
+            return os.path.join(metadata_dir, name)
+    return None
+
+
+def record_metadata_file(json_path: str, data: dict) -> None:
+    """
+    Journals the index entry of a metadata file that was just written.
+
+    One line is appended to the directory's journal; the index file itself is
+    only rewritten when the journal has grown past JOURNAL_COMPACT_ENTRIES
+    lines. The entry carries the directory mtime after the write, so the
+    writer's own change does not make the next lookup rescan the directory;
+    a file another tool dropped in at the same moment is picked up by the
+    next stale-index rescan instead (see index_is_stale()).
+
+    Does nothing if the file's directory has not been indexed yet; the first
+    lookup will build the index from scratch anyway.
+
+    Args:
+        json_path (str): The metadata JSON that was written.
+        data (dict): Its content.
+    """
+    metadata_dir = os.path.dirname(os.path.abspath(json_path))
+    index_path = _index_path(metadata_dir)
+    if not os.path.exists(index_path):
+        return
+
+    try:
+        with _index_lock(index_path):
+            index = _load_index(index_path)
+            if index is None:
+                return
+            stat = os.stat(json_path)
+            entry = {
+                "name": os.path.basename(json_path),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "keys": index_keys(data),
+                "dir_mtime_ns": os.stat(metadata_dir).st_mtime_ns,
+            }
+            with open(_journal_path(index_path), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            # Pick up our own line (and any we had not seen) through the normal read path.
+            index = _load_index(index_path)
+            if _loaded[index_path]["entries"] >= JOURNAL_COMPACT_ENTRIES:
+                _write_index(index_path, index)
+    except OSError as e:
+        logger.warning(f"Could not update metadata index for {json_path}: {e}")
+
+
+def refresh_metadata_index(metadata_dir: str, force: bool = False) -> dict:
+    """
+    Brings the index up to date with the directory.
+
+    Skipped entirely while the directory mtime matches the recorded one
+    (unless force is set). Otherwise every *.json file is stat()ed; files
+    whose mtime or size changed are re-parsed and removed files are dropped.
+
+    Args:
+        metadata_dir (str): The metadata directory.
+        force (bool): Rescan even if the directory mtime is unchanged (e.g.
+            after a file was edited in place by something else).
+
+    Returns:
+        dict: The index.
+    """
+    metadata_dir = os.path.abspath(metadata_dir)
+    index_path = _index_path(metadata_dir)
+
+    index = _load_index(index_path)
+    dir_mtime_ns = os.stat(metadata_dir).st_mtime_ns
+    if index is not None and index["dir_mtime_ns"] == dir_mtime_ns and not force:
+        return index
+
+    with _index_lock(index_path):
+        index = _load_index(index_path) or {"version": INDEX_VERSION, "dir_mtime_ns": None, "scanned_at": 0,
+                                            "files": {}, "keys": {}}
+        # Re-check under the lock: another worker may have just refreshed it.
+        dir_mtime_ns = os.stat(metadata_dir).st_mtime_ns
+        if index["dir_mtime_ns"] == dir_mtime_ns and not force:
+            return index
+
+        files = index["files"]
+        present = set()
+        parsed = 0
+        for entry in os.scandir(metadata_dir):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            present.add(entry.name)
+            stat = entry.stat()
+            known = files.get(entry.name)
+            if known and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    keys = index_keys(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading {entry.path}: {e}")
+                keys = []
+            files[entry.name] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "keys": keys}
+            parsed += 1
+
+        removed = [name for name in files if name not in present]
+        for name in removed:
+            del files[name]
+
+        # Newest file wins when several claim the same key.
+        index["keys"] = {}
+        for name in sorted(files, key=lambda name: files[name]["mtime_ns"]):
+            for key in files[name]["keys"]:
+                index["keys"][key] = name
+
+        index["dir_mtime_ns"] = dir_mtime_ns
+        index["scanned_at"] = time.time()
+        _write_index(index_path, index)
+
+    logger.info(f"🗂 Metadata index for {metadata_dir}: {len(files)} files, "
+                f"{parsed} parsed, {len(removed)} removed")
+    return index
+
+
+def _add_file(index: dict, name: str, mtime_ns: int, size: int, keys: list) -> None:
+    """Adds a file and its keys to the index (its keys now point at it)."""
+    index["files"][name] = {"mtime_ns": mtime_ns, "size": size, "keys": keys}
+    for key in keys:
+        index["keys"][key] = name
+
+
+def _apply_journal(index_path: str, state: dict) -> None:
+    """Applies journal lines written since state["offset"] to state["index"]."""
+    journal_path = _journal_path(index_path)
+    try:
+        size = os.path.getsize(journal_path)
+    except OSError:
+        size = 0
+    if size <= state["offset"]:
+        return
+
+    index = state["index"]
+    with open(journal_path, "rb") as f:
+        f.seek(state["offset"])
+        chunk = f.read(size - state["offset"])
+    # Stop at the last complete line; a line being appended is read next time.
+    complete = chunk[: chunk.rfind(b"\n") + 1]
+    for line in complete.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping unreadable metadata index journal line in {journal_path}")
+            continue
+        _drop_file(index, entry["name"])
+        _add_file(index, entry["name"], entry["mtime_ns"], entry["size"], entry["keys"])
+        index["dir_mtime_ns"] = entry["dir_mtime_ns"]
+        state["entries"] += 1
+    state["offset"] += len(complete)
+
+
+def _drop_file(index: dict, name: str) -> None:
+    """Removes a file and the keys that point at it."""
+    entry = index["files"].pop(name, None)
+    for key in (entry or {}).get("keys", []):
+        if index["keys"].get(key) == name:
+            del index["keys"][key]
+
+
+@contextmanager
+def _index_lock(index_path: str):
+    """Holds the index's lock (thread lock + fcntl file lock)."""
+    with _thread_lock:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(f"{index_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _index_path(metadata_dir: str) -> str:
+    """Index file of a metadata directory."""
+    digest = hashlib.sha1(os.path.abspath(metadata_dir).encode("utf-8")).hexdigest()
+    return os.path.join(_index_settings["cache_dir"], f"{digest}.json")
+
+
+def _journal_path(index_path: str) -> str:
+    """Journal file next to an index file."""
+    return index_path[: -len(".json")] + ".journal.jsonl"
+
+
+def _load_index(index_path: str) -> Optional[dict]:
+    """
+    Returns the index with its journal applied.
+
+    The index file is re-read only when it changed since the last read;
+    otherwise only journal lines appended since then are parsed.
+    """
+    try:
+        stat = os.stat(index_path)
+    except OSError:
+        return None
+
+    version = (stat.st_mtime_ns, stat.st_size)
+    state = _loaded.get(index_path)
+    if state is None or state["version"] != version or _journal_shrunk(index_path, state):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rebuilding unreadable metadata index {index_path}: {e}")
+            return None
+        if index.get("version") != INDEX_VERSION:
+            return None
+        state = _loaded[index_path] = {"version": version, "offset": 0, "entries": 0, "index": index}
+
+    _apply_journal(index_path, state)
+    return state["index"]
+
+
+def _journal_shrunk(index_path: str, state: dict) -> bool:
+    """Whether the journal was truncated (folded into the index) since it was last read."""
+    try:
+        return os.path.getsize(_journal_path(index_path)) < state["offset"]
+    except OSError:
+        return state["offset"] > 0
+
+
+def _write_index(index_path: str, index: dict) -> None:
+    """Writes the index atomically and empties the journal it now contains (caller holds the lock)."""
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    open(_journal_path(index_path), "w").close()
+    stat = os.stat(index_path)
+    _loaded[index_path] = {"version": (stat.st_mtime_ns, stat.st_size), "offset": 0, "entries": 0, "index": index}
@@ -0,0 +1,154 @@
+# ==================================================
+# path_alloc.py - Concurrency-safe output filename allocation
+# ==================================================
+#
+# Description:
+# Hands out unique file names in a directory ("name.mp4", "name_1.mp4",
+# "name_2.mp4", ...) for many concurrent workers and processes.
+#
+# A name is reserved by creating the file with O_CREAT | O_EXCL, which the
+# filesystem guarantees only one caller can win, so two workers can never be
+# given the same path. To avoid probing every earlier name, each directory
+# keeps a small counter index (.name_index.json: {"<base><ext>": next suffix})
+# updated under an fcntl lock (.name_index.lock), which makes allocation O(1)
+# however many files share a base name. The index is only a hint: a stale or
+# missing index costs extra O_EXCL attempts, never a duplicate.
+#
+# The reserved file is left empty for the caller to overwrite (yt-dlp must be
+# run with "overwrites": True so it does not treat it as already downloaded).
+#
+# Function List:
+#
+# - allocate_output_path(directory: str, filename: str) -> str
+#     Atomically reserves a unique path for filename in directory.
+#
+# - release_output_path(path: str) -> None
+#     Removes a reservation that was never written to.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: O_EXCL still guarantees uniqueness, only the index is unlocked.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".name_index.json"
+LOCK_NAME = ".name_index.lock"
+
+# flock() does not exclude threads of the same process on every platform.
+_thread_lock = threading.Lock()
+
+
+def allocate_output_path(directory: str, filename: str) -> str:
+    """
+    Atomically reserves a unique path for filename in directory.
+
+    Tries "<base><ext>" when the name is new, otherwise "<base>_<n><ext>" from
+    the counter index onwards, creating each candidate with O_EXCL until one
+    succeeds. The counter is then advanced past the reserved name.
+
+    Args:
+        directory (str): Target directory (created if missing).
+        filename (str): Desired file name, e.g. "uploader_20250101.mp4".
+
+    Returns:
+        str: The reserved path; an empty file now exists there.
+    """
+    os.makedirs(directory, exist_ok=True)
+    base, ext = os.path.splitext(filename)
+
+    with _index_lock(directory):
+        index = _read_index(directory)
+        counter = int(index.get(filename, 0))
+        attempts = 0
+        while True:
+            candidate = filename if counter == 0 else f"{base}_{counter}{ext}"
+            path = os.path.join(directory, candidate)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                counter += 1
+                attempts += 1
+                continue
+            os.close(fd)
+            break
+
+        index[filename] = counter + 1
+        _write_index(directory, index)
+
+    if attempts:
+        logger.debug(f"Skipped {attempts} existing names for {filename} (index was behind)")
+    return path
+
+
+def release_output_path(path: str) -> None:
+    """
+    Removes a reservation that was never written to.
+
+    Only an empty file is removed, so a completed download is never deleted.
+    The counter is not rewound; the name simply becomes free for O_EXCL again.
+
+    Args:
+        path (str): A path returned by allocate_output_path().
+    """
+    try:
+        if os.path.exists(path) and os.path.getsize(path) == 0:
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not release {path}: {e}")
+
+
+@contextmanager
+def _index_lock(directory: str):
+    """Holds the directory's index lock (thread lock + fcntl file lock)."""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(directory, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_index(directory: str) -> dict:
+    """Reads the counter index (empty if missing or unreadable)."""
+    path = os.path.join(directory, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Rebuilding unreadable name index {path}: {e}")
+        return {}
+
+
+def _write_index(directory: str, index: dict) -> None:
+    """Writes the counter index atomically (caller holds the lock)."""
+    path = os.path.join(directory, INDEX_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
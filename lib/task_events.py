@@ -0,0 +1,393 @@
+# ==================================================
+# task_events.py - Append-only task event log
+# ==================================================
+#
+# Description:
+# Records task transitions as compact JSON lines instead of rewriting the
+# whole metadata JSON to flip one 'default_tasks' key:
+#
+#   {"ts": ..., "task": "make_clips", "event": "started"}
+#   {"ts": ..., "task": "make_clips", "event": "completed", "output_path": "...", "duration": 41.2}
+#   {"ts": ..., "task": "apply_watermark", "event": "failed", "error": "exit code 1", "duration": 3.0}
+#   {"ts": ..., "event": "seeded", "states": {...}}      default tasks added where missing
+#   {"ts": ..., "event": "snapshot", "states": {...}}    written by compaction
+#
+# Each video has its own log, <log_dir>/<sha1 of metadata path>.jsonl, so a
+# write is one O_APPEND of a single line and a read only replays that video's
+# events. The current states are materialized on read: the metadata file's
+# 'default_tasks', then the latest snapshot, then every later event.
+#
+# Once a log grows past compact_bytes it is compacted: the states are
+# written as a single snapshot line, the replaced lines are appended to
+# <hash>.history.jsonl (keep_history) and, with export_json, the states are
+# also written into the metadata JSON for readers that do not replay logs.
+# Appends share a lock that compaction takes exclusively, so no event is lost
+# when the log is swapped.
+#
+# The event log replaces the JSON and SQLite (task_store) state backends, so
+# it cannot be enabled while task_store's "sqlite" backend is selected.
+#
+# Function List:
+#
+# - compact_task_log(json_path: str, base: dict = None) -> dict
+#     Collapses a video's log into one snapshot line and returns the states.
+#
+# - configure_task_events(enabled: bool = None, log_dir: str = None, compact_bytes: int = None, keep_history: bool = None, export_json: bool = None) -> dict
+#     Enables the event log and sets its location and compaction policy.
+#
+# - get_task_history(json_path: str) -> list
+#     Returns every recorded event of a video, oldest first, including compacted ones.
+#
+# - materialize_task_states(json_path: str, base: dict = None) -> dict
+#     Replays a video's log over its file states and returns the current task states.
+#
+# - record_default_tasks(json_path: str, states: dict) -> dict
+#     Records default task states, applied only to tasks that have no state yet.
+#
+# - record_task_completed(json_path: str, task: str, output_path: str = None, duration: float = None) -> dict
+#     Records a finished task and, if given, the output path it becomes.
+#
+# - record_task_failed(json_path: str, task: str, error: str, duration: float = None) -> dict
+#     Records a failed task run; its state stays as it was.
+#
+# - record_task_started(json_path: str, task: str) -> float
+#     Records the start of a task run and returns its start time.
+#
+# - use_task_events() -> bool
+#     Whether task states are kept in the event log.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from metadata_index import record_metadata_file
+from task_store import update_metadata_file, use_task_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends and compaction are serialized per process only.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+_event_settings = {
+    "enabled": False,
+    "log_dir": "./cache/task_events",
+    "compact_bytes": 64 * 1024,
+    "keep_history": True,
+    "export_json": True,
+}
+
+# In-process stand-in for the shared/exclusive file lock.
+_thread_lock = threading.Lock()
+
+
+def compact_task_log(json_path: str, base: dict = None) -> dict:
+    """
+    Collapses a video's log into one snapshot line.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        base (dict): The file's 'default_tasks', if the caller has already read it.
+
+    Returns:
+        dict: The task states the snapshot holds.
+    """
+    log_path = _log_path(json_path)
+    with _log_lock(log_path, exclusive=True):
+        events = _read_events(log_path)
+        if base is None:
+            base = _file_states(json_path)
+        states = _replay(base, events)
+
+        if _event_settings["keep_history"]:
+            with open(_history_path(log_path), "a", encoding="utf-8") as f:
+                f.writelines(_encode(event) for event in events if event.get("event") != "snapshot")
+
+        if _event_settings["export_json"]:
+            _export_states(json_path, states)
+        # The snapshot stays even after an export, so a reader holding the
+        # file's states from before the export still materializes correctly.
+        tmp_path = f"{log_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_encode({"ts": time.time(), "event": "snapshot", "states": states}))
+        os.replace(tmp_path, log_path)
+
+    logger.info(f"🗜 Compacted task log of {json_path}: {len(events)} events")
+    return states
+
+
+def configure_task_events(enabled: bool = None, log_dir: str = None, compact_bytes: int = None,
+                          keep_history: bool = None, export_json: bool = None) -> dict:
+    """
+    Enables the event log and sets its location and compaction policy.
+
+    Args:
+        enabled (bool): Keep task states in the event log.
+        log_dir (str): Directory holding the per-video logs.
+        compact_bytes (int): Log size after which it is compacted.
+        keep_history (bool): Move compacted events to <hash>.history.jsonl
+            instead of dropping them.
+        export_json (bool): Write the states into the metadata JSON when compacting.
+
+    Returns:
+        dict: The settings now in effect.
+
+    Raises:
+        ValueError: If the log is enabled while task_store's sqlite backend is
+            selected; tasks_lib would read states from one and write them to the other.
+    """
+    if enabled is not None:
+        if enabled and use_task_store():
+            raise ValueError("task_events.enabled cannot be combined with task_store.backend \"sqlite\"")
+        _event_settings["enabled"] = bool(enabled)
+    if log_dir is not None:
+        _event_settings["log_dir"] = log_dir
+    if compact_bytes is not None:
+        _event_settings["compact_bytes"] = int(compact_bytes)
+    if keep_history is not None:
+        _event_settings["keep_history"] = bool(keep_history)
+    if export_json is not None:
+        _event_settings["export_json"] = bool(export_json)
+    return dict(_event_settings)
+
+
+def get_task_history(json_path: str) -> list:
+    """
+    Returns every recorded event of a video, oldest first.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+
+    Returns:
+        list: Compacted events from the history file followed by the live log
+        (snapshot lines excluded).
+    """
+    log_path = _log_path(json_path)
+    with _log_lock(log_path, exclusive=False):
+        events = _read_events(_history_path(log_path)) + _read_events(log_path)
+    return [event for event in events if event.get("event") != "snapshot"]
+
+
+def materialize_task_states(json_path: str, base: dict = None) -> dict:
+    """
+    Replays a video's log over its file states.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        base (dict): The file's 'default_tasks', if the caller has already read
+            it (saves parsing the metadata file again).
+
+    Returns:
+        dict: {task: state} with state True (pending), False (disabled) or the
+        output path (done).
+    """
+    log_path = _log_path(json_path)
+    with _log_lock(log_path, exclusive=False):
+        events = _read_events(log_path)
+    if base is None:
+        base = _file_states(json_path)
+    return _replay(base, events)
+
+
+def record_default_tasks(json_path: str, states: dict) -> dict:
+    """
+    Records default task states.
+
+    They only apply to tasks that have no state yet, so recording the
+    defaults again never resets a completed task.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        states (dict): {task: default state}.
+
+    Returns:
+        dict: The event written.
+    """
+    return _append_event(json_path, {"event": "seeded", "states": dict(states)})
+
+
+def record_task_completed(json_path: str, task: str, output_path: str = None, duration: float = None) -> dict:
+    """
+    Records a finished task.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        task (str): Task name.
+        output_path (str): What the task produced; becomes the task's state.
+            None records the run (e.g. its duration) without changing the state.
+        duration (float): Run time in seconds.
+
+    Returns:
+        dict: The event written.
+    """
+    event = {"task": task, "event": "completed"}
+    if output_path:
+        event["output_path"] = output_path
+    if duration is not None:
+        event["duration"] = round(duration, 3)
+    return _append_event(json_path, event)
+
+
+def record_task_failed(json_path: str, task: str, error: str, duration: float = None) -> dict:
+    """
+    Records a failed task run. The task's state is left as it was.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        task (str): Task name.
+        error (str): What went wrong.
+        duration (float): Run time in seconds.
+
+    Returns:
+        dict: The event written.
+    """
+    event = {"task": task, "event": "failed", "error": str(error)}
+    if duration is not None:
+        event["duration"] = round(duration, 3)
+    return _append_event(json_path, event)
+
+
+def record_task_started(json_path: str, task: str) -> float:
+    """
+    Records the start of a task run.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        task (str): Task name.
+
+    Returns:
+        float: The start time (time.time()), for computing the run's duration.
+    """
+    return _append_event(json_path, {"task": task, "event": "started"})["ts"]
+
+
+def use_task_events() -> bool:
+    """
+    Whether task states are kept in the event log.
+
+    Returns:
+        bool: The enabled setting.
+    """
+    return _event_settings["enabled"]
+
+
+def _append_event(json_path: str, event: dict) -> dict:
+    """Appends one event line, compacting the log once it has grown past compact_bytes."""
+    event = {"ts": time.time(), **event}
+    log_path = _log_path(json_path)
+    line = _encode(event).encode("utf-8")
+
+    with _log_lock(log_path, exclusive=False):
+        # O_APPEND: concurrent appenders each land a whole line at the end.
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    if size > _event_settings["compact_bytes"]:
+        compact_task_log(json_path)
+    return event
+
+
+def _encode(event: dict) -> str:
+    """One compact JSON line."""
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def _export_states(json_path: str, states: dict) -> None:
+    """Writes states into the metadata JSON's 'default_tasks' under the shared metadata lock."""
+    def set_states(data):
+        data["default_tasks"] = states
+
+    try:
+        data = update_metadata_file(json_path, set_states)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Could not export task states to {json_path}: {e}")
+        return
+
+    record_metadata_file(json_path, data)
+
+
+def _file_states(json_path: str) -> dict:
+    """The metadata file's own 'default_tasks' (empty if unreadable)."""
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("default_tasks", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _history_path(log_path: str) -> str:
+    """History file next to a log."""
+    return log_path[: -len(".jsonl")] + ".history.jsonl"
+
+
+@contextmanager
+def _log_lock(log_path: str, exclusive: bool):
+    """Shared lock for appends and reads, exclusive for compaction."""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    if fcntl is None:
+        with _thread_lock:
+            yield
+        return
+    with open(f"{log_path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _log_path(json_path: str) -> str:
+    """Event log of a video, keyed by its absolute metadata path."""
+    digest = hashlib.sha1(os.path.abspath(json_path).encode("utf-8")).hexdigest()
+    return os.path.join(_event_settings["log_dir"], f"{digest}.jsonl")
+
+
+def _read_events(path: str) -> list:
+    """Reads an event file, skipping a torn last line."""
+    if not os.path.exists(path):
+        return []
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping unreadable task event in {path}")
+    return events
+
+
+def _replay(base: dict, events: list) -> dict:
+    """Applies events in order to a copy of the base states."""
+    states = dict(base or {})
+    for event in events:
+        kind = event.get("event")
+        if kind == "snapshot":
+            states.update(event.get("states", {}))
+        elif kind == "seeded":
+            for task, state in event.get("states", {}).items():
+                states.setdefault(task, state)
+        elif kind == "completed" and event.get("output_path"):
+            states[event["task"]] = event["output_path"]
+    return states
@@ -0,0 +1,379 @@
+# ==================================================
+# task_store.py - SQLite task-state backend for tasks_lib
+# ==================================================
+#
+# Description:
+# Keeps the per-video 'default_tasks' states in one SQLite database instead
+# of rewriting each metadata JSON on every change. The database runs in WAL
+# mode, so any number of workers can read while one writes, and each task
+# update is a single-row transaction: two tasks finishing at the same time on
+# the same video no longer overwrite each other's result.
+#
+# Videos are identified by the absolute path of their metadata JSON, the same
+# handle the tasks_lib writers already take. A state is the value tasks_lib
+# has always stored: True (pending), False (disabled) or the output path
+# (done); the derived status column is indexed so "every video whose
+# make_clips is pending" is an index lookup.
+#
+# The backend is selected with app_config "task_store": {"backend": "sqlite"}.
+# With export_json (the default) the states are written back into the
+# metadata JSON after each update, so existing readers keep working.
+#
+# Function List:
+#
+# - configure_task_store(backend: str = None, db_path: str = None, export_json: bool = None) -> dict
+#     Selects the backend and database location.
+#
+# - export_all_task_states() -> int
+#     Writes the stored states of every video back into its metadata JSON.
+#
+# - export_task_states(json_path: str) -> dict
+#     Writes the stored states of one video back into its metadata JSON.
+#
+# - find_tasks(task: str, status: str) -> list
+#     Returns the metadata paths of videos whose task is in the given status.
+#
+# - get_task_states(json_path: str) -> dict
+#     Returns the stored task states of one video.
+#
+# - json_export_enabled() -> bool
+#     Whether states are written back into the metadata JSON after each update.
+#
+# - seed_task_states(json_path: str, states: dict) -> dict
+#     Adds states for tasks the video does not have yet and returns all its states.
+#
+# - set_task_state(json_path: str, task: str, value, seed: dict = None) -> dict
+#     Sets one task's state in its own transaction and returns all the video's states.
+#
+# - task_status(value) -> str
+#     Maps a stored state (True / False / output path) to 'pending', 'disabled' or 'done'.
+#
+# - update_metadata_file(json_path: str, update) -> dict
+#     Applies an in-place change to a metadata JSON under the export lock (atomic replace).
+#
+# - use_task_store() -> bool
+#     Whether the SQLite backend is selected.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: JSON exports are not locked.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+_store_settings = {
+    "backend": "json",
+    "db_path": "./cache/task_state.db",
+    "export_json": True,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_states (
+    json_path  TEXT NOT NULL,
+    task       TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (json_path, task)
+);
+CREATE INDEX IF NOT EXISTS task_states_by_status ON task_states (task, status);
+"""
+
+# One connection per thread; sqlite3 connections must not be shared.
+_local = threading.local()
+_export_thread_lock = threading.Lock()
+
+
+def configure_task_store(backend: str = None, db_path: str = None, export_json: bool = None) -> dict:
+    """
+    Selects the backend and database location.
+
+    Args:
+        backend (str): "json" (state only in the metadata files) or "sqlite".
+        db_path (str): SQLite database file.
+        export_json (bool): Write states back into the metadata JSON after each update.
+
+    Returns:
+        dict: The settings now in effect.
+
+    Raises:
+        ValueError: For an unknown backend, or "sqlite" while the task event
+            log (task_events) is enabled.
+    """
+    if backend is not None:
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"Unknown task_store backend: {backend}")
+        if backend == "sqlite":
+            from task_events import use_task_events  # task_events imports this module
+            if use_task_events():
+                raise ValueError("task_store.backend \"sqlite\" cannot be combined with task_events.enabled")
+        _store_settings["backend"] = backend
+    if db_path is not None and db_path != _store_settings["db_path"]:
+        _store_settings["db_path"] = db_path
+        _local.__dict__.clear()
+    if export_json is not None:
+        _store_settings["export_json"] = bool(export_json)
+    return dict(_store_settings)
+
+
+def export_all_task_states() -> int:
+    """
+    Writes the stored states of every video back into its metadata JSON.
+
+    Returns:
+        int: Number of metadata files written.
+    """
+    rows = _connection().execute("SELECT DISTINCT json_path FROM task_states").fetchall()
+    exported = sum(1 for (json_path,) in rows if export_task_states(json_path) is not None)
+    logger.info(f"📤 Exported task states to {exported} metadata files")
+    return exported
+
+
+def export_task_states(json_path: str) -> Optional[dict]:
+    """
+    Writes the stored states of one video back into its metadata JSON.
+
+    The file's 'default_tasks' section is replaced by the stored states;
+    everything else in it is left alone. Exports are serialized through a lock
+    next to the database and the file is replaced atomically, so readers never
+    see a half-written file and the last exporter writes the latest states.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+
+    Returns:
+        dict | None: The metadata as written, or None if the file is missing.
+    """
+    if not os.path.exists(json_path):
+        logger.warning(f"⚠️ Cannot export task states, metadata file not found: {json_path}")
+        return None
+
+    def apply_states(data):
+        # Runs under the lock, so the last exporter writes the latest states.
+        data["default_tasks"] = {**data.get("default_tasks", {}), **get_task_states(json_path)}
+
+    return update_metadata_file(json_path, apply_states)
+
+
+def find_tasks(task: str, status: str) -> list:
+    """
+    Returns the metadata paths of videos whose task is in the given status.
+
+    Args:
+        task (str): Task name, e.g. "make_clips".
+        status (str): "pending", "disabled" or "done" (see task_status()).
+
+    Returns:
+        list: Metadata JSON paths, oldest update first.
+    """
+    rows = _connection().execute(
+        "SELECT json_path FROM task_states WHERE task = ? AND status = ? ORDER BY updated_at",
+        (task, status),
+    ).fetchall()
+    return [json_path for (json_path,) in rows]
+
+
+def get_task_states(json_path: str) -> dict:
+    """
+    Returns the stored task states of one video.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+
+    Returns:
+        dict: {task: state}; empty if the video has no stored states.
+    """
+    rows = _connection().execute(
+        "SELECT task, value FROM task_states WHERE json_path = ?", (_video_id(json_path),)
+    ).fetchall()
+    return {task: json.loads(value) for task, value in rows}
+
+
+def json_export_enabled() -> bool:
+    """
+    Whether states are written back into the metadata JSON after each update.
+
+    Returns:
+        bool: The export_json setting.
+    """
+    return _store_settings["export_json"]
+
+
+def seed_task_states(json_path: str, states: dict) -> dict:
+    """
+    Adds states for tasks the video does not have yet.
+
+    Existing states are never overwritten, so seeding from a metadata file or
+    the default task list is safe to repeat.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        states (dict): {task: state} to add where missing.
+
+    Returns:
+        dict: All of the video's states afterwards.
+    """
+    with _transaction() as conn:
+        _insert_missing(conn, _video_id(json_path), states or {})
+    return get_task_states(json_path)
+
+
+def set_task_state(json_path: str, task: str, value, seed: dict = None) -> dict:
+    """
+    Sets one task's state in its own transaction.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        task (str): Task name.
+        value: True (pending), False (disabled) or the output path (done).
+        seed (dict): States to add first where missing, e.g. the file's current
+            'default_tasks', so a video's first update does not lose its other tasks.
+
+    Returns:
+        dict: All of the video's states afterwards.
+    """
+    video_id = _video_id(json_path)
+    with _transaction() as conn:
+        _insert_missing(conn, video_id, seed or {})
+        conn.execute(
+            "INSERT INTO task_states (json_path, task, value, status, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (json_path, task) DO UPDATE SET "
+            "value = excluded.value, status = excluded.status, updated_at = excluded.updated_at",
+            (video_id, task, json.dumps(value), task_status(value), time.time()),
+        )
+    return get_task_states(json_path)
+
+
+def task_status(value) -> str:
+    """
+    Maps a stored state to its status.
+
+    Args:
+        value: True, False/None, or an output path.
+
+    Returns:
+        str: "pending", "disabled" or "done".
+    """
+    if value is True:
+        return "pending"
+    if value is False or value is None:
+        return "disabled"
+    return "done"
+
+
+def update_metadata_file(json_path: str, update) -> dict:
+    """
+    Applies an in-place change to a metadata JSON under the export lock.
+
+    The file is read, passed to update() and replaced atomically, all while
+    holding the lock export_task_states() uses, so writers that keep other
+    sections of the file (e.g. the watermark's 'tasks' details) cannot lose
+    an export or be lost by one, whichever backend is selected.
+
+    Args:
+        json_path (str): The video's metadata JSON.
+        update (callable): Called with the parsed metadata dict; modifies it in place.
+
+    Returns:
+        dict: The metadata as written.
+    """
+    with _export_lock():
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        update(data)
+        tmp_path = f"{json_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, json_path)
+    return data
+
+
+def use_task_store() -> bool:
+    """
+    Whether the SQLite backend is selected.
+
+    Returns:
+        bool: True if task states are kept in the database.
+    """
+    return _store_settings["backend"] == "sqlite"
+
+
+def _connection() -> sqlite3.Connection:
+    """Returns this thread's connection, opening the database in WAL mode on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        db_path = _store_settings["db_path"]
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def _export_lock():
+    """Serializes JSON exports between threads and processes."""
+    with _export_thread_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_path = f"{_store_settings['db_path']}.export.lock"
+        os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _insert_missing(conn: sqlite3.Connection, video_id: str, states: dict) -> None:
+    """Inserts states for tasks the video has no row for (caller holds a transaction)."""
+    now = time.time()
+    conn.executemany(
+        "INSERT OR IGNORE INTO task_states (json_path, task, value, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [(video_id, task, json.dumps(value), task_status(value), now) for task, value in states.items()],
+    )
+
+
+@contextmanager
+def _transaction():
+    """Runs a write transaction, taking the write lock up front to avoid upgrade deadlocks."""
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _video_id(json_path: str) -> str:
+    """The key a video is stored under: its metadata path, made absolute."""
+    return os.path.abspath(json_path)
@@ -16,14 +16,20 @@
 #   - should_perform_task(task: str, task_config: dict)                       #
 #     --> Check if a task should be performed based on config                 #
 #                                                                             #
+#   - select_download_format(task_states: dict, download_config: dict)        #
+#     --> Pick the cheapest yt-dlp format that serves every pending task      #
+#                                                                             #
 #   - copy_metadata_to_backup(params: dict)                                   #
 #     --> Copy metadata JSON to backup directory                              #
 #                                                                             #
 #   - extend_metadata_with_task_output(params: dict)                          #
 #     --> Update metadata with task output path                               #
 #                                                                             #
-#   - find_url_json(url, metadata_dir="./metadata")                           #
-#     --> Locate metadata JSON that contains the given URL                    #
+#   - find_url_json(url, metadata_dir="./metadata", rescan=False)             #
+#     --> Locate metadata JSON that contains the given URL or a known alias   #
+#                                                                             #
+#   - find_video_json(video_path, metadata_dir="./metadata", rescan=False)    #
+#     --> Locate metadata JSON recorded for a downloaded video file           #
 #                                                                             #
 #   - get_existing_task_output(task: str, task_config: dict)                  #
 #     --> Retrieve output path for a completed task                           #
@@ -37,6 +43,11 @@
 #   - get_task_states(url, metadata_dir="./metadata")                         #
 #     --> Return all task states from metadata for a given URL                #
 #                                                                             #
+#   With app_config task_store.backend = "sqlite", the writers above keep     #
+#   task states in task_store.py (SQLite, WAL) and export them to the JSON.   #
+#   With task_events.enabled they append to task_events.py's per-video log    #
+#   instead (takes precedence); states are replayed from it on read.          #
+#                                                                             #
 #   Author:        Aldebaran                                                  #
 #   Created:       2025-03-18                                                 #
 #   Last Modified: 2025-03-25                                                 #
@@ -48,6 +59,19 @@ import os
 import json
 import logging
 import shutil
+import traceback
+
+from metadata_cache import cache_key_for_url, url_aliases
+from metadata_index import index_is_stale, lookup_metadata_file, record_metadata_file, refresh_metadata_index
+from task_events import materialize_task_states, record_default_tasks, record_task_completed, use_task_events
+from task_store import (
+    export_task_states,
+    get_task_states as get_stored_task_states,
+    json_export_enabled,
+    seed_task_states,
+    set_task_state,
+    use_task_store,
+)
 
 # Initialize the logger
 logger = logging.getLogger(__name__)
@@ -90,6 +114,62 @@ def should_perform_task(task: str, task_config: dict) -> bool:
     return val is True
 
 
+# What each task reads from the downloaded file. Tasks not listed here
+# (e.g. perform_download itself) place no requirement on the format.
+TASK_MEDIA_NEEDS = {
+    "apply_watermark": "video",
+    "make_clips": "video",
+    "post_process": "video",
+    "post_processed": "video",
+    "extract_audio": "audio",
+    "generate_captions": "audio",
+}
+
+
+def select_download_format(task_states: dict, download_config: dict) -> dict:
+    """
+    Picks the cheapest yt-dlp format that still serves every pending task.
+
+    A task is pending when its flag is True (enabled, not yet done). If only
+    audio consumers are pending, an audio-only format is used. Otherwise the
+    video height is capped at the largest cap among pending video tasks
+    (video_download.task_max_height; a video task without a cap keeps the
+    configured format). With no pending consumers at all, the configured
+    format is kept.
+
+    Args:
+        task_states (dict): Task flags, e.g. the 'default_tasks' section.
+        download_config (dict): The 'video_download' section of app_config.json.
+
+    Returns:
+        dict: 'download_format' (yt-dlp format string) and
+        'download_format_reason' (human-readable explanation).
+    """
+    default_format = download_config.get("format", "bestvideo+bestaudio/best")
+    audio_format = download_config.get("audio_format", "bestaudio/best")
+    max_heights = download_config.get("task_max_height", {})
+
+    pending = [task for task, state in task_states.items() if state is True and task in TASK_MEDIA_NEEDS]
+    video_tasks = [task for task in pending if TASK_MEDIA_NEEDS[task] == "video"]
+
+    if not pending:
+        chosen = (default_format, "no pending tasks read the media; using the configured format")
+    elif not video_tasks:
+        chosen = (audio_format, f"only audio tasks pending ({', '.join(pending)})")
+    elif any(not max_heights.get(task) for task in video_tasks):
+        uncapped = [task for task in video_tasks if not max_heights.get(task)]
+        chosen = (default_format, f"full configured quality needed by {', '.join(uncapped)}")
+    else:
+        height = max(int(max_heights[task]) for task in video_tasks)
+        chosen = (
+            f"bestvideo[height<=?{height}]+bestaudio/best[height<=?{height}]/best",
+            f"video capped at {height}p for {', '.join(video_tasks)}",
+        )
+
+    logger.info(f"🎚 Download format: {chosen[0]} ({chosen[1]})")
+    return {"download_format": chosen[0], "download_format_reason": chosen[1]}
+
+
 def copy_metadata_to_backup(params: dict) -> dict:
     """
     Copies the original metadata JSON to the backup directory after a task is completed.
@@ -147,6 +227,7 @@ def extend_metadata_with_task_output(params: dict) -> dict:
         # Save the updated data back to the JSON file
         with open(json_path, "w") as f:
             json.dump(data, f, indent=4)
+        record_metadata_file(json_path, data)
 
         return {"updated_metadata": json_path}
     except Exception as e:
@@ -155,9 +236,17 @@ def extend_metadata_with_task_output(params: dict) -> dict:
         return {"updated_metadata": None}
 
 
-def find_url_json(url, metadata_dir="./metadata"):
+def find_url_json(url, metadata_dir="./metadata", rescan=False):
     """
-    Search for a JSON file in the metadata directory that contains the given URL.
+    Find the JSON file in the metadata directory that contains the given URL.
+
+    Share links and canonical URLs of the same video (from the metadata
+    cache's alias table) match as well, as does a file recorded under the
+    same extractor + video id. Lookups go through the persistent metadata
+    index, so no file other than the match is read.
+
+    A miss is final unless the index is stale (see index_is_stale()) or
+    rescan is set, e.g. after a metadata file was edited by hand.
     """
     logger.info(f"🔍 Searching for URL '{url}' in {metadata_dir}")
 
@@ -165,22 +254,110 @@ def find_url_json(url, metadata_dir="./metadata"):
         logger.warning(f"Metadata directory not found: {metadata_dir}")
         return None, None
 
-    for filename in os.listdir(metadata_dir):
-        if filename.endswith(".json"):
-            json_path = os.path.join(metadata_dir, filename)
+    candidates = url_aliases(url)
+    lookups = [([f"url:{candidate}" for candidate in candidates], lambda data: data.get("url") in candidates)]
+    video_key = cache_key_for_url(url)
+    if video_key:
+        lookups.append(([f"id:{video_key}"], lambda data: data.get("video_key") == video_key))
+
+    for attempt in range(2):
+        for keys, matches in lookups:
+            json_path, data = _load_indexed_json(metadata_dir, keys, matches, rescan_on_miss=False)
+            if json_path:
+                return json_path, data
+        if attempt == 0:
+            # A file edited in place without a directory change is not picked
+            # up by the mtime check; rescan once if asked to or if the last
+            # full scan is old enough that such an edit may have been missed.
+            if not (rescan or index_is_stale(metadata_dir)):
+                break
+            logger.info(f"🗂 URL not in the metadata index; rescanning {metadata_dir} once")
+            refresh_metadata_index(metadata_dir, force=True)
+
+    logger.warning(f"⚠️ URL not found in metadata directory.")
+    return None, None
+
+
+def find_video_json(video_path, metadata_dir="./metadata", rescan=False):
+    """
+    Find the metadata JSON recorded for a downloaded video file.
+
+    Args:
+        video_path (str): The video file (its 'original_filename' or 'to_process').
+        metadata_dir (str): The directory where metadata JSON files are stored.
+        rescan (bool): Rescan the directory on a miss even if the index is not stale.
+
+    Returns:
+        tuple: (json_path, data), or (None, None) if no metadata refers to the file.
+    """
+    if not os.path.exists(metadata_dir):
+        return None, None
+
+    abs_path = os.path.abspath(video_path)
+    return _load_indexed_json(
+        metadata_dir,
+        [f"path:{abs_path}"],
+        lambda data: abs_path in (os.path.abspath(data[field]) for field in ("original_filename", "to_process")
+                                  if isinstance(data.get(field), str) and data.get(field)),
+        rescan_on_miss=rescan or index_is_stale(metadata_dir),
+    )
+
+
+def _load_indexed_json(metadata_dir, keys, matches, rescan_on_miss=False):
+    """
+    Loads the indexed metadata file for keys and checks it still matches.
+
+    A file edited in place by something other than the tasks_lib writers may
+    no longer hold the key it was indexed under, or may have gained one
+    without the directory mtime changing. The index is then rescanned once
+    (forced, still only parsing changed files) and the lookup retried. A
+    plain miss is rescanned the same way only when rescan_on_miss is set
+    (the caller asked for it or the index is stale); otherwise it returns at
+    once.
+    """
+    for attempt in range(2):
+        json_path = lookup_metadata_file(metadata_dir, keys)
+        if json_path:
             try:
                 with open(json_path, "r", encoding="utf-8") as file:
                     data = json.load(file)
-                    if isinstance(data, dict) and "url" in data and data["url"] == url:
-                        logger.info(f"✅ URL found in: {json_path}")
-                        return json_path, data
+                if isinstance(data, dict) and matches(data):
+                    logger.info(f"✅ Found in: {json_path}")
+                    if use_task_events():
+                        data["default_tasks"] = materialize_task_states(json_path, base=data.get("default_tasks", {}))
+                    elif use_task_store():
+                        # The store is authoritative; the file may not be exported yet.
+                        data.setdefault("default_tasks", {}).update(get_stored_task_states(json_path))
+                    return json_path, data
             except (json.JSONDecodeError, IOError) as e:
                 logger.error(f"Error reading {json_path}: {e}")
+            reason = f"Metadata index entry for {json_path} is out of date"
+        elif not rescan_on_miss:
+            return None, None
+        else:
+            reason = f"No metadata index entry for {keys[0] if keys else 'lookup'}"
 
-    logger.warning(f"⚠️ URL not found in metadata directory.")
+        if attempt == 0:
+            logger.info(f"🗂 {reason}; rescanning")
+            refresh_metadata_index(metadata_dir, force=True)
     return None, None
 
 
+def _store_task_state(json_path, data, task, value):
+    """
+    Records one task state in the SQLite task store (its own transaction).
+
+    The file's current 'default_tasks' seed the store on a video's first
+    update. With JSON export on, the stored states are written back to the
+    file and the metadata index entry is refreshed.
+    """
+    set_task_state(json_path, task, value, seed=data.get("default_tasks"))
+    if json_export_enabled():
+        data = export_task_states(json_path) or data
+        record_metadata_file(json_path, data)
+    return data
+
+
 #def get_existing_task_output(task: str, task_config: dict) -> str | None:
 #  ^^^ don't let this happen easily the bar is trouble, breaks things
 from typing import Optional
@@ -236,6 +413,12 @@ def extend_metadata_with_task_output(params: dict) -> dict:
         logger.warning("⚠️ Metadata file not found for extension.")
         return {"updated_metadata": None}
 
+    if use_task_events() and task and output_path:
+        # One appended line instead of rewriting the metadata file.
+        record_task_completed(json_path, task, output_path)
+        logger.info(f"✅ Marked task '{task}' as completed: {output_path}")
+        return {"updated_metadata": json_path}
+
     try:
         with open(json_path, "r") as f:
             data = json.load(f)
@@ -245,6 +428,11 @@ def extend_metadata_with_task_output(params: dict) -> dict:
             f"default_tasks BEFORE update: {json.dumps(data.get('default_tasks', {}), indent=2)}"
         )
 
+        if use_task_store() and "default_tasks" in data and task and output_path:
+            _store_task_state(json_path, data, task, output_path)
+            logger.info(f"✅ Marked task '{task}' as completed: {output_path}")
+            return {"updated_metadata": json_path}
+
         if "default_tasks" in data and task and output_path:
             data["default_tasks"][task] = output_path
             logger.info(f"✅ Marked task '{task}' as completed: {output_path}")
@@ -260,6 +448,7 @@ def extend_metadata_with_task_output(params: dict) -> dict:
 
         with open(json_path, "w") as f:
             json.dump(data, f, indent=4)
+        record_metadata_file(json_path, data)
 
         return {"updated_metadata": json_path}
     except Exception as e:
@@ -299,6 +488,11 @@ def add_default_tasks_to_metadata(
         logger.error(f"❌ Metadata file not found: {metadata_path}")
         return {"updated_metadata": None}
 
+    if use_task_events():
+        record_default_tasks(metadata_path, default_tasks)
+        logger.info(f"✅ Default tasks recorded in the task log for: {metadata_path}")
+        return {"updated_metadata": metadata_path}
+
     try:
         with open(metadata_path, "r") as f:
             metadata = json.load(f)
@@ -306,6 +500,15 @@ def add_default_tasks_to_metadata(
         logger.error(f"❌ Error parsing {metadata_path}: {e}")
         return {"updated_metadata": None}
 
+    if use_task_store():
+        # Stored states win, then the file's own; defaults only fill gaps.
+        states = seed_task_states(metadata_path, {**default_tasks, **metadata.get("default_tasks", {})})
+        if json_export_enabled():
+            metadata = export_task_states(metadata_path) or metadata
+            record_metadata_file(metadata_path, metadata)
+        logger.info(f"✅ Default tasks stored for {metadata_path}: {states}")
+        return {"updated_metadata": metadata_path}
+
     # Add the default tasks to the metadata if they're not already there
     if "default_tasks" not in metadata:
         metadata["default_tasks"] = {}
@@ -319,6 +522,7 @@ def add_default_tasks_to_metadata(
     try:
         with open(metadata_path, "w") as f:
             json.dump(metadata, f, indent=4)
+        record_metadata_file(metadata_path, metadata)
         logger.info(
             f"✅ Metadata updated with default tasks. Saved to: {metadata_path}"
         )
@@ -351,10 +555,20 @@ def update_task_output_path(metadata_path: str, task: str, output_path: str) ->
         logger.warning("⚠️ No output path provided — cannot update metadata.")
         return {"updated_metadata": None}
 
+    if use_task_events():
+        record_task_completed(metadata_path, task, output_path)
+        logger.info(f"✅ Task '{task}' updated to: {output_path}")
+        return {"updated_metadata": metadata_path}
+
     try:
         with open(metadata_path, "r") as f:
             metadata = json.load(f)
 
+        if use_task_store() and "default_tasks" in metadata:
+            _store_task_state(metadata_path, metadata, task, output_path)
+            logger.info(f"✅ Task '{task}' updated to: {output_path}")
+            return {"updated_metadata": metadata_path}
+
         if "default_tasks" in metadata:
             metadata["default_tasks"][task] = output_path
             logger.info(f"✅ Task '{task}' updated to: {output_path}")
@@ -363,6 +577,7 @@ def update_task_output_path(metadata_path: str, task: str, output_path: str) ->
 
         with open(metadata_path, "w") as f:
             json.dump(metadata, f, indent=4)
+        record_metadata_file(metadata_path, metadata)
 
         return {"updated_metadata": metadata_path}
     except Exception as e:
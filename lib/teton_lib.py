@@ -28,12 +28,18 @@
 # - create_subdir(base_dir: str = "clips", subdir_name: str = "orange") -> str
 #    Creates a subdirectory with a custom name inside a timestamped folder based on the input video name.
 #
-# - download_video(params: dict) -> dict
-#    Downloads a video from a given URL using yt-dlp.
+# - download_video(params: dict, info: dict = None, ydl: yt_dlp.YoutubeDL = None) -> dict
+#    Downloads a video using yt-dlp, reusing an already extracted info dict and YoutubeDL instance when given.
 #
-# - extract_metadata(params: dict) -> dict
+# - download_video_ranges(params: dict, ranges: list, info: dict = None) -> dict
+#    Downloads only the given time ranges and joins them into one partial file with an offset map.
+#
+# - extract_metadata(params: dict, info: dict = None) -> dict
 #    Extracts all available metadata from a YouTube video without downloading it and saves it to a file.
 #
+# - extract_video_info(params: dict, ydl: yt_dlp.YoutubeDL = None) -> dict
+#    Runs the single yt-dlp extraction for a URL and returns the info dict.
+#
 # - generate_minute_clips_to_yaml(json_metadata_path: str, output_yaml_path: str = None, interval_seconds: int = 60) -> str
 #    Generate 1-minute interval clips based on metadata duration and save to a YAML file.
 #
@@ -46,11 +52,14 @@
 # - load_config() -> dict
 #    Load configuration based on the operating system.
 #
-# - mask_metadata(params: dict) -> dict
+# - make_youtube_dl(params: dict) -> yt_dlp.YoutubeDL
+#    Creates a YoutubeDL instance that can both extract and download, for reuse across URLs.
+#
+# - mask_metadata(params: dict, info: dict = None) -> dict
 #    Masks certain metadata for privacy and returns the masked data.
 #
 # - resolve_fb_share_url(url: str) -> str:
-#    Follow Facebook share link redirection to get actual video URL.
+#    Follow Facebook share link redirection to get actual video URL (cached, pooled session).
 #
 # - resolve_path(path: str, base: str = None) -> str:
 #    Resolves a possibly relative path to an absolute one, relative to a base directory.
@@ -62,7 +71,7 @@
 #    Stores the params dictionary as a JSON file in the output directory. The filename should match the video file, but with a .json extension.
 #
 # - unique_output_path(path: str, filename: str) -> str
-#    Generates a unique output file path by appending a counter to the filename if it already exists.
+#    Atomically reserves a unique output file path, appending a counter to the filename if it is taken.
 #
 
 
@@ -192,6 +201,8 @@ def download_video(params: dict) -> dict:
             "cookiefile": video_download_config.get("cookie_path"),
             "format": video_download_config.get("format", "bestvideo+bestaudio/best"),
             "noplaylist": video_download_config.get("noplaylist", True),
+            # original_filename is reserved as an empty file by unique_output_path().
+            "overwrites": True,
             "verbose": True,
         }
 
@@ -258,6 +269,7 @@ import os
 import time
 import traceback
 import logging
+import copy
 import json
 import logging
 import sys
@@ -339,14 +351,22 @@ def create_subdir(base_dir="clips", subdir_name="orange"):
     return subdir_path
 
 
-def download_video(params):
+def download_video(params, info=None, ydl=None):
     """
     Downloads a video from a given URL using yt-dlp.
 
+    When the info dict from extract_video_info() is passed, yt-dlp downloads
+    straight from it instead of extracting the URL a second time. A long-lived
+    YoutubeDL from make_youtube_dl() can be passed to skip per-URL startup; its
+    output template is pointed at this video's file for the duration of the call.
+
     Args:
         params (dict): Parameters for the download including:
             - url (str): Video URL.
             - video_download (dict): Video download configuration.
+        info (dict): Optional info dict from extract_video_info().
+        ydl (yt_dlp.YoutubeDL): Optional instance to reuse. Without info it
+            extracts the URL itself as part of the download.
 
     Returns:
         str: The path to the downloaded video, or None if download fails.
@@ -370,19 +390,39 @@ def download_video(params):
         # Set up yt-dlp options for actual download based on video_download_config
         ydl_opts = {
             "outtmpl": params["original_filename"],
-            "cookiefile": video_download_config.get("cookie_path"),
+            "cookiefile": _cookie_path(params),
             "format": video_download_config.get("format", "bestvideo+bestaudio/best"),
             "noplaylist": video_download_config.get("noplaylist", True),
+            # original_filename is reserved as an empty file by unique_output_path().
+            "overwrites": True,
             "verbose": True,
         }
 
         logger.debug(f"yt-dlp options: {ydl_opts}")
 
         # Perform the video download
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            logger.info("About to download video.")
-            ydl.download([url])
+        if ydl is not None:
+            logger.info("About to download video (shared YoutubeDL).")
+            _apply_video_options(ydl, params)
+            previous_outtmpl = ydl.params.get("outtmpl")
+            ydl.params["outtmpl"] = {**(previous_outtmpl or {}), "default": params["original_filename"]}
+            try:
+                if info:
+                    ydl.process_ie_result(copy.deepcopy(info), download=True)
+                else:
+                    ydl.extract_info(url, download=True)
+            finally:
+                ydl.params["outtmpl"] = previous_outtmpl
             logger.info("Video download completed.")
+        else:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                logger.info("About to download video.")
+                if info:
+                    # process_ie_result mutates the dict; keep the caller's copy intact.
+                    ydl.process_ie_result(copy.deepcopy(info), download=True)
+                else:
+                    ydl.download([url])
+                logger.info("Video download completed.")
 
         end_time = time.time()
         logger.info(f"Download completed in {end_time - start_time:.2f} seconds")
@@ -395,7 +435,77 @@ def download_video(params):
         return None
 
 
-def extract_metadata(params):
+def download_video_ranges(params, ranges, info=None):
+    """
+    Downloads only the given time ranges of a video into one partial file.
+
+    Each range is fetched by yt-dlp as its own section (download_ranges) with
+    keyframes forced at the cuts, so a section starts exactly at its range
+    start instead of at the keyframe before it (yt-dlp re-encodes the section
+    to do so; ranges are short). The sections are then joined losslessly at
+    params["original_filename"]. Each range's position in the joined file
+    comes from the probed length of the sections before it, so clip times can
+    be mapped with chunking.map_to_partial_time().
+
+    Args:
+        params (dict): Same parameters as download_video().
+        ranges (list): Sorted (start, end) source times in seconds.
+        info (dict): Optional info dict from extract_video_info().
+
+    Returns:
+        dict: 'to_process' (the partial file) and 'partial_ranges'
+        ([{'start', 'end', 'offset'}, ...]), or None if a range fails.
+    """
+    from yt_dlp.utils import download_range_func
+    from media_lib import concat_segments, probe_duration
+
+    url = params.get("url")
+    output_path = params["original_filename"]
+    base, ext = os.path.splitext(output_path)
+    part_paths = []
+
+    try:
+        start_time = time.time()
+        partial_ranges = []
+        offset = 0.0
+        for index, (start, end) in enumerate(ranges):
+            part_path = f"{base}.part{index + 1:03d}{ext}"
+            ydl_opts = {
+                **_youtube_dl_options(params),
+                "outtmpl": part_path,
+                "download_ranges": download_range_func(None, [(start, end)]),
+                # Without forced keyframes a copied section starts at the keyframe
+                # before `start`, and the offsets below would be off by that gap.
+                "force_keyframes_at_cuts": True,
+            }
+            logger.info(f"Downloading range {start:.1f}-{end:.1f}s of {url}")
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if info:
+                    ydl.process_ie_result(copy.deepcopy(info), download=True)
+                else:
+                    ydl.download([url])
+            part_paths.append(part_path)
+
+            partial_ranges.append({"start": start, "end": end, "offset": round(offset, 3)})
+            offset += probe_duration(part_path)
+
+        concat_segments(part_paths, output_path)
+        logger.info(
+            f"Partial download of {len(ranges)} ranges ({offset:.0f}s) completed in "
+            f"{time.time() - start_time:.2f} seconds"
+        )
+        return {"to_process": output_path, "partial_ranges": partial_ranges}
+    except Exception as e:
+        logger.error(f"Failed to download ranges: {e}")
+        logger.debug(traceback.format_exc())
+        return None
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+def extract_metadata(params, info=None):
     """
     Extracts all available metadata from a YouTube video without downloading it and saves it to a file.
 
@@ -404,6 +514,8 @@ def extract_metadata(params):
             - url (str): Video URL.
             - metadata_path (str): Path to save the metadata JSON file.
             - cookie_path (str): Path to the cookie file (optional).
+        info (dict): Optional info dict from extract_video_info(); no extraction
+            is run when it is given.
 
     Returns:
         dict: A dictionary containing all available metadata about the video.
@@ -412,36 +524,100 @@ def extract_metadata(params):
     for key, value in params.items():
         logger.info(f"{key}: {value}")
 
-    url = params.get("url")
-    cookie_path = params.get("cookie_path")
     metadata_path = params.get("metadata_path")
 
     try:
-        # Set up yt-dlp options for extracting metadata
-        ydl_opts = {
-            "cookiefile": (
-                cookie_path if cookie_path and os.path.exists(cookie_path) else None
-            ),
-            "noplaylist": True,  # Ensure only the single video is processed if the URL is a playlist
-            "skip_download": True,  # Skip actual video download
-        }
+        info_dict = info if info is not None else extract_video_info(params)
+        if not info_dict:
+            return {}
+        info_dict = yt_dlp.YoutubeDL.sanitize_info(info_dict)
+
+        # Save metadata to file
+        if metadata_path:
+            with open(metadata_path, "w", encoding="utf-8") as f:
+                json.dump(info_dict, f, indent=4, ensure_ascii=False)
+            logger.info(f"Metadata saved to {metadata_path}")
+
+        return info_dict
+    except Exception as e:
+        logger.error(f"Failed to extract metadata: {e}")
+        logger.debug(traceback.format_exc())
+        return {}
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(
-                url, download=False
-            )  # Extract metadata without downloading
 
-            # Save metadata to file
-            if metadata_path:
-                with open(metadata_path, "w", encoding="utf-8") as f:
-                    json.dump(info_dict, f, indent=4, ensure_ascii=False)
-                logger.info(f"Metadata saved to {metadata_path}")
+def extract_video_info(params, ydl=None):
+    """
+    Runs the single yt-dlp extraction for a URL.
 
-            return info_dict
+    The returned info dict is what mask_metadata(), extract_metadata() and
+    download_video() accept as their 'info' argument, so a URL is extracted
+    once per run instead of once per step. Format selection uses the same
+    format string as the download, so the reported ext/width/height match
+    the file that will be written. The info dict is large and holds expiring
+    media URLs; keep it out of params and the stored metadata JSON.
+
+    Args:
+        params (dict): Parameters including:
+            - url (str): Video URL.
+            - video_download (dict): Video download configuration (optional).
+            - cookie_path (str): Path to the cookie file (optional).
+        ydl (yt_dlp.YoutubeDL): Optional instance from make_youtube_dl() to reuse.
+
+    Returns:
+        dict: The yt-dlp info dict, or None if extraction fails.
+    """
+    url = params.get("url")
+
+    try:
+        start_time = time.time()
+        if ydl is not None:
+            _apply_video_options(ydl, params)
+            info = ydl.extract_info(url, download=False)
+        else:
+            opts = {**_youtube_dl_options(params), "skip_download": True}
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+        logger.info(f"Extracted info for {url} in {time.time() - start_time:.2f} seconds")
+        return info
     except Exception as e:
-        logger.error(f"Failed to extract metadata: {e}")
+        logger.error(f"Failed to extract video info: {e}")
         logger.debug(traceback.format_exc())
-        return {}
+        return None
+
+
+def _apply_video_options(ydl, params):
+    """
+    Points a shared YoutubeDL at this video's format choice.
+
+    YoutubeDL compiles params["format"] into format_selector once, in its
+    constructor, and format selection only uses the compiled selector, so
+    the selector is rebuilt whenever the format string changes.
+    """
+    video_format = params.get("video_download", {}).get("format")
+    if video_format and video_format != ydl.params.get("format"):
+        ydl.params["format"] = video_format
+        ydl.format_selector = ydl.build_format_selector(video_format)
+
+
+def _cookie_path(params):
+    """Returns the configured cookie file, or None if it is unset or missing."""
+    cookie_path = params.get("video_download", {}).get("cookie_path") or params.get("cookie_path")
+    return cookie_path if cookie_path and os.path.exists(cookie_path) else None
+
+
+def _youtube_dl_options(params):
+    """yt-dlp options shared by extraction and download."""
+    video_download_config = params.get("video_download", {})
+    return {
+        "quiet": True,
+        "no_warnings": True,
+        "cookiefile": _cookie_path(params),
+        "format": video_download_config.get("format", "bestvideo+bestaudio/best"),
+        "noplaylist": video_download_config.get("noplaylist", True),
+        "force_generic_extractor": False,
+        "merge_output_format": "mp4",
+        "overwrites": True,
+    }
 
 
 # ==================================================
@@ -491,32 +667,42 @@ def load_config():
     return config[os_name]
 
 
-# New function to mask metadata fb
+def make_youtube_dl(params: dict) -> yt_dlp.YoutubeDL:
+    """
+    Creates a YoutubeDL instance that can both extract and download.
 
+    Keeping one instance per worker avoids re-initialising extractors, the
+    cookie jar and the HTTP connection pool for every URL. Pass it to
+    extract_video_info() and download_video(); close it with ydl.close()
+    (or use it as a context manager) when the worker is done.
 
-def mask_metadata(params: dict) -> dict:
-    """
-    Extract and normalize metadata using yt-dlp without downloading the video.
+    Args:
+        params (dict): Parameters with the cookie path and 'video_download' config.
+
+    Returns:
+        yt_dlp.YoutubeDL: The configured instance.
     """
-    try:
-        import yt_dlp
+    return yt_dlp.YoutubeDL(_youtube_dl_options(params))
 
-        url = params["url"]
-        cookie_path = params.get("video_download", {}).get("cookie_path")
 
-        opts = {
-            "quiet": True,
-            "skip_download": True,
-            "no_warnings": True,
-            "cookiefile": cookie_path,
-            "simulate": True,
-            "noplaylist": True,
-            "force_generic_extractor": False,
-            "merge_output_format": "mp4",
-        }
+# New function to mask metadata fb
 
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+
+def mask_metadata(params: dict, info: dict = None) -> dict:
+    """
+    Normalize metadata from a yt-dlp info dict without downloading the video.
+
+    Args:
+        params (dict): Parameters including 'url' (used only when info is None).
+        info (dict): Optional info dict from extract_video_info(); extracted
+            here when not given.
+
+    Returns:
+        dict: The normalized metadata, or None if nothing could be extracted.
+    """
+    try:
+        if info is None:
+            info = extract_video_info(params)
 
         if info:
             normalized_metadata = {}
@@ -569,17 +755,35 @@ def mask_metadata(params: dict) -> dict:
 def resolve_fb_share_url(url: str) -> str:
     """
     Follow Facebook share link redirection to get actual video URL.
+
+    Resolution goes through url_resolver: a pooled keep-alive session and a
+    persistent share-URL -> canonical-URL cache. Non-Facebook URLs are
+    returned unchanged without a request.
     """
-    try:
-        import requests
+    from url_resolver import resolve_share_url
 
-        response = requests.get(url, allow_redirects=True, timeout=10)
-        if response.url != url:
-            logger.info(f"🔁 Resolved FB share URL to: {response.url}")
-        return response.url
-    except Exception as e:
-        logger.warning(f"⚠️ Failed to resolve Facebook share URL: {e}")
-        return url
+    return resolve_share_url(url)
+
+
+def resolve_path(path: str, base: str = None) -> str:
+    """
+    Resolves a possibly relative path to an absolute one.
+
+    Args:
+        path (str): The path to resolve; "~" is expanded.
+        base (str): Directory relative paths are taken from (default: the project root).
+
+    Returns:
+        str: The absolute path, or the input unchanged if it is empty.
+    """
+    if not path:
+        return path
+    path = os.path.expanduser(path)
+    if os.path.isabs(path):
+        return path
+    if base is None:
+        base = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    return os.path.abspath(os.path.join(base, path))
 
 
 def load_app_config():
@@ -635,6 +839,10 @@ def unique_output_path(path, filename):
     """
     Generates a unique output file path by appending a counter to the filename if it already exists.
 
+    The name is reserved atomically (see path_alloc), so concurrent workers
+    writing to the same directory never receive the same path. An empty file
+    is left at the returned path; downloads must overwrite it.
+
     Args:
         path (str): Directory path.
         filename (str): Original filename.
@@ -642,10 +850,6 @@ def unique_output_path(path, filename):
     Returns:
         str: A unique file path.
     """
-    base, ext = os.path.splitext(filename)
-    counter = 1
-    unique_filename = filename
-    while os.path.exists(os.path.join(path, unique_filename)):
-        unique_filename = f"{base}_{counter}{ext}"
-        counter += 1
-    return os.path.join(path, unique_filename)
+    from path_alloc import allocate_output_path
+
+    return allocate_output_path(path, filename)
@@ -0,0 +1,326 @@
+# ==================================================
+# text_render.py - Pillow text rendering with a persistent label cache
+# ==================================================
+#
+# Description:
+# Draws RGBA label bitmaps with Pillow instead of spawning ImageMagick for every
+# TextClip. Rendered labels are memoized in memory and in an on-disk PNG cache
+# keyed by (text, font, size, color, shadow); both caches evict least recently
+# used entries. The disk cache is counted in memory and trimmed in batches
+# (see DISK_EVICTION_SLACK) instead of listing the directory on every write.
+#
+# Function List:
+#
+# - configure_label_cache(cache_dir: str = None, max_entries: int = None, memory_entries: int = None) -> dict
+#     Overrides the label cache location and size limits.
+#
+# - load_font(font: str, font_size: int) -> ImageFont.FreeTypeFont
+#     Loads (and memoizes) a Pillow font from a font name or file path.
+#
+# - render_caption(text: str, captions_config: dict) -> Image.Image
+#     Renders caption text using the 'captions' section of app_config.json.
+#
+# - render_label(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> Image.Image
+#     Returns an RGBA label bitmap from the memory cache, the disk cache or a fresh render.
+#
+# - resolve_font_path(font: str) -> str
+#     Finds a TrueType/OpenType file for a font name such as "Arial Bold".
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+
+logger = logging.getLogger(__name__)
+
+FONT_DIRS = [
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    "/System/Library/Fonts/Supplemental",
+    os.path.expanduser("~/Library/Fonts"),
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.fonts"),
+    os.path.expanduser("~/.local/share/fonts"),
+    "C:\\Windows\\Fonts",
+]
+
+# Windows-style short file names for common "<family> <style>" requests.
+FONT_ALIASES = {
+    "arialbold": ["arialbd"],
+    "arialitalic": ["ariali"],
+    "arialbolditalic": ["arialbi"],
+}
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# Transparent border around each label, in pixels.
+LABEL_PADDING = 2
+
+# The disk cache may grow this far past max_entries before it is trimmed back,
+# so the directory is listed once per batch of writes rather than on every one.
+DISK_EVICTION_SLACK = 0.1
+
+_cache_settings = {
+    "cache_dir": "./cache/labels",
+    "max_entries": 2000,
+    "memory_entries": 256,
+}
+_memory_cache = OrderedDict()
+
+# Labels on disk per cache directory, as counted by this process: listed once,
+# then incremented on each new file and re-counted whenever the cache is trimmed.
+_disk_counts = {}
+
+
+def configure_label_cache(cache_dir: str = None, max_entries: int = None, memory_entries: int = None) -> dict:
+    """
+    Overrides the label cache location and size limits.
+
+    Args:
+        cache_dir (str): Directory holding the on-disk PNG cache.
+        max_entries (int): Maximum number of labels kept on disk.
+        memory_entries (int): Maximum number of labels kept in memory.
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    if cache_dir is not None:
+        _cache_settings["cache_dir"] = cache_dir
+    if max_entries is not None:
+        _cache_settings["max_entries"] = int(max_entries)
+    if memory_entries is not None:
+        _cache_settings["memory_entries"] = int(memory_entries)
+    return dict(_cache_settings)
+
+
+@lru_cache(maxsize=64)
+def load_font(font: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """
+    Loads a Pillow font.
+
+    Args:
+        font (str): Font name (e.g. "Arial Bold") or path to a font file.
+        font_size (int): Font size in pixels.
+
+    Returns:
+        ImageFont.FreeTypeFont: The loaded font, or Pillow's default font if no
+        matching file can be found.
+    """
+    font_path = resolve_font_path(font)
+    if font_path:
+        return ImageFont.truetype(font_path, int(font_size))
+
+    logger.warning(f"Font '{font}' not found; falling back to Pillow's default font.")
+    try:
+        return ImageFont.load_default(size=int(font_size))
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_caption(text: str, captions_config: dict) -> Image.Image:
+    """
+    Renders caption text with the settings from the 'captions' config section.
+
+    Args:
+        text (str): Caption text.
+        captions_config (dict): The 'captions' section of app_config.json (font,
+            font_size, username_color and an optional shadow block).
+
+    Returns:
+        Image.Image: The RGBA caption bitmap.
+    """
+    return render_label(
+        text,
+        captions_config.get("font", "Arial"),
+        captions_config.get("font_size", 64),
+        captions_config.get("username_color", "white"),
+        shadow=captions_config.get("shadow"),
+    )
+
+
+def render_label(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> Image.Image:
+    """
+    Returns an RGBA bitmap of the given text.
+
+    Lookups go to the in-memory LRU first, then to the on-disk PNG cache, and only
+    render with Pillow on a miss in both. Callers must not modify the returned image.
+
+    Args:
+        text (str): Text to draw.
+        font (str): Font name or font file path.
+        font_size (int): Font size in pixels.
+        color (str): Any color Pillow understands ("yellow", "#ff0000", ...).
+        shadow (dict): Optional drop shadow with 'color', 'offset' (px) and 'opacity' (0-1).
+
+    Returns:
+        Image.Image: The rendered RGBA label.
+    """
+    key = _label_key(text, font, font_size, color, shadow)
+
+    image = _memory_cache.get(key)
+    if image is not None:
+        _memory_cache.move_to_end(key)
+        return image
+
+    cache_path = os.path.join(_cache_settings["cache_dir"], f"{key}.png")
+    image = _read_cached_label(cache_path)
+    if image is None:
+        image = _draw_label(text, font, font_size, color, shadow)
+        _write_cached_label(cache_path, image)
+
+    _memory_cache[key] = image
+    while len(_memory_cache) > _cache_settings["memory_entries"]:
+        _memory_cache.popitem(last=False)
+    return image
+
+
+@lru_cache(maxsize=64)
+def resolve_font_path(font: str) -> Optional[str]:
+    """
+    Finds a font file for a font name.
+
+    Names are compared case-insensitively with spaces, dashes and underscores
+    removed, so "Arial Bold" matches "Arial Bold.ttf", "Arial-Bold.ttf" and
+    (via FONT_ALIASES) "arialbd.ttf".
+
+    Args:
+        font (str): Font name or path to a font file.
+
+    Returns:
+        str: Path to the font file, or None if nothing matches.
+    """
+    if os.path.isfile(font):
+        return font
+
+    wanted = _normalize_font_name(font)
+    candidates = [wanted] + FONT_ALIASES.get(wanted, [])
+
+    for font_dir in FONT_DIRS:
+        if not os.path.isdir(font_dir):
+            continue
+        for root, _, files in os.walk(font_dir):
+            for filename in files:
+                stem, ext = os.path.splitext(filename)
+                if ext.lower() in FONT_EXTENSIONS and _normalize_font_name(stem) in candidates:
+                    return os.path.join(root, filename)
+    return None
+
+
+def _draw_label(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> Image.Image:
+    """Renders one label with Pillow."""
+    pil_font = load_font(font, font_size)
+    left, top, right, bottom = pil_font.getbbox(text or " ")
+    shadow_offset = int(shadow.get("offset", 0)) if shadow else 0
+
+    width = right - left + 2 * LABEL_PADDING + shadow_offset
+    height = bottom - top + 2 * LABEL_PADDING + shadow_offset
+    image = Image.new("RGBA", (max(1, width), max(1, height)), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    origin = (LABEL_PADDING - left, LABEL_PADDING - top)
+
+    if shadow:
+        opacity = float(shadow.get("opacity", 1.0))
+        shadow_fill = ImageColor.getrgb(shadow.get("color", "black"))[:3] + (int(255 * opacity),)
+        draw.text((origin[0] + shadow_offset, origin[1] + shadow_offset), text, font=pil_font, fill=shadow_fill)
+
+    fill = ImageColor.getrgb(color)[:3] + (255,)
+    draw.text(origin, text, font=pil_font, fill=fill)
+    return image
+
+
+def _count_disk_label(cache_dir: str) -> None:
+    """
+    Counts one new label in the disk cache and trims it once it is too large.
+
+    The directory is only listed on the first write and when the count passes
+    max_entries plus DISK_EVICTION_SLACK, so a write normally costs no scan.
+    Labels written by other processes are picked up at the next trim.
+    """
+    count = _disk_counts.get(cache_dir)
+    if count is None:
+        count = sum(1 for entry in os.scandir(cache_dir) if entry.name.endswith(".png"))
+    else:
+        count += 1
+    _disk_counts[cache_dir] = count
+
+    max_entries = _cache_settings["max_entries"]
+    if count > max_entries + int(max_entries * DISK_EVICTION_SLACK):
+        _disk_counts[cache_dir] = _evict_disk_cache(cache_dir)
+
+
+def _evict_disk_cache(cache_dir: str) -> int:
+    """Removes the least recently used PNGs down to max_entries and returns how many remain."""
+    entries = [
+        entry for entry in os.scandir(cache_dir)
+        if entry.is_file() and entry.name.endswith(".png")
+    ]
+    excess = len(entries) - _cache_settings["max_entries"]
+    if excess <= 0:
+        return len(entries)
+
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:excess]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    logger.debug(f"Evicted {excess} labels from {cache_dir}")
+    return len(entries) - excess
+
+
+def _label_key(text: str, font: str, font_size: int, color: str, shadow: dict = None) -> str:
+    """Hashes the label parameters into a stable cache key."""
+    payload = json.dumps([text, font, font_size, color, shadow], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_font_name(name: str) -> str:
+    """Lower-cases a font name and strips separators."""
+    return "".join(ch for ch in name.lower() if ch not in " -_")
+
+
+def _read_cached_label(cache_path: str) -> Optional[Image.Image]:
+    """Loads a label from the disk cache and marks it as recently used."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with Image.open(cache_path) as cached:
+            image = cached.convert("RGBA")
+        os.utime(cache_path)
+        return image
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable cached label {cache_path}: {e}")
+        return None
+
+
+def _write_cached_label(cache_path: str, image: Image.Image) -> None:
+    """Stores a label in the disk cache; concurrent writers are safe via rename."""
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, format="PNG")
+        is_new = not os.path.exists(cache_path)
+        os.replace(tmp_path, cache_path)
+        if is_new:
+            _count_disk_label(cache_dir)
+    except OSError as e:
+        logger.warning(f"Could not write label cache {cache_path}: {e}")
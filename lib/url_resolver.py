@@ -0,0 +1,300 @@
+# ==================================================
+# url_resolver.py - Share-link resolution over a pooled HTTP session
+# ==================================================
+#
+# Description:
+# Resolves share links (facebook.com/share/..., fb.watch/...) to the URL they
+# redirect to. All requests go through one keep-alive requests.Session with a
+# sized connection pool, so a batch of links reuses TCP/TLS connections instead
+# of handshaking per link. Resolved links are kept in a persistent
+# share-URL -> canonical-URL cache, and lists of links are resolved on a
+# bounded thread pool with duplicates collapsed.
+#
+# URLs whose host is not one of the configured share_hosts are returned
+# unchanged without any network access. Only redirect chains that end in a
+# 2xx response outside the login/checkpoint pages (login_paths) are cached;
+# anything else returns the input URL and is retried next time.
+#
+# Function List:
+#
+# - configure_url_resolver(cache_path: str = None, ttl_seconds: int = None, timeout: float = None, pool_size: int = None, workers: int = None, share_hosts: list = None, login_paths: list = None) -> dict
+#     Overrides the cache location, TTL, timeouts, pool sizes, share hosts and login pages.
+#
+# - get_http_session() -> requests.Session
+#     Returns the process-wide pooled keep-alive session.
+#
+# - is_share_url(url: str) -> bool
+#     Whether a URL's host is one whose links need resolving.
+#
+# - resolve_share_url(url: str) -> str
+#     Resolves one share link through the persistent cache and the pooled session.
+#
+# - resolve_share_urls(urls: list, workers: int = None) -> dict
+#     Resolves many links concurrently on a bounded pool, each distinct link once.
+#
+# --------------------------------------------------
+# INSTRUCTIONS FOR ADDING A NEW FUNCTION:
+# --------------------------------------------------
+# 1. Add the function to the list above in alphabetical order.
+# 2. Include a one-line comment summarizing its purpose.
+# 3. Follow the pattern of complete docstrings for each function.
+# 4. Do NOT number the list manually.
+#
+# --------------------------------------------------
+# Function Definitions:
+# --------------------------------------------------
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+_resolver_settings = {
+    "cache_path": "./cache/resolved_urls.json",
+    "ttl_seconds": 30 * 24 * 3600,
+    "timeout": 10,
+    "pool_size": 8,
+    "workers": 8,
+    "share_hosts": ["facebook.com", "fb.watch"],
+    # Path prefixes of pages a redirect lands on when the link needs a login.
+    "login_paths": ["/login", "/checkpoint", "/recover"],
+}
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_url_resolver(cache_path: str = None, ttl_seconds: int = None, timeout: float = None,
+                           pool_size: int = None, workers: int = None, share_hosts: list = None,
+                           login_paths: list = None) -> dict:
+    """
+    Overrides the resolver settings.
+
+    Args:
+        cache_path (str): JSON file holding the share-URL -> canonical-URL cache.
+        ttl_seconds (int): Age after which a cached resolution is looked up again.
+        timeout (float): Per-request timeout in seconds.
+        pool_size (int): Connections kept alive per host by the shared session.
+        workers (int): Default number of concurrent resolutions.
+        share_hosts (list): Hosts (and their subdomains) whose links are resolved.
+        login_paths (list): Path prefixes of login/checkpoint pages; a chain
+            ending there is not a resolution.
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    global _cache
+
+    if cache_path is not None and cache_path != _resolver_settings["cache_path"]:
+        _resolver_settings["cache_path"] = cache_path
+        _cache = None
+    if ttl_seconds is not None:
+        _resolver_settings["ttl_seconds"] = int(ttl_seconds)
+    if timeout is not None:
+        _resolver_settings["timeout"] = float(timeout)
+    if pool_size is not None:
+        _resolver_settings["pool_size"] = int(pool_size)
+    if workers is not None:
+        _resolver_settings["workers"] = int(workers)
+    if share_hosts is not None:
+        _resolver_settings["share_hosts"] = list(share_hosts)
+    if login_paths is not None:
+        _resolver_settings["login_paths"] = list(login_paths)
+    return dict(_resolver_settings)
+
+
+def get_http_session():
+    """
+    Returns the process-wide pooled keep-alive session.
+
+    The session is created on first use with an HTTPAdapter whose pool holds
+    pool_size connections per host, enough for one per concurrent resolver.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            pool_size = _resolver_settings["pool_size"]
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def is_share_url(url: str) -> bool:
+    """
+    Whether a URL's host is one whose links need resolving.
+
+    Args:
+        url (str): The URL to check.
+
+    Returns:
+        bool: True for hosts listed in share_hosts and their subdomains.
+    """
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == share or host.endswith("." + share) for share in _resolver_settings["share_hosts"])
+
+
+def resolve_share_url(url: str) -> str:
+    """
+    Resolves one share link to the URL it redirects to.
+
+    Non-share URLs are returned as-is. Share links are answered from the
+    persistent cache while fresh; otherwise the redirect chain is followed on
+    the pooled session (the final page body is not downloaded) and the result
+    is cached. Failures are not cached and return the input URL: request
+    errors, a final response outside 2xx, and chains that end on a login or
+    checkpoint page.
+
+    Args:
+        url (str): The link to resolve.
+
+    Returns:
+        str: The resolved URL, or url itself.
+    """
+    if not is_share_url(url):
+        return url
+
+    cached = _cached_resolution(url)
+    if cached:
+        logger.debug(f"Resolved {url} from cache")
+        return cached
+
+    try:
+        response = get_http_session().get(
+            url, allow_redirects=True, stream=True, timeout=_resolver_settings["timeout"]
+        )
+        resolved = response.url
+        status = response.status_code
+        response.close()
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to resolve share URL {url}: {e}")
+        return url
+
+    if not 200 <= status < 300:
+        logger.warning(f"⚠️ Share URL {url} ended in HTTP {status} at {resolved}; not caching")
+        return url
+    if _is_login_page(resolved):
+        logger.warning(f"⚠️ Share URL {url} redirected to a login page ({resolved}); not caching")
+        return url
+
+    if resolved != url:
+        logger.info(f"🔁 Resolved share URL to: {resolved}")
+    _store_resolution(url, resolved)
+    return resolved
+
+
+def resolve_share_urls(urls: list, workers: int = None) -> dict:
+    """
+    Resolves many links concurrently.
+
+    Each distinct link is resolved once; cached and non-share URLs never reach
+    the pool. At most 'workers' requests are in flight at a time.
+
+    Args:
+        urls (list): Links to resolve.
+        workers (int): Concurrent resolutions (default: the configured workers).
+
+    Returns:
+        dict: {input URL: resolved URL} for every input.
+    """
+    resolved = {}
+    pending = []
+    for url in dict.fromkeys(urls):
+        if not is_share_url(url):
+            resolved[url] = url
+            continue
+        cached = _cached_resolution(url)
+        if cached:
+            resolved[url] = cached
+        else:
+            pending.append(url)
+
+    if pending:
+        workers = max(1, min(int(workers or _resolver_settings["workers"]), len(pending)))
+        logger.info(f"🔁 Resolving {len(pending)} share URLs with {workers} workers "
+                    f"({len(resolved)} answered without network)")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for url, result in zip(pending, pool.map(resolve_share_url, pending)):
+                resolved[url] = result
+
+    return resolved
+
+
+def _cached_resolution(url: str) -> Optional[str]:
+    """Returns a fresh cached resolution for a link, if any."""
+    with _cache_lock:
+        entry = _load_cache().get(url)
+    if entry and time.time() - entry.get("resolved_at", 0) <= _resolver_settings["ttl_seconds"]:
+        return entry["url"]
+    return None
+
+
+def _is_login_page(url: str) -> bool:
+    """Whether a URL is a login/checkpoint page rather than the shared content."""
+    path = urlparse(url).path.lower()
+    return any(path == prefix or path.startswith(prefix) for prefix in _resolver_settings["login_paths"])
+
+
+def _load_cache() -> dict:
+    """Returns the in-memory cache, reading it from disk on first use (caller holds _cache_lock)."""
+    global _cache
+
+    if _cache is None:
+        _cache = _read_cache_file(_resolver_settings["cache_path"])
+    return _cache
+
+
+def _read_cache_file(path: str) -> dict:
+    """Reads the cache file (empty if missing or unreadable)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable URL cache {path}: {e}")
+        return {}
+
+
+def _store_resolution(url: str, resolved: str) -> None:
+    """
+    Adds a resolution to the cache and writes it through to disk.
+
+    The file is re-read before writing so entries added by other processes
+    since this one loaded the cache are kept.
+    """
+    path = _resolver_settings["cache_path"]
+    with _cache_lock:
+        cache = _load_cache()
+        merged = _read_cache_file(path)
+        merged[url] = {"url": resolved, "resolved_at": time.time()}
+        if resolved != url:
+            # The canonical URL is often on a share host too; don't chase it again.
+            merged[resolved] = {"url": resolved, "resolved_at": time.time()}
+        cache.update(merged)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(merged, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write URL cache {path}: {e}")
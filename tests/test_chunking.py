@@ -0,0 +1,59 @@
+# ==================================================
+# test_chunking.py - chunking analysis passes against a failing ffmpeg
+# ==================================================
+#
+# ffmpeg is replaced by a small script that prints an error and exits with
+# status 1 without writing any frames, so no media files or real ffmpeg
+# binary are needed.
+#
+# USAGE:
+#   python -m pytest tests/test_chunking.py
+# ==================================================
+
+import os
+import sys
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib"))
+
+try:
+    import chunking
+except ImportError:  # numpy is not installed
+    chunking = None
+
+FAILING_FFMPEG = """#!/bin/sh
+echo "input.mp4: Invalid data found when processing input" >&2
+exit 1
+"""
+
+
+@unittest.skipIf(chunking is None, "chunking dependencies are not installed")
+class FailingFfmpegTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ffmpeg = os.path.join(self.tmp.name, "ffmpeg")
+        with open(self.ffmpeg, "w") as f:
+            f.write(FAILING_FFMPEG)
+        os.chmod(self.ffmpeg, os.stat(self.ffmpeg).st_mode | stat.S_IEXEC)
+        patcher = mock.patch.object(chunking, "get_ffmpeg_binary", return_value=self.ffmpeg)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_scene_change_times_raises_with_stderr(self):
+        with self.assertRaises(RuntimeError) as caught:
+            chunking.scene_change_times("input.mp4")
+        self.assertIn("Invalid data found", str(caught.exception))
+
+    def test_silence_gaps_raises_with_stderr(self):
+        with self.assertRaises(RuntimeError) as caught:
+            chunking.silence_gaps("input.mp4")
+        self.assertIn("Invalid data found", str(caught.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
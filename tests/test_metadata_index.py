@@ -0,0 +1,96 @@
+# ==================================================
+# test_metadata_index.py - tasks_lib lookups through the metadata index
+# ==================================================
+#
+# Builds a metadata directory in a temporary location and edits files in
+# place without changing the directory mtime, the case the index's mtime
+# check cannot see, and checks that writes reach lookups through the journal.
+#
+# USAGE:
+#   python -m pytest tests/test_metadata_index.py
+# ==================================================
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib"))
+
+import metadata_cache
+import metadata_index
+import tasks_lib
+
+URL = "https://example.com/videos/abc"
+
+
+class IndexedLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metadata_dir = os.path.join(self.tmp.name, "metadata")
+        os.makedirs(self.metadata_dir)
+        metadata_index.configure_metadata_index(cache_dir=os.path.join(self.tmp.name, "index"))
+        metadata_cache.configure_metadata_cache(cache_dir=os.path.join(self.tmp.name, "metadata_cache"))
+        self.json_path = os.path.join(self.metadata_dir, "video.json")
+        self.write({"title": "video"})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        """Rewrites the file in place and restores the directory mtime."""
+        dir_stat = os.stat(self.metadata_dir)
+        with open(self.json_path, "w") as f:
+            json.dump(data, f)
+        os.utime(self.metadata_dir, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+    def test_url_added_in_place_is_found_when_asked_to_rescan(self):
+        self.assertEqual(tasks_lib.find_url_json(URL, self.metadata_dir), (None, None))
+
+        self.write({"title": "video", "url": URL})
+        # A fresh index trusts the miss; the caller has to ask for the rescan.
+        self.assertEqual(tasks_lib.find_url_json(URL, self.metadata_dir), (None, None))
+        json_path, data = tasks_lib.find_url_json(URL, self.metadata_dir, rescan=True)
+        self.assertEqual(json_path, os.path.join(self.metadata_dir, "video.json"))
+        self.assertEqual(data["url"], URL)
+
+    def test_video_path_added_in_place_is_found_once_the_index_is_stale(self):
+        video_path = os.path.join(self.tmp.name, "video.mp4")
+        self.assertEqual(tasks_lib.find_video_json(video_path, self.metadata_dir), (None, None))
+
+        self.write({"title": "video", "to_process": video_path})
+        metadata_index.configure_metadata_index(rescan_interval=0)
+        try:
+            json_path, _ = tasks_lib.find_video_json(video_path, self.metadata_dir)
+        finally:
+            metadata_index.configure_metadata_index(rescan_interval=3600)
+        self.assertEqual(json_path, os.path.join(self.metadata_dir, "video.json"))
+
+    def test_recorded_writes_are_journaled_and_compacted(self):
+        tasks_lib.find_url_json(URL, self.metadata_dir)
+        index_path = metadata_index._index_path(os.path.abspath(self.metadata_dir))
+        journal_path = metadata_index._journal_path(index_path)
+        index_size = os.path.getsize(index_path)
+
+        data = {"title": "video", "url": URL}
+        with open(self.json_path, "w") as f:
+            json.dump(data, f)
+        metadata_index.record_metadata_file(self.json_path, data)
+        self.assertEqual(os.path.getsize(index_path), index_size)
+        self.assertGreater(os.path.getsize(journal_path), 0)
+
+        # Another process starts with nothing in memory and replays the journal.
+        metadata_index._loaded.clear()
+        self.assertEqual(tasks_lib.find_url_json(URL, self.metadata_dir)[0], self.json_path)
+
+        for _ in range(metadata_index.JOURNAL_COMPACT_ENTRIES - 1):
+            metadata_index.record_metadata_file(self.json_path, data)
+        self.assertEqual(os.path.getsize(journal_path), 0)
+        metadata_index._loaded.clear()
+        self.assertEqual(tasks_lib.find_url_json(URL, self.metadata_dir)[0], self.json_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
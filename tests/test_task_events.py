@@ -0,0 +1,73 @@
+# ==================================================
+# test_task_events.py - task event log replay and backend selection
+# ==================================================
+#
+# Runs against a temporary metadata file and log directory.
+#
+# USAGE:
+#   python -m pytest tests/test_task_events.py
+# ==================================================
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib"))
+
+import task_events
+import task_store
+
+
+class TaskEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, "video.json")
+        with open(self.json_path, "w") as f:
+            json.dump({"default_tasks": {"make_clips": True}}, f)
+        task_store.configure_task_store(backend="json", db_path=os.path.join(self.tmp.name, "tasks.db"))
+        task_events.configure_task_events(enabled=True, log_dir=os.path.join(self.tmp.name, "events"))
+
+    def tearDown(self):
+        task_events.configure_task_events(enabled=False)
+        self.tmp.cleanup()
+
+    def test_completed_without_output_path_keeps_state(self):
+        task_events.record_task_completed(self.json_path, "make_clips", duration=1.0)
+        self.assertIs(task_events.materialize_task_states(self.json_path)["make_clips"], True)
+
+    def test_completed_with_output_path_marks_done(self):
+        task_events.record_task_completed(self.json_path, "make_clips", output_path="clips_output/video")
+        self.assertEqual(task_events.materialize_task_states(self.json_path)["make_clips"], "clips_output/video")
+
+    def test_compaction_export_keeps_other_sections(self):
+        task_store.update_metadata_file(self.json_path, lambda data: data.setdefault("tasks", {}).update(
+            {"apply_watermark": {"output_path": "video_watermarked.mp4"}}))
+        task_events.record_task_completed(self.json_path, "make_clips", output_path="clips_output/video")
+        task_events.compact_task_log(self.json_path)
+
+        with open(self.json_path) as f:
+            data = json.load(f)
+        self.assertEqual(data["default_tasks"]["make_clips"], "clips_output/video")
+        self.assertEqual(data["tasks"]["apply_watermark"]["output_path"], "video_watermarked.mp4")
+
+    def test_sqlite_backend_rejected_while_events_enabled(self):
+        with self.assertRaises(ValueError):
+            task_store.configure_task_store(backend="sqlite")
+        self.assertFalse(task_store.use_task_store())
+
+    def test_events_rejected_while_sqlite_backend_selected(self):
+        task_events.configure_task_events(enabled=False)
+        task_store.configure_task_store(backend="sqlite")
+        try:
+            with self.assertRaises(ValueError):
+                task_events.configure_task_events(enabled=True)
+            self.assertFalse(task_events.use_task_events())
+        finally:
+            task_store.configure_task_store(backend="json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# ==================================================
+# test_task_store.py - SQLite task store exports and shared metadata writes
+# ==================================================
+#
+# Runs against a temporary database and metadata file.
+#
+# USAGE:
+#   python -m pytest tests/test_task_store.py
+# ==================================================
+
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib"))
+
+import task_store
+
+
+class TaskStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, "video.json")
+        with open(self.json_path, "w") as f:
+            json.dump({"title": "video", "default_tasks": {"make_clips": True, "apply_watermark": True}}, f)
+        task_store.configure_task_store(backend="sqlite", db_path=os.path.join(self.tmp.name, "tasks.db"))
+
+    def tearDown(self):
+        task_store.configure_task_store(backend="json", db_path="./cache/task_state.db")
+        self.tmp.cleanup()
+
+    def read_metadata(self):
+        with open(self.json_path) as f:
+            return json.load(f)
+
+    def test_find_and_export(self):
+        task_store.set_task_state(self.json_path, "make_clips", "clips_output/video",
+                                  seed=self.read_metadata()["default_tasks"])
+        self.assertEqual(task_store.find_tasks("make_clips", "done"), [os.path.abspath(self.json_path)])
+        self.assertEqual(task_store.find_tasks("apply_watermark", "pending"), [os.path.abspath(self.json_path)])
+
+        self.assertEqual(task_store.export_all_task_states(), 1)
+        self.assertEqual(self.read_metadata()["default_tasks"]["make_clips"], "clips_output/video")
+
+    def test_section_writes_and_exports_do_not_lose_each_other(self):
+        seed = self.read_metadata()["default_tasks"]
+
+        def write_sections():
+            for i in range(50):
+                task_store.update_metadata_file(
+                    self.json_path, lambda data, i=i: data.setdefault("tasks", {}).__setitem__(f"t{i}", i)
+                )
+
+        def export_states():
+            for i in range(50):
+                task_store.set_task_state(self.json_path, "make_clips", f"clip_{i}", seed=seed)
+                task_store.export_task_states(self.json_path)
+
+        threads = [threading.Thread(target=write_sections), threading.Thread(target=export_states)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        data = self.read_metadata()
+        self.assertEqual(len(data["tasks"]), 50)
+        self.assertEqual(data["default_tasks"]["make_clips"], "clip_49")
+        self.assertEqual(data["title"], "video")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# ==================================================
+# test_url_resolver.py - url_resolver against a local redirect server
+# ==================================================
+#
+# A stand-in for the share-link hosts: a local HTTP server whose /share/*
+# paths redirect to a video page, a 404, or a login page. 127.0.0.1 is
+# configured as the only share host so nothing leaves the machine.
+#
+# USAGE:
+#   python -m pytest tests/test_url_resolver.py
+# ==================================================
+
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../lib"))
+
+try:
+    import requests  # noqa: F401  (url_resolver's session needs it)
+except ImportError:
+    requests = None
+
+import url_resolver
+
+REDIRECTS = {
+    "/share/ok": "/video/123",
+    "/share/chain": "/share/ok",
+    "/share/missing": "/gone",
+    "/share/login": "/login/?next=%2Fvideo%2F123",
+    "/share/checkpoint": "/checkpoint/block",
+}
+PAGES = {"/video/123": 200, "/login/": 200, "/checkpoint/block": 200}
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    """Redirects /share/* paths and serves the pages they land on."""
+
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        path = self.path.split("?")[0]
+        if self.path in REDIRECTS:
+            self.send_response(302)
+            self.send_header("Location", REDIRECTS[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status = PAGES.get(path, 404)
+        body = b"page"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(requests is None, "requests is not installed")
+class ResolveShareUrlTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RedirectHandler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "resolved_urls.json")
+        url_resolver.configure_url_resolver(cache_path=self.cache_path, share_hosts=["127.0.0.1"],
+                                            timeout=5, ttl_seconds=3600)
+        RedirectHandler.hits = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cached_urls(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path) as f:
+            return {url: entry["url"] for url, entry in json.load(f).items()}
+
+    def test_resolves_and_caches_a_redirect(self):
+        resolved = url_resolver.resolve_share_url(self.base + "/share/ok")
+        self.assertEqual(resolved, self.base + "/video/123")
+        self.assertEqual(self.cached_urls()[self.base + "/share/ok"], self.base + "/video/123")
+
+        hits = len(RedirectHandler.hits)
+        self.assertEqual(url_resolver.resolve_share_url(self.base + "/share/ok"), self.base + "/video/123")
+        self.assertEqual(len(RedirectHandler.hits), hits, "second resolution should come from the cache")
+
+    def test_follows_a_redirect_chain(self):
+        self.assertEqual(url_resolver.resolve_share_url(self.base + "/share/chain"), self.base + "/video/123")
+
+    def test_error_response_is_not_cached(self):
+        url = self.base + "/share/missing"
+        self.assertEqual(url_resolver.resolve_share_url(url), url)
+        self.assertNotIn(url, self.cached_urls())
+
+        hits = len(RedirectHandler.hits)
+        url_resolver.resolve_share_url(url)
+        self.assertGreater(len(RedirectHandler.hits), hits, "a failed resolution should be retried")
+
+    def test_login_and_checkpoint_pages_are_not_cached(self):
+        for path in ("/share/login", "/share/checkpoint"):
+            url = self.base + path
+            self.assertEqual(url_resolver.resolve_share_url(url), url)
+            self.assertNotIn(url, self.cached_urls())
+
+    def test_non_share_urls_are_not_requested(self):
+        url = "https://www.youtube.com/watch?v=abc"
+        self.assertEqual(url_resolver.resolve_share_url(url), url)
+        self.assertEqual(RedirectHandler.hits, [])
+
+    def test_resolve_many_resolves_each_link_once(self):
+        url = self.base + "/share/ok"
+        resolved = url_resolver.resolve_share_urls([url, url, self.base + "/share/missing"], workers=2)
+        self.assertEqual(resolved[url], self.base + "/video/123")
+        self.assertEqual(resolved[self.base + "/share/missing"], self.base + "/share/missing")
+        self.assertEqual(RedirectHandler.hits.count("/share/ok"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()